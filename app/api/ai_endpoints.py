@@ -3,23 +3,90 @@ AI服务API端点
 提供通用的AI调用接口，所有功能通过大模型实现
 """
 
+import os
+import sys
+import time
 import asyncio
 import base64
-from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Depends
-from fastapi.responses import JSONResponse
+import itertools
+from array import array
+from typing import Optional, List, Dict, Any, Union, Callable, Awaitable
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Depends, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
-from app.services.pure_ai_service import PureAIService
+from app.services.pure_ai_service import PureAIService, get_ai_service
+from app.services.semantic_cache import semantic_cache
+from app.services.chat_sessions import chat_sessions, SessionBusy
 from app.core.logger import app_logger
 from app.core.config import settings
-from app.core.auth import get_current_user
+from app.core.json_backend import FastJSONResponse
+from app.core.auth import get_current_user, require_admin
+from app.core.metrics import metrics
+from app.core.usage import usage_tracker
+from app.core.rate_limit import enforce_rate_limit
+from app.core.disconnect import watch_disconnect
+from app.core.deadline import apply_deadline
+from app.core.admission import admission_control
+from app.core.profiler import cpu_profiler, ProfilerBusy
 from app.core.models_config_manager import models_config_manager
+from app.core.conditional import rendered_cache, conditional_response
+from app.api.blob_endpoints import blob_url
+
+router = APIRouter(
+    prefix="/ai",
+    tags=["AI Services"],
+    # admission_control：过载时拒绝低优先级的新请求；apply_deadline：确定请求截止时间，剩余时间不足时提前拒绝；
+    # watch_disconnect：客户端断开时取消进行中的模型调用。
+    # 限流（enforce_rate_limit）只挂在调用模型的接口上，查询类接口的轮询不消耗用户的令牌桶
+    dependencies=[
+        Depends(get_current_user),
+        Depends(admission_control),
+        Depends(apply_deadline),
+        Depends(watch_disconnect),
+    ],
+)
+
+
+async def provide_ai_service() -> PureAIService:
+    """AI 服务依赖：首次请求时创建实例（异步依赖直接在事件循环中执行，不占用线程池）"""
+    return get_ai_service()
+
+
+async def enforce_token_quota(current_user: dict = Depends(get_current_user)):
+    """调用模型前检查用户本周期的 token 配额，超过硬配额时拒绝请求"""
+    status = await usage_tracker.check_quota(current_user["username"])
+    if status["hard_exceeded"]:
+        app_logger.warning(f"用户 {current_user['username']} 已超过 token 硬配额，拒绝请求")
+        raise HTTPException(
+            status_code=429,
+            detail=f"本周期 token 配额已用完（已用 {status['used']} / 配额 {status['hard']}）",
+        )
+
 
-router = APIRouter(prefix="/ai", tags=["AI Services"], dependencies=[Depends(get_current_user)])
+async def _with_semantic_cache(
+    http_request: Request,
+    params: Dict[str, Any],
+    prompt: str,
+    compute: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    先查语义缓存，未命中时调用 compute 并写入缓存
 
-# 初始化AI服务
-ai_service = PureAIService()
+    Args:
+        http_request: 当前请求（读取接口路径与 Cache-Control 头）
+        params: 除提示词外影响结果的参数
+        prompt: 提示词
+        compute: 调用模型的协程函数
+    """
+    probe = await semantic_cache.lookup(
+        http_request.url.path, params, prompt, http_request.headers.get("cache-control", "")
+    )
+    if probe.hit:
+        return {**probe.response, "cached": True, "similarity": round(probe.similarity, 4)}
+    result = await compute()
+    semantic_cache.store(probe, result)
+    return result
 
 
 # 请求模型定义
@@ -39,6 +106,23 @@ class ChatRequest(BaseModel):
     stream: bool = False
 
 
+class SessionCreateRequest(BaseModel):
+    model: Optional[str] = None
+    system_prompt: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: int = 2000
+    messages: Optional[List[Dict[str, str]]] = None  # 初始历史，从 /ai/chat 迁移已有对话时使用
+
+
+class SessionMessageRequest(BaseModel):
+    content: str
+    # 以下参数未指定时使用创建会话时的设置
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    stream: bool = False
+
+
 class CodeRequest(BaseModel):
     code: Optional[str] = None
     task: str = "review"
@@ -55,12 +139,19 @@ class ImageDescriptionRequest(BaseModel):
 
 
 @router.get("/models")
-async def list_models():
+async def list_models(request: Request, ai_service: PureAIService = Depends(provide_ai_service)):
     """
     获取所有可用的AI模型列表（本地配置）
+    响应带 ETag，配置未变化时复用已渲染的响应，携带匹配的 If-None-Match 时返回 304
     """
     try:
-        return ai_service.list_available_models()
+        # 先读版本再读数据：期间配置被修改时，下次请求会因版本变化重新渲染
+        version = await asyncio.to_thread(models_config_manager.get_version)
+        entry = rendered_cache.get("models", version)
+        if entry is None:
+            result = await asyncio.to_thread(ai_service.list_available_models)
+            entry = rendered_cache.put("models", result, version)
+        return conditional_response(request, entry)
     except Exception as e:
         app_logger.error(f"获取模型列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,29 +159,38 @@ async def list_models():
 
 @router.get("/platform/models")
 async def get_platform_models(
+    request: Request,
     type: Optional[str] = None,
-    sub_type: Optional[str] = None
+    sub_type: Optional[str] = None,
+    ai_service: PureAIService = Depends(provide_ai_service)
 ):
     """
     从硅基流动平台获取用户可用的模型列表
+    成功的结果缓存 PLATFORM_MODELS_CACHE_TTL 秒，响应带 ETag（内容摘要），未变化时返回 304
     
     Query参数:
         - type: 模型类型 (text/image/audio/video)
         - sub_type: 模型子类型 (chat/embedding/reranker/text-to-image等)
     """
     try:
-        result = await ai_service.get_platform_models(
-            model_type=type,
-            sub_type=sub_type
-        )
-        return result
+        cache_key = f"platform_models:{type or ''}:{sub_type or ''}"
+        entry = rendered_cache.get(cache_key, max_age=settings.platform_models_cache_ttl)
+        if entry is None:
+            result = await ai_service.get_platform_models(
+                model_type=type,
+                sub_type=sub_type
+            )
+            if not result.get("success"):
+                return FastJSONResponse(result)
+            entry = rendered_cache.put(cache_key, result)
+        return conditional_response(request, entry)
     except Exception as e:
         app_logger.error(f"获取平台模型列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/platform/user-info")
-async def get_user_info():
+async def get_user_info(ai_service: PureAIService = Depends(provide_ai_service)):
     """
     获取硅基流动平台的用户账户信息
     包括余额、状态等信息
@@ -104,18 +204,23 @@ async def get_user_info():
 
 
 @router.get("/models-config")
-async def get_models_config():
+async def get_models_config(request: Request):
     """
     获取当前启用的模型配置
+    响应带 ETag，配置未变化时复用已渲染的响应，携带匹配的 If-None-Match 时返回 304
     """
     try:
-        enabled_models = models_config_manager.get_enabled_models()
-        config_info = models_config_manager.get_config_info()
-        return {
-            "success": True,
-            "enabled_models": enabled_models,
-            "config_info": config_info
-        }
+        version = await asyncio.to_thread(models_config_manager.get_version)
+        entry = rendered_cache.get("models_config", version)
+        if entry is None:
+            enabled_models = await asyncio.to_thread(models_config_manager.get_enabled_models)
+            config_info = await asyncio.to_thread(models_config_manager.get_config_info)
+            entry = rendered_cache.put("models_config", {
+                "success": True,
+                "enabled_models": enabled_models,
+                "config_info": config_info
+            }, version)
+        return conditional_response(request, entry)
     except Exception as e:
         app_logger.error(f"获取模型配置失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -130,7 +235,7 @@ async def save_models_config(models: List[Dict[str, Any]] = Body(...)):
         models: 模型列表，每个模型包含平台返回的完整信息
     """
     try:
-        success = models_config_manager.save_enabled_models(models)
+        success = await asyncio.to_thread(models_config_manager.save_enabled_models, models)
         if success:
             return {
                 "success": True,
@@ -145,20 +250,30 @@ async def save_models_config(models: List[Dict[str, Any]] = Body(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/text/analyze")
-async def analyze_text(request: TextAnalysisRequest):
+@router.post("/text/analyze", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def analyze_text(
+    request: TextAnalysisRequest,
+    http_request: Request,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
     """
     文本分析接口
     支持多种分析任务：analyze, summarize, extract, translate, sentiment, classify, keywords
+    开启语义缓存时，与已缓存文本足够相似的请求直接返回缓存结果（响应中 cached 为 true）
     """
     app_logger.info(f"收到文本分析请求: task={request.task}, model={request.model}")
     app_logger.debug(f"文本分析内容: {request.text[:200]}...")  # 只记录前200个字符以防过长
     try:
-        result = await ai_service.analyze_text(
-            text=request.text,
-            task=request.task,
-            custom_prompt=request.custom_prompt,
-            model=request.model
+        result = await _with_semantic_cache(
+            http_request,
+            {"task": request.task, "custom_prompt": request.custom_prompt or "", "model": request.model or ""},
+            request.text,
+            lambda: ai_service.analyze_text(
+                text=request.text,
+                task=request.task,
+                custom_prompt=request.custom_prompt,
+                model=request.model
+            ),
         )
         return result
     except Exception as e:
@@ -166,8 +281,11 @@ async def analyze_text(request: TextAnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/chat")
-async def chat_completion(request: ChatRequest):
+@router.post("/chat", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def chat_completion(
+    request: ChatRequest,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
     """
     通用对话接口
     支持多轮对话和自定义系统提示词
@@ -187,8 +305,96 @@ async def chat_completion(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/code")
-async def code_assist(request: CodeRequest):
+@router.post("/sessions")
+async def create_chat_session(request: SessionCreateRequest, current_user: dict = Depends(get_current_user)):
+    """
+    创建服务端对话会话
+    之后每一轮只需通过 /ai/sessions/{session_id}/messages 上传新的用户消息，历史由服务端保存
+    """
+    session = await chat_sessions.create(
+        current_user["username"],
+        model=request.model,
+        system_prompt=request.system_prompt,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        messages=request.messages,
+    )
+    return {"success": True, **session.summary()}
+
+
+@router.get("/sessions")
+async def list_chat_sessions(current_user: dict = Depends(get_current_user)):
+    """
+    当前用户的会话（最近使用的在前）
+    """
+    return {"success": True, "sessions": await chat_sessions.list_sessions(current_user["username"])}
+
+
+@router.get("/sessions/{session_id}")
+async def get_chat_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    获取会话设置与完整对话历史
+    """
+    session = await chat_sessions.get(session_id, current_user["username"])
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return FastJSONResponse({"success": True, **session.summary(), "messages": session.messages})
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_chat_session(session_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    删除会话
+    """
+    if not await chat_sessions.delete(session_id, current_user["username"]):
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return {"success": True, "session_id": session_id}
+
+
+@router.post("/sessions/{session_id}/messages", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def send_session_message(
+    session_id: str,
+    request: SessionMessageRequest,
+    current_user: dict = Depends(get_current_user),
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
+    """
+    在会话中发送一轮消息
+    服务端把新消息追加到已保存的历史后调用模型；调用成功时用户消息与模型回复写入历史，失败时历史不变
+    """
+    try:
+        session = await chat_sessions.begin_turn(session_id, current_user["username"])
+    except SessionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+
+    user_message = {"role": "user", "content": request.content}
+    new_messages = None
+    try:
+        result = await ai_service.custom_chat(
+            messages=session.messages + [user_message],
+            model=request.model or session.model,
+            system_prompt=session.system_prompt,
+            temperature=session.temperature if request.temperature is None else request.temperature,
+            max_tokens=request.max_tokens or session.max_tokens,
+            stream=request.stream
+        )
+        if result.get("success"):
+            new_messages = [user_message, {"role": "assistant", "content": result.get("content") or ""}]
+        return {**result, "session_id": session_id, "message_count": len(session.messages) + len(new_messages or ())}
+    except Exception as e:
+        app_logger.error(f"会话对话失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await chat_sessions.end_turn(session, new_messages)
+
+
+@router.post("/code", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def code_assist(
+    request: CodeRequest,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
     """
     代码辅助接口
     支持代码审查、优化、解释、调试、生成等任务
@@ -208,12 +414,13 @@ async def code_assist(request: CodeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/ocr")
+@router.post("/ocr", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
 async def ocr_image(
     file: UploadFile = File(...),
     language: str = Form("auto"),
     detail_level: str = Form("medium"),
-    model: Optional[str] = Form(None)
+    model: Optional[str] = Form(None),
+    ai_service: PureAIService = Depends(provide_ai_service)
 ):
     """
     OCR文字识别接口
@@ -252,8 +459,11 @@ async def ocr_image(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/image/describe")
-async def generate_image_description(request: ImageDescriptionRequest):
+@router.post("/image/describe", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def generate_image_description(
+    request: ImageDescriptionRequest,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
     """
     图像描述生成接口
     根据简单描述生成详细的图像描述（可用于其他图像生成服务）
@@ -277,11 +487,16 @@ class QuickAIRequest(BaseModel):
     stream: bool = False
 
 
-@router.post("/quick")
-async def quick_ai(request: QuickAIRequest):
+@router.post("/quick", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def quick_ai(
+    request: QuickAIRequest,
+    http_request: Request,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
     """
     快速AI调用接口
     直接输入提示词获取AI回复
+    开启语义缓存时，与已缓存提示词足够相似的请求直接返回缓存结果（响应中 cached 为 true）
     """
     try:
         messages = [
@@ -292,16 +507,97 @@ async def quick_ai(request: QuickAIRequest):
         ]
         # 如果没有指定模型，使用默认的 Kimi 模型
         model = request.model if request.model else "moonshotai/Kimi-K2-Instruct-0905"
-        result = await ai_service.call_ai(messages, model=model, stream=request.stream)
+        result = await _with_semantic_cache(
+            http_request,
+            {"model": model},
+            request.prompt,
+            lambda: ai_service.call_ai(messages, model=model, stream=request.stream),
+        )
         return result
     except Exception as e:
         app_logger.error(f"快速AI调用失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/batch")
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str]]
+    model: Optional[str] = None
+    # float：JSON 浮点数组；base64：小端 float32 的 base64（与 OpenAI 兼容）；binary：整个响应为小端 float32 二进制
+    encoding_format: str = "float"
+
+
+def _pack_float32(embeddings: List[List[float]]) -> bytes:
+    """把向量列表按行拼接为小端 float32 字节串"""
+    packed = array("f", itertools.chain.from_iterable(embeddings))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+@router.post("/embeddings", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
+async def create_embeddings(
+    request: EmbeddingRequest,
+    http_request: Request,
+    ai_service: PureAIService = Depends(provide_ai_service)
+):
+    """
+    文本向量化接口
+    并发的单条文本请求会在服务端合并成批量上游调用
+
+    - **input**: 单条文本或文本列表
+    - **encoding_format**: float（默认）/ base64 / binary；请求头 Accept 为 application/octet-stream 时同 binary。
+      binary 响应体为 N×D 个小端 float32，N、D 通过 X-Embedding-Count、X-Embedding-Dimensions 响应头返回
+    """
+    encoding = request.encoding_format
+    if "application/octet-stream" in http_request.headers.get("accept", ""):
+        encoding = "binary"
+    if encoding not in ("float", "base64", "binary"):
+        raise HTTPException(status_code=400, detail=f"不支持的 encoding_format: {encoding}")
+
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    try:
+        result = await ai_service.create_embeddings(texts, model=request.model)
+    except Exception as e:
+        app_logger.error(f"向量化失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result["success"]:
+        return result
+
+    embeddings = result["embeddings"]
+    if encoding == "binary":
+        dimensions = len(embeddings[0])
+        if any(len(vector) != dimensions for vector in embeddings):
+            raise HTTPException(status_code=502, detail="上游返回的向量维度不一致，无法按二进制格式返回")
+        return Response(
+            content=_pack_float32(embeddings),
+            media_type="application/octet-stream",
+            headers={
+                "X-Embedding-Count": str(len(embeddings)),
+                "X-Embedding-Dimensions": str(dimensions),
+                "X-Embedding-Model": result["model"],
+                "X-Embedding-Tokens": str(result["usage"]["total_tokens"]),
+            },
+        )
+
+    if encoding == "base64":
+        data = [
+            {"index": index, "embedding": base64.b64encode(_pack_float32([vector])).decode("ascii")}
+            for index, vector in enumerate(embeddings)
+        ]
+    else:
+        data = [{"index": index, "embedding": vector} for index, vector in enumerate(embeddings)]
+    return FastJSONResponse({
+        "success": True,
+        "data": data,
+        "model": result["model"],
+        "usage": result["usage"],
+    })
+
+
+@router.post("/batch", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
 async def batch_process(
-    tasks: List[Dict[str, Any]] = Body(...)
+    tasks: List[Dict[str, Any]] = Body(...),
+    ai_service: PureAIService = Depends(provide_ai_service)
 ):
     """
     批量处理接口
@@ -339,7 +635,7 @@ async def batch_process(
             return {"task_id": task.get("id"), "error": str(e)}
 
     results = await asyncio.gather(*[_process_single_task(t) for t in tasks])
-    return {"results": results}
+    return FastJSONResponse({"results": results})
 
 
 @router.get("/health")
@@ -354,15 +650,84 @@ async def health_check():
     }
 
 
-@router.post("/image/edit")
+@router.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics(format: str = "json"):
+    """
+    本 worker 的运行指标（仅管理员）
+    包括调度器各优先级的排队耗时、排队长度与运行数
+
+    - **format**: json（默认）或 prometheus
+    """
+    if format == "prometheus":
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+    return FastJSONResponse({"success": True, **metrics.snapshot()})
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)])
+async def profile_cpu(
+    seconds: float = 10,
+    mode: str = "sampling",
+    format: Optional[str] = None,
+    interval_ms: float = 5,
+):
+    """
+    对本 worker 做指定秒数的 CPU 分析（仅管理员），结束后返回结果文件
+
+    - **seconds**: 持续时间，不超过 PROFILE_MAX_SECONDS
+    - **mode**: sampling（采样所有线程调用栈，默认）或 deterministic（cProfile，覆盖事件循环上的所有协程）
+    - **format**: sampling 可选 collapsed（flamegraph 折叠栈，默认）/ text；deterministic 可选 pstats（默认）/ text
+    - **interval_ms**: 采样间隔（毫秒），1-100
+    """
+    if not 0 < seconds <= settings.profile_max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds 必须在 0-{settings.profile_max_seconds} 之间")
+    if not 1 <= interval_ms <= 100:
+        raise HTTPException(status_code=400, detail="interval_ms 必须在 1-100 之间")
+    try:
+        content, fmt = await cpu_profiler.profile(mode, seconds, format, interval_ms / 1000)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    pid = os.getpid()
+    filename = f"profile-{pid}-{int(time.time())}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Profile-PID": str(pid)}
+    media_type = "application/octet-stream" if fmt == "pstats" else "text/plain"
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@router.get("/semantic-cache", dependencies=[Depends(require_admin)])
+async def get_semantic_cache_stats():
+    """
+    本 worker 的语义缓存状态（仅管理员）
+    """
+    return {"success": True, **semantic_cache.stats()}
+
+
+@router.delete("/semantic-cache")
+async def clear_semantic_cache(admin: dict = Depends(require_admin)):
+    """
+    清空本 worker 的语义缓存（仅管理员）
+    """
+    cleared = semantic_cache.clear()
+    app_logger.info(f"管理员 {admin['username']} 清空语义缓存: {cleared} 条")
+    return {"success": True, "cleared": cleared}
+
+
+@router.post("/image/edit", dependencies=[Depends(enforce_rate_limit), Depends(enforce_token_quota)])
 async def edit_image(
     file: UploadFile = File(...),
     instruction: str = Form(...),
-    model: Optional[str] = Form(None)
+    model: Optional[str] = Form(None),
+    inline_base64: bool = Form(False),
+    ai_service: PureAIService = Depends(provide_ai_service)
 ):
     """
     图片编辑接口
     使用指定的图像编辑模型根据指令编辑图片
+    
+    返回的 local_url 指向本地缓存的图片（后台下载中时访问会等待完成）；
+    inline_base64=true 时额外等待下载并在 edited_image 中返回 base64 数据
     """
     app_logger.info(f"收到图片编辑请求: instruction={instruction[:50]}..., model={model}")
     try:
@@ -384,9 +749,12 @@ async def edit_image(
         result = await ai_service.edit_image(
             image_base64=image_base64,
             instruction=instruction,
-            model=model
+            model=model,
+            inline_base64=inline_base64
         )
-        return result
+        if result.get("success"):
+            result["local_url"] = blob_url(result["image_id"])
+        return FastJSONResponse(result)
     except HTTPException:
         raise
     except Exception as e:
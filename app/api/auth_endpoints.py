@@ -3,7 +3,8 @@
 Author: ZHANGCHAO
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from pydantic import BaseModel
 from typing import Optional
 from datetime import timedelta
@@ -14,6 +15,8 @@ from app.core.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from app.core.logger import app_logger
+from app.core import json_backend
+from app.core.conditional import RenderedEntry, conditional_response
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
@@ -57,8 +60,8 @@ async def login(request: LoginRequest):
     """
     from app.core.user_manager import user_manager
     
-    # 验证用户名和密码
-    if not authenticate_user(request.username, request.password):
+    # 验证用户名和密码（bcrypt 校验与存储查询是阻塞调用，放到线程池执行）
+    if not await asyncio.to_thread(authenticate_user, request.username, request.password):
         app_logger.warning(f"登录失败: username={request.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,7 +70,7 @@ async def login(request: LoginRequest):
         )
     
     # 获取用户信息
-    user = user_manager.get_user(request.username)
+    user = await asyncio.to_thread(user_manager.get_user, request.username)
     nickname = user.get("nickname", request.username) if user else request.username
     
     # 创建 JWT Token
@@ -88,14 +91,18 @@ async def login(request: LoginRequest):
 
 
 @router.get("/me", response_model=UserInfo, summary="获取当前用户信息")
-async def get_user_info(current_user: dict = Depends(get_current_user)):
+async def get_user_info(request: Request, current_user: dict = Depends(get_current_user)):
     """
     获取当前登录用户信息
     
     需要在请求头中携带有效的 JWT Token:
     Authorization: Bearer <token>
+    
+    响应带 ETag，携带匹配的 If-None-Match 时返回 304
     """
-    return UserInfo(username=current_user["username"])
+    # 响应体很小，每次直接序列化并计算 ETag，不放入渲染缓存
+    entry = RenderedEntry(None, json_backend.dumps(UserInfo(username=current_user["username"]).model_dump()))
+    return conditional_response(request, entry)
 
 
 @router.post("/logout", summary="用户登出")
@@ -145,7 +152,7 @@ async def register(request: RegisterRequest):
         )
     
     # 检查用户名是否已存在
-    if user_manager.user_exists(request.username):
+    if await asyncio.to_thread(user_manager.user_exists, request.username):
         app_logger.warning(f"注册失败，用户名已存在: username={request.username}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -153,7 +160,7 @@ async def register(request: RegisterRequest):
         )
     
     # 创建新用户（传入昵称）
-    success = user_manager.create_user(request.username, request.password, request.nickname)
+    success = await asyncio.to_thread(user_manager.create_user, request.username, request.password, request.nickname)
     
     if not success:
         raise HTTPException(
@@ -200,7 +207,7 @@ async def update_profile(request: UpdateProfileRequest, current_user: dict = Dep
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="昵称长度不能超过20个字符"
             )
-        success = user_manager.update_nickname(username, request.nickname)
+        success = await asyncio.to_thread(user_manager.update_nickname, username, request.nickname)
         if success:
             updated = True
             app_logger.info(f"用户更新昵称: username={username}, nickname={request.nickname}")
@@ -224,7 +231,7 @@ async def update_profile(request: UpdateProfileRequest, current_user: dict = Dep
                 detail="新密码长度至少为6个字符"
             )
         
-        success = user_manager.update_password(username, request.old_password, request.new_password)
+        success = await asyncio.to_thread(user_manager.update_password, username, request.old_password, request.new_password)
         if success:
             updated = True
             app_logger.info(f"用户更新密码: username={username}")
@@ -241,7 +248,7 @@ async def update_profile(request: UpdateProfileRequest, current_user: dict = Dep
         )
     
     # 返回最新的用户信息
-    user = user_manager.get_user(username)
+    user = await asyncio.to_thread(user_manager.get_user, username)
     return {
         "message": "更新成功",
         "nickname": user.get("nickname", username) if user else username
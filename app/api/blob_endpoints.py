@@ -0,0 +1,126 @@
+"""
+本地 Blob 访问接口
+提供编辑后图片等内容的下载，支持 Range 请求和浏览器缓存（缓存时长不超过引用的剩余保留时间）
+
+引用ID为随机生成的 128 位标识，作为访问凭证使用，因此无需 JWT 认证，
+便于前端直接在 <img> 标签中引用。
+"""
+
+import asyncio
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, RedirectResponse
+
+from app.core.config import settings
+from app.core.blob_store import blob_store
+
+router = APIRouter(prefix="/blobs", tags=["Blobs"])
+
+# 引用不会被清理时（BLOB_TTL 与 BLOB_MAX_MB 均为 0）内容永不改变，可以长期缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def cache_control(ref: str) -> str:
+    """
+    浏览器缓存策略：引用到期后会被清理，max-age 取引用的剩余保留时间，不使用 immutable
+
+    超过 BLOB_MAX_MB 时引用可能提前被删除，此时缓存中的副本仍可使用，重新请求返回 404。
+    """
+    if settings.blob_ttl <= 0:
+        return IMMUTABLE_CACHE_CONTROL if settings.blob_max_mb <= 0 else "public, max-age=31536000"
+    return f"public, max-age={blob_store.remaining_ttl(ref, settings.blob_ttl)}"
+
+
+def blob_url(ref: str) -> str:
+    """生成引用对应的本地访问路径"""
+    return f"/api/v1/blobs/{ref}"
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 请求头
+
+    Args:
+        range_header: 形如 bytes=0-499、bytes=500-、bytes=-500 的请求头
+        size: 内容总长度
+
+    Returns:
+        Optional[Tuple[int, int]]: 闭区间 (start, end)，无法满足时返回None
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if not start_str:
+            # 后缀范围：最后 N 个字节
+            length = int(end_str)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+async def _read(digest: str, start: int = 0, length: int = -1) -> bytes:
+    """读取对象内容；对象恰好被清理任务删除时返回 404"""
+    try:
+        return await asyncio.to_thread(blob_store.read, digest, start, length)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="资源不存在")
+
+
+@router.get("/{ref}", name="get_blob")
+async def get_blob(ref: str, request: Request):
+    """
+    获取 Blob 内容
+
+    - 下载尚未完成时等待后台任务（最多 BLOB_WAIT_TIMEOUT 秒）
+    - 下载失败时重定向到原始地址
+    - 支持 If-None-Match 和单段 Range 请求
+    """
+    if not blob_store.is_valid_ref(ref):
+        raise HTTPException(status_code=404, detail="资源不存在")
+
+    meta = await blob_store.resolve(ref)
+    if meta is None:
+        source_url = blob_store.failed_source(ref)
+        if source_url:
+            return RedirectResponse(source_url, status_code=307)
+        raise HTTPException(status_code=404, detail="资源不存在或仍在下载中")
+
+    etag = f'"{meta["digest"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control(ref),
+        "Accept-Ranges": "bytes",
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    size = meta["size"]
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"},
+            )
+        start, end = byte_range
+        data = await _read(meta["digest"], start, end - start + 1)
+        return Response(
+            content=data,
+            status_code=206,
+            media_type=meta["content_type"],
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+        )
+
+    data = await _read(meta["digest"])
+    return Response(content=data, media_type=meta["content_type"], headers=headers)
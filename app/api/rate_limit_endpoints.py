@@ -0,0 +1,60 @@
+"""
+限流档位接口
+用户可查看自己的限流档位；管理员可为用户指定档位。
+"""
+
+import asyncio
+from dataclasses import asdict
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel
+
+from app.core.auth import get_current_user, require_admin
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.rate_limit import rate_limiter
+
+router = APIRouter(prefix="/rate-limit", tags=["Rate Limit"], dependencies=[Depends(get_current_user)])
+
+
+class TierRequest(BaseModel):
+    """用户档位设置，tier 为 None 表示恢复默认档位"""
+    tier: Optional[str] = None
+
+
+@router.get("")
+async def get_rate_limit(
+    username: Optional[str] = Query(None, description="查询的用户，默认当前用户（仅管理员可查询他人）"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    查询用户的限流档位与全部可用档位
+    """
+    target = username or current_user["username"]
+    if target != current_user["username"] and current_user["username"] != settings.default_admin_username:
+        raise HTTPException(status_code=403, detail="只能查询自己的限流档位")
+    tier = await rate_limiter.tier_for(target)
+    return {
+        "success": True,
+        "enabled": settings.rate_limit_enabled,
+        "backend": "shared" if rate_limiter.shared else "memory",
+        "username": target,
+        "tier": asdict(tier),
+        "tiers": [asdict(item) for item in rate_limiter.tiers.values()],
+    }
+
+
+@router.put("/users/{username}")
+async def set_user_tier(username: str, request: TierRequest, admin: dict = Depends(require_admin)):
+    """
+    为用户指定限流档位（仅管理员）
+
+    - **tier**: 档位名称（RATE_LIMIT_TIERS 中定义），为空时恢复默认档位
+    """
+    try:
+        await asyncio.to_thread(rate_limiter.set_user_tier, username, request.tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    app_logger.info(f"管理员 {admin['username']} 设置用户 {username} 限流档位: {request.tier or '默认'}")
+    tier = await rate_limiter.tier_for(username)
+    return {"success": True, "username": username, "tier": asdict(tier)}
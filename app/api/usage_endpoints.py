@@ -0,0 +1,104 @@
+"""
+token 用量查询接口
+普通用户只能查询自己的用量；管理员可以查询任意用户或全部用户，并设置用户配额。
+"""
+
+import asyncio
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel
+
+from app.core.auth import get_current_user, require_admin
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.usage import usage_tracker, default_range, GROUP_FIELDS
+
+router = APIRouter(prefix="/usage", tags=["Usage"], dependencies=[Depends(get_current_user)])
+
+
+class QuotaRequest(BaseModel):
+    """用户配额设置，字段为 None 表示使用全局配置"""
+    soft: Optional[int] = None
+    hard: Optional[int] = None
+
+
+def _resolve_username(current_user: dict, username: Optional[str], all_users: bool = False) -> Optional[str]:
+    """确定查询的用户：非管理员只能查询自己"""
+    is_admin = current_user["username"] == settings.default_admin_username
+    if (all_users or (username and username != current_user["username"])) and not is_admin:
+        raise HTTPException(status_code=403, detail="只能查询自己的用量")
+    if all_users:
+        return None
+    return username or current_user["username"]
+
+
+def _parse_day(value: str, name: str) -> str:
+    """校验 YYYY-MM-DD 日期参数"""
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 日期格式应为 YYYY-MM-DD")
+
+
+@router.get("")
+async def get_usage(
+    start: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD（含），默认 30 天前"),
+    end: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含），默认今天"),
+    username: Optional[str] = Query(None, description="查询的用户，默认当前用户（仅管理员可查询他人）"),
+    all_users: bool = Query(False, description="统计全部用户（仅管理员）"),
+    group_by: str = Query("day", description="分组维度，逗号分隔：day, username, model, endpoint"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    查询日期范围内的 token 用量，按指定维度分组
+    """
+    default_start, default_end = default_range()
+    start_day = _parse_day(start, "start") if start else default_start
+    end_day = _parse_day(end, "end") if end else default_end
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+
+    fields = [field.strip() for field in group_by.split(",") if field.strip()]
+    invalid = [field for field in fields if field not in GROUP_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"不支持的分组维度: {', '.join(invalid)}")
+
+    target = _resolve_username(current_user, username, all_users)
+    try:
+        result = await asyncio.to_thread(usage_tracker.query, start_day, end_day, target, fields)
+    except Exception as e:
+        app_logger.error(f"查询 token 用量失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "username": target, **result}
+
+
+@router.get("/quota")
+async def get_quota(
+    username: Optional[str] = Query(None, description="查询的用户，默认当前用户（仅管理员可查询他人）"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    查询用户本周期的配额使用情况
+    """
+    target = _resolve_username(current_user, username)
+    status = await asyncio.to_thread(usage_tracker.quota_status, target)
+    return {"success": True, "username": target, **status}
+
+
+@router.put("/quotas/{username}")
+async def set_quota(username: str, request: QuotaRequest, admin: dict = Depends(require_admin)):
+    """
+    设置用户的软/硬配额（仅管理员）
+
+    - **soft**: 软配额，超过后记录告警
+    - **hard**: 硬配额，超过后拒绝调用模型
+    两项都为空时恢复全局配置
+    """
+    for value in (request.soft, request.hard):
+        if value is not None and value < 0:
+            raise HTTPException(status_code=400, detail="配额不能为负数")
+    await asyncio.to_thread(usage_tracker.set_quota, username, request.soft, request.hard)
+    app_logger.info(f"管理员 {admin['username']} 设置用户 {username} 配额: soft={request.soft}, hard={request.hard}")
+    status = await asyncio.to_thread(usage_tracker.quota_status, username)
+    return {"success": True, "username": username, **status}
@@ -0,0 +1,333 @@
+"""
+WebSocket 对话通道
+对话频繁的前端每一轮都要新建 HTTP 请求、解码 JWT、经过日志中间件读取请求体并解析 JSON，且只能拿到缓冲后的完整回复。
+/ai/ws/chat 在一条长连接上完成多轮对话：
+
+- 连接建立时认证一次（Authorization 头，或连接后第一条 {"type": "auth", "token": ...} 消息），之后每轮不再解码 JWT
+- 每一轮以增量消息（delta）流式返回模型输出
+- 客户端可随时发送 {"type": "cancel", "id": ...} 取消某一轮，排队中或进行中的上游请求立即取消
+- 以 id 区分多路并发生成，一条连接上最多同时进行 WS_MAX_STREAMS 轮
+
+每一轮与 HTTP 接口一样经过 token 配额、限流、截止时间、调度与历史压缩；传入 session_id 时使用服务端会话，只需发送新消息。
+
+客户端 -> 服务端：
+    {"type": "chat", "id": "1", "messages": [...], "model": "...", "system_prompt": "...", "temperature": 0.7, "max_tokens": 2000, "timeout": 60}
+    {"type": "chat", "id": "2", "session_id": "...", "content": "新消息"}
+    {"type": "cancel", "id": "1"}
+    {"type": "ping"}
+服务端 -> 客户端：
+    {"type": "ready", "username": "...", "max_streams": 4}
+    {"type": "delta", "id": "1", "content": "片段"}
+    {"type": "done", "id": "1", "model": "...", "usage": {...}, "finish_reason": "stop", "compaction": {...}}
+    {"type": "cancelled", "id": "1"}
+    {"type": "error", "id": "1", "code": 429, "error": "..."}
+    {"type": "pong"}
+"""
+
+import math
+import time
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.core import json_backend
+from app.core import deadline
+from app.core.auth import verify_token
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.rate_limit import rate_limiter
+from app.core.admission import admission_controller
+from app.core.scheduler import classify
+from app.core.request_context import bind_request, current_deadline, current_disconnect, current_reservation
+from app.core.usage import usage_tracker
+from app.services.chat_sessions import chat_sessions, SessionBusy
+from app.services.pure_ai_service import get_ai_service
+
+router = APIRouter(prefix="/ai", tags=["AI Services"])
+
+# 应用层关闭码（4000-4999）：认证失败或令牌过期
+CLOSE_UNAUTHORIZED = 4401
+
+metrics.describe("ws_connections", "当前 WebSocket 对话连接数")
+metrics.describe("ws_messages_total", "收到的 WebSocket 对话消息数（type）")
+metrics.describe("ws_turns_total", "WebSocket 对话轮次（result: done / cancelled / error）")
+
+
+# 当前进程内的连接
+_connections: set = set()
+
+
+class _Rejected(Exception):
+    """本轮在调用模型前被拒绝"""
+
+    def __init__(self, code: int, message: str, **extra: Any):
+        super().__init__(message)
+        self.code = code
+        self.extra = extra
+
+
+async def _authenticate(websocket: WebSocket) -> Tuple[Optional[str], float]:
+    """
+    认证连接：优先使用 Authorization 头，否则等待第一条 auth 消息
+
+    Returns:
+        Tuple[Optional[str], float]: (用户名，认证失败时为 None, 令牌过期时间戳)
+    """
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        token = header[7:].strip()
+    else:
+        try:
+            frame = await asyncio.wait_for(websocket.receive(), timeout=settings.ws_auth_timeout)
+            message = json_backend.loads(frame.get("text") or "null")
+        except (asyncio.TimeoutError, json_backend.JSONDecodeError):
+            return None, 0.0
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            return None, 0.0
+        token = str(message.get("token") or "")
+    payload = verify_token(token) if token else None
+    if not payload or not payload.get("sub"):
+        return None, 0.0
+    return payload["sub"], float(payload.get("exp") or math.inf)
+
+
+class _ChatConnection:
+    """一条已认证的 WebSocket 对话连接"""
+
+    def __init__(self, websocket: WebSocket, username: str, expires_at: float):
+        self.websocket = websocket
+        self.username = username
+        self.expires_at = expires_at
+        self.endpoint = websocket.url.path
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+        # 进行中的轮次：id -> (任务, 取消事件)
+        self._streams: Dict[str, Tuple[asyncio.Task, asyncio.Event]] = {}
+
+    async def send(self, message: Dict[str, Any]):
+        """发送一条消息（多路生成共用连接，逐条串行发送）；连接已关闭时忽略"""
+        if self.closed:
+            return
+        data = json_backend.dumps(message).decode("utf-8")
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(data)
+            except Exception:
+                self.closed = True
+
+    async def error(self, stream_id: Optional[str], code: int, message: str, **extra: Any):
+        await self.send({"type": "error", "id": stream_id, "code": code, "error": message, **extra})
+
+    async def handle(self, raw: str):
+        """处理客户端的一条消息"""
+        try:
+            message = json_backend.loads(raw)
+        except json_backend.JSONDecodeError:
+            await self.error(None, 400, "消息必须是 JSON")
+            return
+        if not isinstance(message, dict):
+            await self.error(None, 400, "消息必须是 JSON 对象")
+            return
+
+        kind = message.get("type")
+        stream_id = message.get("id")
+        metrics.inc("ws_messages_total", type=str(kind))
+        if kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "cancel":
+            stream = self._streams.get(str(stream_id))
+            if stream is not None:
+                stream[1].set()
+        elif kind == "chat":
+            await self._start(message, raw)
+        else:
+            await self.error(stream_id, 400, f"未知的消息类型: {kind}")
+
+    async def _start(self, message: Dict[str, Any], raw: str):
+        stream_id = message.get("id")
+        if not isinstance(stream_id, (str, int)) or isinstance(stream_id, bool) or stream_id == "":
+            await self.error(None, 400, "chat 消息需要 id")
+            return
+        stream_id = str(stream_id)
+        if time.time() >= self.expires_at:
+            await self.error(stream_id, 401, "认证已过期，请重新连接")
+            self.closed = True
+            await self.websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+        if stream_id in self._streams:
+            await self.error(stream_id, 409, "该 id 的生成仍在进行中")
+            return
+        if len(self._streams) >= settings.ws_max_streams:
+            await self.error(stream_id, 429, f"同一连接最多同时进行 {settings.ws_max_streams} 路生成")
+            return
+
+        cancelled = asyncio.Event()
+        task = asyncio.create_task(self._run(stream_id, message, len(raw), cancelled))
+        self._streams[stream_id] = (task, cancelled)
+        task.add_done_callback(lambda _: self._streams.pop(stream_id, None))
+
+    async def _admit(self, message: Dict[str, Any], size: int):
+        """
+        调用模型前的检查：准入控制、token 配额、限流、截止时间（与 HTTP 接口的依赖一致）
+
+        Raises:
+            _Rejected: 检查未通过
+        """
+        retry_after = admission_controller.check(classify(self.endpoint))
+        if retry_after is not None:
+            raise _Rejected(503, f"服务繁忙，请在 {retry_after} 秒后重试", retry_after=retry_after)
+
+        status = await usage_tracker.check_quota(self.username)
+        if status["hard_exceeded"]:
+            raise _Rejected(429, f"本周期 token 配额已用完（已用 {status['used']} / 配额 {status['hard']}）")
+
+        if settings.rate_limit_enabled:
+            estimated = size // max(1, settings.rate_limit_bytes_per_token)
+            wait = await rate_limiter.acquire(self.username, estimated)
+            if wait > 0:
+                retry_after = max(1, math.ceil(wait))
+                raise _Rejected(429, f"请求过于频繁，请在 {retry_after} 秒后重试", retry_after=retry_after)
+            if estimated:
+                current_reservation.set({"tokens": estimated})
+
+        budget = deadline.budget_for(self.endpoint)
+        client_budget = message.get("timeout")
+        if client_budget is not None:
+            if not isinstance(client_budget, (int, float)) or client_budget <= 0:
+                raise _Rejected(400, "timeout 必须是大于 0 的秒数")
+            budget = min(budget, float(client_budget))
+        current_deadline.set(time.monotonic() + budget)
+        try:
+            deadline.ensure_budget("admission", self.endpoint)
+        except deadline.DeadlineExceeded as e:
+            raise _Rejected(504, str(e))
+
+    async def _run(self, stream_id: str, message: Dict[str, Any], size: int, cancelled: asyncio.Event):
+        """执行一轮对话（独立任务，上下文变量只作用于本轮）"""
+        bind_request(self.username, self.endpoint)
+        current_disconnect.set(cancelled)
+        session = None
+        new_messages = None
+        try:
+            await self._admit(message, size)
+
+            session_id = message.get("session_id")
+            if session_id:
+                content = message.get("content")
+                if not isinstance(content, str):
+                    raise _Rejected(400, "使用会话时需要 content")
+                try:
+                    session = await chat_sessions.begin_turn(str(session_id), self.username)
+                except SessionBusy as e:
+                    raise _Rejected(409, str(e))
+                if session is None:
+                    raise _Rejected(404, "会话不存在或已过期")
+                user_message = {"role": "user", "content": content}
+                messages = session.messages + [user_message]
+                model = message.get("model") or session.model
+                system_prompt = session.system_prompt
+                temperature = message.get("temperature", session.temperature)
+                max_tokens = message.get("max_tokens") or session.max_tokens
+            else:
+                messages = message.get("messages")
+                if not isinstance(messages, list) or not messages:
+                    raise _Rejected(400, "messages 必须是非空列表")
+                model = message.get("model")
+                system_prompt = message.get("system_prompt")
+                temperature = message.get("temperature", 0.7)
+                max_tokens = message.get("max_tokens", 2000)
+
+            async def on_delta(text: str):
+                await self.send({"type": "delta", "id": stream_id, "content": text})
+
+            result = await get_ai_service().custom_chat(
+                messages=messages,
+                model=model,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                on_delta=on_delta,
+            )
+            if session is not None and result.get("success"):
+                new_messages = [user_message, {"role": "assistant", "content": result.get("content") or ""}]
+        except _Rejected as e:
+            metrics.inc("ws_turns_total", result="error")
+            await self.error(stream_id, e.code, str(e), **e.extra)
+            return
+        except Exception as e:
+            app_logger.exception("WebSocket 对话异常")
+            metrics.inc("ws_turns_total", result="error")
+            await self.error(stream_id, 500, str(e))
+            return
+        finally:
+            if session is not None:
+                await chat_sessions.end_turn(session, new_messages)
+
+        if result.get("cancelled"):
+            metrics.inc("ws_turns_total", result="cancelled")
+            await self.send({"type": "cancelled", "id": stream_id})
+        elif result.get("success"):
+            metrics.inc("ws_turns_total", result="done")
+            done = {
+                "type": "done",
+                "id": stream_id,
+                "model": result.get("model"),
+                "usage": result.get("usage"),
+                "finish_reason": result.get("finish_reason"),
+            }
+            if "compaction" in result:
+                done["compaction"] = result["compaction"]
+            if session is not None:
+                done["session_id"] = session.session_id
+                done["message_count"] = len(session.messages)
+            await self.send(done)
+        else:
+            metrics.inc("ws_turns_total", result="error")
+            code = 504 if result.get("deadline_exceeded") else 502
+            await self.error(stream_id, code, result.get("error") or "模型调用失败")
+
+    async def close(self):
+        """连接关闭：取消全部进行中的生成并等待清理完成"""
+        self.closed = True
+        streams = list(self._streams.values())
+        for _, cancelled in streams:
+            cancelled.set()
+        if streams:
+            await asyncio.gather(*(task for task, _ in streams), return_exceptions=True)
+
+
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    WebSocket 对话通道：一次认证、多轮流式对话、按 id 多路并发与取消（协议见模块说明）
+    """
+    await websocket.accept()
+    username, expires_at = await _authenticate(websocket)
+    if username is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return
+
+    connection = _ChatConnection(websocket, username, expires_at)
+    _connections.add(connection)
+    metrics.set("ws_connections", len(_connections))
+    app_logger.info(f"WebSocket 对话连接建立: 用户 {username}")
+    try:
+        await connection.send({"type": "ready", "username": username, "max_streams": settings.ws_max_streams})
+        while not connection.closed:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            if frame.get("text") is None:
+                await connection.error(None, 400, "只支持文本消息")
+                continue
+            await connection.handle(frame["text"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await connection.close()
+        _connections.discard(connection)
+        metrics.set("ws_connections", len(_connections))
+        app_logger.info(f"WebSocket 对话连接关闭: 用户 {username}")
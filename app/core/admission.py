@@ -0,0 +1,174 @@
+"""
+自适应准入控制与降载
+上游变慢时，调度队列会持续变长，所有用户都要等待数分钟。准入控制参考 CoDel 的做法，
+按固定间隔（ADMISSION_INTERVAL）检查每个优先级在该间隔内的最小排队时间：
+- 最小排队时间不超过目标（ADMISSION_TARGET_DELAY）说明队列在间隔内曾被清空，只是短暂突发，不做处理
+- 超过目标说明存在持续排队（standing queue），进入过载：新的 bulk 请求直接返回 503
+- 超过目标的 SEVERE_FACTOR 倍进入严重过载：新的 standard 请求同样返回 503
+- 进行中的调用（运行 + 排队）达到 ADMISSION_MAX_INFLIGHT 时，不等间隔结束立即拒绝新的 bulk 请求
+interactive 请求（对话、快速调用）不会被准入控制拒绝，只受调度器排队上限约束。
+
+过载状态由 interactive / standard 队列决定，同时用于就绪检查（/api/v1/ai/ready），
+负载均衡器据此把流量转移到其他实例；bulk 队列的持续排队只影响 bulk 请求自身的准入。
+"""
+
+import math
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.scheduler import BULK, INTERACTIVE, PRIORITIES, STANDARD, PriorityScheduler, classify, scheduler
+
+# 准入级别
+NORMAL = 0
+OVERLOADED = 1
+SEVERE = 2
+
+LEVEL_NAMES = {NORMAL: "normal", OVERLOADED: "overloaded", SEVERE: "severe"}
+
+# 排队时间超过目标的多少倍视为严重过载
+SEVERE_FACTOR = 4
+
+# Retry-After 的上限（秒）
+MAX_RETRY_AFTER = 60
+
+metrics.describe("admission_level", "准入级别（0 正常 / 1 过载 / 2 严重过载）")
+metrics.describe("admission_queue_delay_seconds", "最近一个检查间隔内各优先级的最小排队时间")
+metrics.describe("admission_rejected_total", "被准入控制拒绝（503）的请求数")
+
+
+class AdmissionController:
+    """基于排队时间（CoDel）与进行中调用数的准入控制器"""
+
+    def __init__(self, scheduler: PriorityScheduler, target_delay: float, interval: float, max_inflight: int = 0):
+        """
+        Args:
+            scheduler: 上游调用调度器
+            target_delay: 目标排队时间（秒）
+            interval: 检查间隔（秒）
+            max_inflight: 进行中调用数上限，超过后拒绝 bulk；0 表示并发槽位数的两倍
+        """
+        self.scheduler = scheduler
+        self.target_delay = target_delay
+        self.interval = interval
+        self.max_inflight = max_inflight or scheduler.max_concurrency * 2
+        self.level = NORMAL
+        self.delays: Dict[str, float] = dict.fromkeys(PRIORITIES, 0.0)
+        self._next_check = time.monotonic() + interval
+
+    @property
+    def enabled(self) -> bool:
+        # 调度器不限并发时不会排队，也就无从判断
+        return settings.admission_enabled and self.scheduler.max_concurrency > 0
+
+    @property
+    def inflight(self) -> int:
+        return self.scheduler.total_running + self.scheduler.total_queued
+
+    def _evaluate(self):
+        """检查间隔结束时更新各优先级的排队时间与准入级别"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+        for priority in PRIORITIES:
+            sampled = self.scheduler.take_min_wait(priority)
+            # 间隔内没有调用获得槽位（如上游完全卡住）时，以队首已等待的时间作为下限
+            oldest = self.scheduler.oldest_wait(priority) if self.scheduler.queued(priority) else 0.0
+            self.delays[priority] = oldest if sampled is None else sampled
+            metrics.set("admission_queue_delay_seconds", self.delays[priority], priority=priority)
+
+        delay = max(self.delays[INTERACTIVE], self.delays[STANDARD])
+        if delay > self.target_delay * SEVERE_FACTOR:
+            level = SEVERE
+        elif delay > self.target_delay:
+            level = OVERLOADED
+        else:
+            level = NORMAL
+        if level != self.level:
+            log = app_logger.warning if level > self.level else app_logger.info
+            log(f"准入级别变化: {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]}，最小排队时间 {delay:.2f}s")
+            self.level = level
+            metrics.set("admission_level", level)
+
+    def check(self, priority: str) -> Optional[int]:
+        """
+        判断是否接受一个新请求
+
+        Args:
+            priority: 请求的优先级
+
+        Returns:
+            Optional[int]: 拒绝时返回建议的重试等待秒数，接受时返回 None
+        """
+        if not self.enabled or priority == INTERACTIVE:
+            return None
+        self._evaluate()
+        reason = None
+        if priority == BULK:
+            if self.level >= OVERLOADED or self.delays[BULK] > self.target_delay:
+                reason = "queue_delay"
+            elif self.inflight >= self.max_inflight:
+                reason = "inflight"
+        elif priority == STANDARD and self.level >= SEVERE:
+            reason = "queue_delay"
+        if reason is None:
+            return None
+        metrics.inc("admission_rejected_total", priority=priority, reason=reason)
+        return self.retry_after(priority)
+
+    def retry_after(self, priority: str) -> int:
+        """建议的重试等待：当前持续排队时间（至少一个检查间隔）"""
+        delay = max(self.delays[priority], self.delays[INTERACTIVE], self.delays[STANDARD], self.interval)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(delay)))
+
+    def status(self) -> Dict[str, Any]:
+        """
+        当前饱和度（用于就绪检查）
+
+        Returns:
+            Dict: ready（是否接受新流量）、level、saturation（进行中调用数 / 并发槽位数）、各优先级排队情况
+        """
+        if self.enabled:
+            self._evaluate()
+        max_concurrency = self.scheduler.max_concurrency
+        return {
+            "ready": self.level == NORMAL,
+            "level": LEVEL_NAMES[self.level],
+            "saturation": round(self.inflight / max_concurrency, 3) if max_concurrency > 0 else 0.0,
+            "running": self.scheduler.total_running,
+            "queued": self.scheduler.total_queued,
+            "max_concurrency": max_concurrency,
+            "target_delay": self.target_delay,
+            "queue_delay": {priority: round(self.delays[priority], 3) for priority in PRIORITIES},
+        }
+
+
+async def admission_control(request: Request):
+    """
+    准入控制依赖：过载时拒绝会调用模型的新请求（POST），返回 503 与 Retry-After
+    """
+    if request.method != "POST":
+        return
+    priority = classify(request.url.path)
+    retry_after = admission_controller.check(priority)
+    if retry_after is not None:
+        app_logger.warning(f"服务过载，拒绝 {priority} 请求: {request.url.path}，{retry_after}s 后重试")
+        raise HTTPException(
+            status_code=503,
+            detail=f"服务繁忙，请在 {retry_after} 秒后重试",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+# 全局实例
+admission_controller = AdmissionController(
+    scheduler,
+    settings.admission_target_delay,
+    settings.admission_interval,
+    settings.admission_max_inflight,
+)
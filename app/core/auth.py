@@ -7,10 +7,11 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.core.config import settings
+from app.core.request_context import bind_request
 
 # JWT 配置（统一从 settings 读取，避免重复加载 .env）
 SECRET_KEY = settings.jwt_secret_key
@@ -77,12 +78,14 @@ def authenticate_user(username: str, password: str) -> bool:
 
 
 async def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> dict:
     """
-    从 Token 获取当前用户（依赖注入）
+    从 Token 获取当前用户（依赖注入），同时写入请求上下文供用量统计使用
     
     Args:
+        request: 当前请求
         credentials: HTTP Bearer 凭证
         
     Returns:
@@ -107,4 +110,20 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
     
+    bind_request(username, request.url.path)
     return {"username": username}
+
+
+async def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    要求当前用户为管理员（默认管理员账号）
+    
+    Raises:
+        HTTPException: 非管理员返回 403
+    """
+    if current_user["username"] != settings.default_admin_username:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限",
+        )
+    return current_user
@@ -0,0 +1,391 @@
+"""
+本地内容寻址存储
+按内容 SHA-256 保存二进制文件（如编辑后的图片），并在后台异步拉取远程资源。
+引用的下载状态（pending/failed/完成）记录在引用文件中，多个 worker 进程之间可见。
+后台任务定期删除超过 BLOB_TTL 的引用，总大小超过 BLOB_MAX_MB 时从最旧的引用开始删除，
+不再被任何引用使用的对象随之删除。
+
+作者: ZHANGCHAO
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Any, Tuple
+
+import httpx
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.file_store import write_json_atomic
+from app.core.metrics import metrics
+
+metrics.describe("blob_store_bytes", "本地 Blob 存储的对象总大小（字节，最近一次清理时统计）")
+metrics.describe("blob_refs_removed_total", "清理删除的 Blob 引用数（reason: ttl / size）")
+
+# 未被引用的对象与临时文件至少保留这么久（秒）才删除：
+# 其他 worker 写入对象后、写入引用前，清理任务不能把对象当作孤儿删除
+ORPHAN_GRACE = 300
+
+
+class BlobStore:
+    """内容寻址的本地 Blob 存储"""
+
+    def __init__(self, root: str):
+        """
+        初始化存储目录
+
+        Args:
+            root: 存储根目录，objects 子目录按摘要保存内容，refs 子目录保存引用
+        """
+        self.root = root
+        self._objects_dir = os.path.join(root, "objects")
+        self._refs_dir = os.path.join(root, "refs")
+        # 本进程正在后台下载的引用 -> 下载任务
+        self._pending: Dict[str, asyncio.Task] = {}
+        # 等待其他进程完成下载时的轮询间隔（秒）
+        self._poll_interval = 0.2
+        self._task: Optional[asyncio.Task] = None
+
+    def _object_path(self, digest: str) -> str:
+        """根据摘要计算对象文件路径（按前两位分目录）"""
+        return os.path.join(self._objects_dir, digest[:2], digest)
+
+    def _ref_path(self, ref: str) -> str:
+        """引用元数据文件路径"""
+        return os.path.join(self._refs_dir, f"{ref}.json")
+
+    @staticmethod
+    def is_valid_ref(ref: str) -> bool:
+        """引用必须是 32 位十六进制字符串，防止路径穿越"""
+        return len(ref) == 32 and all(c in "0123456789abcdef" for c in ref)
+
+    def put(self, data: bytes) -> str:
+        """
+        写入内容并返回其摘要，相同内容只保存一份（目录在首次写入时创建）
+
+        Args:
+            data: 二进制内容
+
+        Returns:
+            str: 内容的 SHA-256 十六进制摘要
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        try:
+            # 已有相同内容：刷新修改时间，清理任务在宽限期内不会把它当作孤儿删除
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _write_ref(self, ref: str, meta: Dict[str, Any]):
+        """原子写入引用元数据"""
+        write_json_atomic(self._ref_path(ref), meta, indent=None)
+
+    def _read_ref(self, ref: str) -> Optional[Dict[str, Any]]:
+        """读取引用文件（可能处于 pending 或 failed 状态）"""
+        if not self.is_valid_ref(ref):
+            return None
+        try:
+            with open(self._ref_path(ref), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get_ref(self, ref: str) -> Optional[Dict[str, Any]]:
+        """
+        读取已完成的引用元数据
+
+        Returns:
+            Optional[Dict]: 包含 digest、content_type、size、source_url，不存在或未完成返回None
+        """
+        meta = self._read_ref(ref)
+        if meta is None or "digest" not in meta:
+            return None
+        return meta
+
+    def remaining_ttl(self, ref: str, ttl: float) -> int:
+        """引用距离按 TTL 被清理还剩的秒数（按引用文件的修改时间计算）"""
+        try:
+            age = time.time() - os.stat(self._ref_path(ref)).st_mtime
+        except OSError:
+            return 0
+        return max(0, int(ttl - age))
+
+    def object_path(self, digest: str) -> str:
+        """对外暴露对象文件路径"""
+        return self._object_path(digest)
+
+    def read(self, digest: str, start: int = 0, length: int = -1) -> bytes:
+        """
+        读取对象内容
+
+        Args:
+            digest: 内容摘要
+            start: 起始偏移
+            length: 读取长度，-1 表示读到末尾
+        """
+        with open(self._object_path(digest), "rb") as f:
+            if start:
+                f.seek(start)
+            return f.read(length)
+
+    def fetch_in_background(
+        self,
+        url: str,
+        client: httpx.AsyncClient,
+        headers: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        创建后台任务下载远程资源并写入存储，立即返回引用
+
+        Args:
+            url: 远程资源地址
+            client: 用于下载的 HTTP 客户端
+            headers: 额外请求头
+
+        Returns:
+            str: 新分配的引用ID
+        """
+        ref = uuid.uuid4().hex
+        # 先落盘 pending 状态，其他 worker 收到该引用的请求时会等待而不是返回 404
+        self._write_ref(ref, {"status": "pending", "source_url": url})
+        task = asyncio.create_task(self._fetch(ref, url, client, headers))
+        self._pending[ref] = task
+        task.add_done_callback(lambda _: self._pending.pop(ref, None))
+        return ref
+
+    async def _fetch(
+        self,
+        ref: str,
+        url: str,
+        client: httpx.AsyncClient,
+        headers: Optional[Dict[str, str]]
+    ) -> Optional[Dict[str, Any]]:
+        """下载远程资源，成功时写入对象和引用"""
+        try:
+            response = await client.get(
+                url,
+                headers=headers,
+                follow_redirects=True,
+                timeout=settings.blob_fetch_timeout,
+            )
+            if not response.is_success:
+                app_logger.warning(f"后台下载失败 ({response.status_code}): {url}")
+                self._mark_failed(ref, url)
+                return None
+
+            data = response.content
+            digest = await asyncio.to_thread(self.put, data)
+            meta = {
+                "digest": digest,
+                "content_type": response.headers.get("content-type", "application/octet-stream"),
+                "size": len(data),
+                "source_url": url,
+            }
+            await asyncio.to_thread(self._write_ref, ref, meta)
+            app_logger.info(f"后台下载完成: ref={ref}, digest={digest[:12]}, size={len(data)}")
+            return meta
+        except Exception as e:
+            app_logger.warning(f"后台下载异常: {e}")
+            self._mark_failed(ref, url)
+            return None
+
+    def _mark_failed(self, ref: str, url: str):
+        """记录下载失败的引用（保留原始地址用于回退重定向）"""
+        try:
+            self._write_ref(ref, {"status": "failed", "source_url": url})
+        except OSError as e:
+            app_logger.warning(f"记录下载失败状态出错: {e}")
+
+    async def resolve(self, ref: str, wait: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        解析引用，若仍在下载中则等待完成
+
+        Args:
+            ref: 引用ID
+            wait: 最长等待秒数，默认使用 blob_wait_timeout
+
+        Returns:
+            Optional[Dict]: 引用元数据，下载失败、超时或不存在时返回None
+        """
+        timeout = settings.blob_wait_timeout if wait is None else wait
+        task = self._pending.get(ref)
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self.get_ref(ref)
+
+        # 下载可能在其他 worker 进程中进行，轮询引用文件直到状态变化
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        meta = self._read_ref(ref)
+        while meta is not None and meta.get("status") == "pending" and loop.time() < deadline:
+            await asyncio.sleep(self._poll_interval)
+            meta = self._read_ref(ref)
+        return self.get_ref(ref)
+
+    def failed_source(self, ref: str) -> Optional[str]:
+        """返回下载失败引用的原始地址"""
+        meta = self._read_ref(ref)
+        if meta is not None and meta.get("status") == "failed":
+            return meta.get("source_url")
+        return None
+
+
+    def _scan_refs(self) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """列出全部引用：(引用ID, 修改时间, 元数据)，按修改时间从旧到新排序"""
+        refs = []
+        try:
+            entries = list(os.scandir(self._refs_dir))
+        except FileNotFoundError:
+            return refs
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            ref = entry.name[:-5]
+            try:
+                mtime = entry.stat().st_mtime
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                # 正在被其他进程替换或已被删除
+                continue
+            refs.append((ref, mtime, meta))
+        refs.sort(key=lambda item: item[1])
+        return refs
+
+    def _scan_objects(self) -> Dict[str, Tuple[str, int, float]]:
+        """列出全部对象文件：摘要 -> (路径, 大小, 修改时间)；临时文件以 .tmp 结尾的摘要形式返回"""
+        objects = {}
+        try:
+            shards = list(os.scandir(self._objects_dir))
+        except FileNotFoundError:
+            return objects
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            try:
+                for entry in os.scandir(shard.path):
+                    stat = entry.stat()
+                    objects[entry.name] = (entry.path, stat.st_size, stat.st_mtime)
+            except OSError:
+                continue
+        return objects
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        """删除文件，已被其他进程删除时忽略"""
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def sweep(self, ttl: float, max_bytes: int) -> Dict[str, int]:
+        """
+        清理过期引用与超出容量的内容（阻塞操作，在线程中调用；多个 worker 同时执行也是安全的）
+
+        Args:
+            ttl: 引用的最长保留时间（秒），0 表示不按时间清理
+            max_bytes: 对象总大小上限（字节），0 表示不限制
+
+        Returns:
+            Dict[str, int]: 删除的引用数、对象数与释放的字节数
+        """
+        now = time.time()
+        refs = self._scan_refs()
+        objects = self._scan_objects()
+        removed_refs = {"ttl": 0, "size": 0}
+
+        live = []
+        for ref, mtime, meta in refs:
+            # 本进程正在下载的引用不删除
+            if ttl > 0 and now - mtime > ttl and ref not in self._pending:
+                if self._remove(self._ref_path(ref)):
+                    removed_refs["ttl"] += 1
+            else:
+                live.append((ref, meta))
+
+        # 仍被引用的对象大小之和；超过上限时从最旧的引用开始删除
+        referenced: Dict[str, int] = {}
+        for _, meta in live:
+            digest = meta.get("digest")
+            if digest in objects:
+                referenced[digest] = referenced.get(digest, 0) + 1
+        total = sum(objects[digest][1] for digest in referenced)
+        if max_bytes > 0:
+            for ref, meta in live:
+                if total <= max_bytes:
+                    break
+                digest = meta.get("digest")
+                # 下载中或失败的引用不占用对象空间，只按 TTL 清理
+                if digest not in referenced or not self._remove(self._ref_path(ref)):
+                    continue
+                removed_refs["size"] += 1
+                referenced[digest] -= 1
+                if referenced[digest] == 0:
+                    del referenced[digest]
+                    total -= objects[digest][1]
+
+        removed_objects = 0
+        freed = 0
+        for name, (path, size, mtime) in objects.items():
+            if name in referenced or now - mtime < ORPHAN_GRACE:
+                continue
+            if self._remove(path):
+                removed_objects += 1
+                freed += size
+
+        for reason, count in removed_refs.items():
+            if count:
+                metrics.inc("blob_refs_removed_total", count, reason=reason)
+        metrics.set("blob_store_bytes", total)
+        return {
+            "refs": removed_refs["ttl"] + removed_refs["size"],
+            "objects": removed_objects,
+            "freed_bytes": freed,
+            "total_bytes": total,
+        }
+
+    async def _maintenance_loop(self):
+        """启动时及之后每 BLOB_SWEEP_INTERVAL 秒清理一次"""
+        while True:
+            try:
+                result = await asyncio.to_thread(self.sweep, settings.blob_ttl, int(settings.blob_max_mb * 1024 * 1024))
+                if result["refs"] or result["objects"]:
+                    app_logger.info(
+                        f"Blob 存储清理: 删除引用 {result['refs']} 个、对象 {result['objects']} 个，"
+                        f"释放 {result['freed_bytes'] / 1024 / 1024:.1f}MB，当前 {result['total_bytes'] / 1024 / 1024:.1f}MB"
+                    )
+            except Exception:
+                app_logger.exception("Blob 存储清理任务异常")
+            await asyncio.sleep(settings.blob_sweep_interval)
+
+    def start(self):
+        """启动后台清理任务（应用启动时调用；BLOB_TTL 与 BLOB_MAX_MB 均为 0 时不启动）"""
+        if self._task is None and (settings.blob_ttl > 0 or settings.blob_max_mb > 0):
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        """停止后台清理任务（应用关闭时调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局实例（目录在首次写入时创建，导入时不访问文件系统）
+blob_store = BlobStore(settings.blob_dir)
@@ -0,0 +1,360 @@
+"""
+响应压缩中间件
+按 Accept-Encoding 选择 brotli / zstd / gzip（brotli、zstandard 为可选依赖，未安装时只提供 gzip），
+- 只压缩文本类内容（JSON、HTML、JS 等），图片、视频、已压缩的字体和归档原样发送
+- 小于 COMPRESSION_MIN_SIZE 的响应不压缩；已带 Content-Encoding（如预压缩的静态资源）、
+  范围请求和 `Cache-Control: no-transform` 的响应不处理
+- 普通响应先缓冲，完整到达后一次压缩并给出 Content-Length；超过缓冲上限时转为流式压缩
+- SSE（text/event-stream）与 NDJSON 采用增量模式：每个数据块压缩后立即 flush，不影响逐字输出
+
+实现为纯 ASGI 中间件，不经过 BaseHTTPMiddleware，不会缓冲流式响应。
+"""
+
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+metrics.describe("compression_responses_total", "压缩的响应数")
+metrics.describe("compression_bytes_in_total", "压缩前的响应字节数")
+metrics.describe("compression_bytes_out_total", "压缩后的响应字节数")
+
+# 值得压缩的内容类型（图片、字体 woff/woff2 等本身已压缩）
+_COMPRESSIBLE_PREFIXES = ("text/",)
+_COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+    "font/ttf",
+    "font/otf",
+}
+
+# 增量模式：每个数据块都立即 flush
+_INCREMENTAL_TYPES = {"text/event-stream", "application/x-ndjson"}
+
+# 普通响应最多缓冲这么多字节后转为流式压缩
+_BUFFER_LIMIT = 1024 * 1024
+
+
+def is_compressible(media_type: str) -> bool:
+    """判断内容类型（不含参数）是否值得压缩"""
+    return media_type.startswith(_COMPRESSIBLE_PREFIXES) or media_type in _COMPRESSIBLE_TYPES
+
+
+def available_encodings() -> List[str]:
+    """当前环境可用的编码（不考虑配置）"""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+def accepted_encodings(header: str, supported: Sequence[str]) -> List[str]:
+    """
+    解析 Accept-Encoding，返回客户端接受且服务端支持的编码（按 supported 的优先级）
+
+    Args:
+        header: Accept-Encoding 请求头
+        supported: 服务端支持的编码，按优先级排列
+
+    Returns:
+        List[str]: 如 ["br", "gzip"]；q=0 的编码视为不接受
+    """
+    accepted: Dict[str, float] = {}
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    return [name for name in supported if accepted.get(name, wildcard) > 0]
+
+
+class Compressor:
+    """统一 gzip / brotli / zstd 的增量压缩接口"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        """
+        Args:
+            encoding: gzip / br / zstd
+            level: 压缩级别，为空时使用配置
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=settings.compression_brotli_quality if level is None else level)
+        elif encoding == "zstd":
+            zstd_level = settings.compression_zstd_level if level is None else level
+            self._impl = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+        else:
+            gzip_level = settings.compression_gzip_level if level is None else level
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """压缩一块数据（输出可能暂存在压缩器内部）"""
+        if self.encoding == "br":
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self) -> bytes:
+        """输出目前为止的全部数据，客户端可立即解压（用于流式响应）"""
+        if self.encoding == "br":
+            return self._impl.flush()
+        if self.encoding == "zstd":
+            return self._impl.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """结束压缩流"""
+        if self.encoding == "br":
+            return self._impl.finish()
+        return self._impl.flush()
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """一次性压缩完整数据"""
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _parse_encodings(value: str) -> List[str]:
+    """解析 COMPRESSION_ENCODINGS，过滤掉未知或未安装的编码"""
+    available = available_encodings()
+    encodings = []
+    for name in value.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in ("br", "zstd", "gzip"):
+            app_logger.warning(f"未知的压缩编码: {name}，已忽略")
+        elif name not in available:
+            app_logger.info(f"压缩编码 {name} 所需的依赖未安装，已跳过")
+        elif name not in encodings:
+            encodings.append(name)
+    return encodings
+
+
+def _strip_etag_suffix(scope: Scope, encoding: str) -> Tuple[Scope, bool]:
+    """
+    去掉 If-None-Match 中由本中间件附加的编码后缀，使下游按原始 ETag 协商
+
+    Returns:
+        Tuple[Scope, bool]: (可能替换了请求头的 scope, 是否去掉过后缀)
+    """
+    suffix = f'-{encoding}"'.encode("latin-1")
+    headers = []
+    stripped = False
+    for name, value in scope["headers"]:
+        if name == b"if-none-match" and suffix in value:
+            value = value.replace(suffix, b'"')
+            stripped = True
+        headers.append((name, value))
+    if not stripped:
+        return scope, False
+    return {**scope, "headers": headers}, True
+
+
+class CompressionMiddleware:
+    """按内容类型和大小压缩 HTTP 响应的 ASGI 中间件"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.encodings = _parse_encodings(settings.compression_encodings)
+        self.min_size = settings.compression_min_size
+        self.streaming = settings.compression_streaming
+        self.excluded = tuple(
+            t.strip().lower() for t in settings.compression_exclude_types.split(",") if t.strip()
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.encodings or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = next(iter(accepted_encodings(accept, self.encodings)), None) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        scope, revalidating = _strip_etag_suffix(scope, encoding)
+        responder = _CompressionResponder(self, encoding, send, revalidating)
+        await self.app(scope, receive, responder.send)
+
+    def eligible(self, headers: Headers, status: int) -> Tuple[bool, bool]:
+        """
+        根据响应头判断是否压缩
+
+        Returns:
+            Tuple[bool, bool]: (是否压缩, 是否增量模式)
+        """
+        if status < 200 or status in (204, 206, 304):
+            return False, False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False, False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False, False
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        if not is_compressible(media_type) or media_type.startswith(self.excluded):
+            return False, False
+        incremental = media_type in _INCREMENTAL_TYPES
+        if incremental:
+            return self.streaming, True
+        length = headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return False, False
+        return True, False
+
+
+class _CompressionResponder:
+    """包装单个请求的 send，按需压缩响应体"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send, revalidating: bool = False):
+        self.middleware = middleware
+        self.encoding = encoding
+        # 请求携带的是压缩版本的 ETag：下游返回 304 时需要把后缀加回去
+        self.revalidating = revalidating
+        self.send_next = send
+        self.start: Optional[Message] = None
+        # None（未决定）/ pass（原样发送）/ buffer（缓冲中）/ stream（流式压缩）
+        self.mode: Optional[str] = None
+        self.incremental = False
+        self.buffer: List[bytes] = []
+        self.buffered = 0
+        self.compressor: Optional[Compressor] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send_next(message)
+            return
+
+        if self.mode is None:
+            if self.revalidating and self.start["status"] == 304:
+                self._restore_etag()
+            headers = Headers(raw=self.start["headers"])
+            compress, self.incremental = self.middleware.eligible(headers, self.start["status"])
+            self.mode = "pass" if not compress else ("stream" if self.incremental else "buffer")
+            if self.mode == "pass":
+                await self.send_next(self.start)
+            elif self.mode == "stream":
+                await self._start_stream()
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.mode == "pass":
+            await self.send_next(message)
+        elif self.mode == "buffer":
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if not more_body:
+                await self._send_buffered()
+            elif self.buffered > _BUFFER_LIMIT:
+                await self._start_stream()
+                data = b"".join(self.buffer)
+                self.buffer = []
+                await self._send_chunk(data, more_body=True)
+        else:
+            await self._send_chunk(body, more_body)
+
+    def _headers(self) -> MutableHeaders:
+        """可修改的响应头（修改直接作用于待发送的 start 消息）"""
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        self.start["headers"] = headers.raw
+        return headers
+
+    def _suffix_etag(self, headers: MutableHeaders):
+        """强 ETag 附加编码后缀，与未压缩的表示区分"""
+        etag = headers.get("etag")
+        suffix = f'-{self.encoding}"'
+        if etag and etag.startswith('"') and not etag.endswith(suffix) and etag.endswith('"'):
+            headers["ETag"] = etag[:-1] + suffix
+        headers.add_vary_header("Accept-Encoding")
+
+    def _restore_etag(self):
+        """304 响应沿用客户端缓存的压缩版本 ETag"""
+        self._suffix_etag(self._headers())
+
+    def _update_headers(self, headers: MutableHeaders):
+        """设置压缩后的响应头"""
+        headers["Content-Encoding"] = self.encoding
+        self._suffix_etag(headers)
+
+    async def _send_buffered(self):
+        """完整响应已缓冲：达到阈值且压缩后更小则压缩发送，否则原样发送"""
+        data = b"".join(self.buffer)
+        self.buffer = []
+        headers = self._headers()
+        if len(data) >= self.middleware.min_size:
+            compressed = compress(data, self.encoding)
+            if len(compressed) < len(data):
+                self._update_headers(headers)
+                headers["Content-Length"] = str(len(compressed))
+                self._record(len(data), len(compressed))
+                await self.send_next(self.start)
+                await self.send_next({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+        # 不压缩时同样声明 Vary，避免缓存把未压缩的版本返回给其他客户端
+        if len(data) >= self.middleware.min_size:
+            headers.add_vary_header("Accept-Encoding")
+        await self.send_next(self.start)
+        await self.send_next({"type": "http.response.body", "body": data, "more_body": False})
+
+    async def _start_stream(self):
+        """发送流式压缩的响应头（长度未知，去掉 Content-Length）"""
+        self.mode = "stream"
+        self.compressor = Compressor(self.encoding)
+        headers = self._headers()
+        self._update_headers(headers)
+        if "content-length" in headers:
+            del headers["content-length"]
+        await self.send_next(self.start)
+
+    async def _send_chunk(self, body: bytes, more_body: bool):
+        """流式压缩一个数据块；增量模式下立即 flush"""
+        data = self.compressor.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        elif self.incremental and body:
+            data += self.compressor.flush()
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        if data or not more_body:
+            await self.send_next({"type": "http.response.body", "body": data, "more_body": more_body})
+        if not more_body:
+            self._record(self.bytes_in, self.bytes_out)
+
+    def _record(self, bytes_in: int, bytes_out: int):
+        """记录压缩指标"""
+        metrics.inc("compression_responses_total", encoding=self.encoding)
+        metrics.inc("compression_bytes_in_total", bytes_in, encoding=self.encoding)
+        metrics.inc("compression_bytes_out_total", bytes_out, encoding=self.encoding)
@@ -0,0 +1,111 @@
+"""
+条件请求（ETag / If-None-Match）
+轮询频繁且内容很少变化的接口（模型列表、模型配置、平台模型目录）把渲染好的响应体
+连同强 ETag 缓存起来：数据版本不变时直接复用，客户端携带匹配的 If-None-Match 时返回 304，
+不再查询完整数据，也不重新序列化响应体。响应体很小的接口（当前用户）每次直接构造 RenderedEntry，不进入缓存。
+"""
+
+import time
+import hashlib
+from typing import Any, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+
+from app.core import json_backend
+from app.core.metrics import metrics
+
+metrics.describe("conditional_responses_total", "带 ETag 的接口响应数（status 为 200 或 304）")
+
+# 需要认证的接口只允许浏览器私有缓存，并且每次使用前都要协商
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(body: bytes) -> str:
+    """根据响应体内容计算强 ETag"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 是否命中（按弱比较，支持多个值和 *）"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class RenderedEntry:
+    """一份渲染好的 JSON 响应"""
+
+    __slots__ = ("version", "etag", "body", "created_at")
+
+    def __init__(self, version: Hashable, body: bytes):
+        self.version = version
+        self.etag = make_etag(body)
+        self.body = body
+        self.created_at = time.monotonic()
+
+
+class RenderedCache:
+    """按 key 缓存渲染好的响应体与 ETag，数据版本变化或超过有效期时重新渲染"""
+
+    def __init__(self):
+        self._entries: Dict[str, RenderedEntry] = {}
+
+    def get(self, key: str, version: Hashable = None, max_age: Optional[float] = None) -> Optional[RenderedEntry]:
+        """
+        获取仍然有效的缓存
+
+        Args:
+            key: 缓存键（接口及其参数）
+            version: 当前数据版本，与缓存时不同即视为失效
+            max_age: 最长有效期（秒），为空表示只按版本判断
+
+        Returns:
+            Optional[RenderedEntry]: 有效的缓存，没有时返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        if max_age is not None and time.monotonic() - entry.created_at > max_age:
+            return None
+        return entry
+
+    def put(self, key: str, content: Any, version: Hashable = None) -> RenderedEntry:
+        """渲染内容并缓存"""
+        entry = RenderedEntry(version, json_backend.dumps(content))
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, prefix: str = ""):
+        """删除以 prefix 开头的缓存（为空时全部删除）"""
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+
+def conditional_response(request: Request, entry: RenderedEntry) -> Response:
+    """
+    根据 If-None-Match 返回 304 或完整的 JSON 响应
+
+    Args:
+        request: 当前请求
+        entry: 渲染好的响应
+
+    Returns:
+        Response: 304（无响应体）或 200
+    """
+    headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, entry.etag):
+        metrics.inc("conditional_responses_total", endpoint=request.url.path, status="304")
+        return Response(status_code=304, headers=headers)
+    metrics.inc("conditional_responses_total", endpoint=request.url.path, status="200")
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# 全局实例
+rendered_cache = RenderedCache()
@@ -10,6 +10,18 @@ class Settings(BaseSettings):
     host: str = os.getenv("HOST", "0.0.0.0")
     port: int = int(os.getenv("PORT", "8000"))
     
+    # 生产启动器（serve.py）配置
+    web_workers: int = int(os.getenv("WEB_WORKERS", "0"))  # 0 表示按可用 CPU 数
+    web_loop: str = os.getenv("WEB_LOOP", "auto")  # auto / uvloop / asyncio
+    web_http: str = os.getenv("WEB_HTTP", "auto")  # auto / httptools / h11
+    web_backlog: int = int(os.getenv("WEB_BACKLOG", "2048"))
+    web_keepalive: int = int(os.getenv("WEB_KEEPALIVE", "5"))  # keep-alive 空闲超时（秒）
+    web_limit_concurrency: int = int(os.getenv("WEB_LIMIT_CONCURRENCY", "0"))  # 每个 worker 的并发连接上限，0 表示不限
+    web_preload: bool = os.getenv("WEB_PRELOAD", "false").lower() == "true"
+    web_max_requests: int = int(os.getenv("WEB_MAX_REQUESTS", "0"))  # 处理多少请求后回收 worker，0 表示不回收
+    web_max_requests_jitter: int = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+    web_graceful_timeout: int = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+    
     # 日志配置
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     log_file: str = os.getenv("LOG_FILE", "logs/app.log")
@@ -23,13 +35,131 @@ class Settings(BaseSettings):
     default_temperature: float = float(os.getenv("DEFAULT_TEMPERATURE", "0.7"))
     default_max_tokens: int = int(os.getenv("DEFAULT_MAX_TOKENS", "2000"))
     
+    # JSON 序列化后端：auto（有 orjson 则使用）、orjson、stdlib
+    json_backend: str = os.getenv("JSON_BACKEND", "auto")
+    
     # API超时设置（秒）- 增加到300秒（5分钟）以支持复杂模型处理
     api_timeout: int = int(os.getenv("API_TIMEOUT", "300"))
+    # 上游请求分阶段超时（秒）：建立连接、流式响应的首个片段、流式片段之间的最长空闲
+    api_connect_timeout: float = float(os.getenv("API_CONNECT_TIMEOUT", "10"))
+    api_first_byte_timeout: float = float(os.getenv("API_FIRST_BYTE_TIMEOUT", "60"))
+    api_idle_timeout: float = float(os.getenv("API_IDLE_TIMEOUT", "30"))
+    
+    # 请求截止时间：各接口的总预算（JSON：{"/ai/chat": 120}，为空时图片编辑 120 秒、其余 API_TIMEOUT），
+    # 剩余时间低于预期耗时（历史中位数，样本不足时取 DEADLINE_MIN_REMAINING 秒）时提前拒绝
+    deadline_budgets: str = os.getenv("DEADLINE_BUDGETS", "")
+    deadline_min_remaining: float = float(os.getenv("DEADLINE_MIN_REMAINING", "1"))
+    
+    # 多结果生成配置：并发上限，以及支持原生 n 参数的模型（逗号分隔）
+    image_description_concurrency: int = int(os.getenv("IMAGE_DESCRIPTION_CONCURRENCY", "4"))
+    native_n_models: str = os.getenv("NATIVE_N_MODELS", "")
+    
+    # 向量化微批处理：单次上游调用最多合并的文本数、首条文本到达后最多等待的毫秒数
+    embedding_batch_max_size: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+    embedding_batch_wait_ms: float = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+    
+    # 语义响应缓存（/ai/quick、/ai/text/analyze）：默认关闭；相似度阈值可按接口覆盖（JSON：{"/ai/quick": 0.95}）
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    semantic_cache_embedding_model: str = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "BAAI/bge-m3")
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+    semantic_cache_thresholds: str = os.getenv("SEMANTIC_CACHE_THRESHOLDS", "")
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+    semantic_cache_max_mb: float = float(os.getenv("SEMANTIC_CACHE_MAX_MB", "128"))
+    semantic_cache_ttl: float = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    semantic_cache_scope: str = os.getenv("SEMANTIC_CACHE_SCOPE", "user")  # user（仅同一用户复用）/ global
+    semantic_cache_index: str = os.getenv("SEMANTIC_CACHE_INDEX", "auto")  # auto（有 numpy 则用）/ numpy / python
+    
+    # 对话历史压缩（/ai/chat、会话）：none / window（滑动窗口）/ last_turns（最近 N 轮）/ summary（更早的轮次滚动摘要），
+    # 提示词 token 预算可按模型覆盖（JSON：{"模型名": token数}）
+    history_compaction: str = os.getenv("HISTORY_COMPACTION", "window")
+    history_token_budget: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "24000"))
+    history_token_budgets: str = os.getenv("HISTORY_TOKEN_BUDGETS", "")
+    history_keep_turns: int = int(os.getenv("HISTORY_KEEP_TURNS", "10"))
+    history_summary_model: str = os.getenv("HISTORY_SUMMARY_MODEL", "")  # 为空时使用对话本身的模型
+    history_summary_max_tokens: int = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "512"))
+    
+    # 服务端对话会话（/ai/sessions）：单 worker 内存模式下最多保留的会话数与占用、空闲过期时间（秒，0 表示不过期），
+    # 开启持久化（或以多 worker 运行）时会话直接读写存储后端
+    chat_session_max_sessions: int = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "10000"))
+    chat_session_max_mb: float = float(os.getenv("CHAT_SESSION_MAX_MB", "256"))
+    chat_session_ttl: float = float(os.getenv("CHAT_SESSION_TTL", "86400"))
+    chat_session_persist: bool = os.getenv("CHAT_SESSION_PERSIST", "false").lower() == "true"
+    
+    # WebSocket 对话（/ai/ws/chat）：每条连接最多同时进行的生成数、连接后等待认证消息的秒数
+    ws_max_streams: int = int(os.getenv("WS_MAX_STREAMS", "4"))
+    ws_auth_timeout: float = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+    
+    # 响应压缩：按客户端 Accept-Encoding 选择编码（br / zstd 需安装可选依赖 brotli / zstandard），
+    # 只压缩文本类内容且不小于 COMPRESSION_MIN_SIZE 字节的响应；SSE 按数据块增量压缩
+    compression_enabled: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    compression_encodings: str = os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip")  # 按优先级排列
+    compression_min_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    compression_brotli_quality: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+    compression_zstd_level: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    compression_streaming: bool = os.getenv("COMPRESSION_STREAMING", "true").lower() == "true"  # 是否压缩 SSE / NDJSON
+    compression_exclude_types: str = os.getenv("COMPRESSION_EXCLUDE_TYPES", "")  # 不压缩的内容类型前缀，逗号分隔
+    
+    # 平台模型目录（/ai/platform/models）的缓存秒数，期间轮询直接返回缓存或 304；0 表示每次请求上游
+    platform_models_cache_ttl: float = float(os.getenv("PLATFORM_MODELS_CACHE_TTL", "300"))
+    
+    # 前端静态资源（static/ 目录）：启动时生成缺失的 gzip/brotli 压缩版本，小文件常驻内存；
+    # 文件名匹配 STATIC_IMMUTABLE_PATTERN（带内容哈希）的资源按 immutable 长期缓存
+    static_precompress: bool = os.getenv("STATIC_PRECOMPRESS", "true").lower() == "true"
+    static_memory_cache_mb: float = float(os.getenv("STATIC_MEMORY_CACHE_MB", "64"))  # 0 表示不缓存，全部从磁盘发送
+    static_memory_max_file_kb: int = int(os.getenv("STATIC_MEMORY_MAX_FILE_KB", "512"))
+    static_min_compress_size: int = int(os.getenv("STATIC_MIN_COMPRESS_SIZE", "1024"))  # 小于此字节数的文件不压缩
+    static_max_age: int = int(os.getenv("STATIC_MAX_AGE", "31536000"))
+    static_immutable_pattern: str = os.getenv("STATIC_IMMUTABLE_PATTERN", r"[-.](?=[A-Za-z0-9_]*[0-9])[A-Za-z0-9_]{8,}\.[A-Za-z0-9]+$")
+    
+    # 提示词模板覆盖文件（JSON，修改后自动热加载）及检查间隔（秒）
+    prompt_templates_file: str = os.getenv("PROMPT_TEMPLATES_FILE", "data/prompt_templates.json")
+    prompt_reload_interval: float = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
     
     # 文件处理（仅用于临时存储）
     max_file_size: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
     upload_dir: str = "temp_uploads"
     
+    # 本地 Blob 存储（编辑后图片的后台下载与缓存）
+    blob_dir: str = os.getenv("BLOB_DIR", "data/blobs")
+    blob_fetch_timeout: float = float(os.getenv("BLOB_FETCH_TIMEOUT", "60"))
+    blob_wait_timeout: float = float(os.getenv("BLOB_WAIT_TIMEOUT", "30"))
+    blob_ttl: float = float(os.getenv("BLOB_TTL", "604800"))  # 引用保留秒数，0 表示不过期
+    blob_max_mb: float = float(os.getenv("BLOB_MAX_MB", "1024"))  # 对象总大小上限，0 表示不限制
+    blob_sweep_interval: float = float(os.getenv("BLOB_SWEEP_INTERVAL", "3600"))
+    
+    # 持久化存储（用户、模型配置等）
+    storage_backend: str = os.getenv("STORAGE_BACKEND", "sqlite")  # sqlite / json
+    storage_db_path: str = os.getenv("STORAGE_DB_PATH", "data/pure_ai.db")
+    
+    # token 用量统计与配额（配额为每个统计周期的 token 总数，0 表示不限制；可按用户单独设置）
+    usage_flush_interval: float = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))  # 内存计数批量写入存储的间隔（秒）
+    usage_quota_period: str = os.getenv("USAGE_QUOTA_PERIOD", "month")  # day / month
+    usage_soft_quota: int = int(os.getenv("USAGE_SOFT_QUOTA", "0"))  # 超过后仅记录告警
+    usage_hard_quota: int = int(os.getenv("USAGE_HARD_QUOTA", "0"))  # 超过后拒绝请求（429）
+    
+    # 按用户限流（令牌桶），档位为 JSON：{"档位名": {"rps": 每秒请求数, "burst": 请求突发数, "tpm": 每分钟token数, "token_burst": token突发数}}
+    rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    rate_limit_backend: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory（每个 worker 独立）/ shared（多 worker 共享）
+    rate_limit_tiers: str = os.getenv("RATE_LIMIT_TIERS", "")  # 为空时使用内置档位 default / unlimited
+    rate_limit_default_tier: str = os.getenv("RATE_LIMIT_DEFAULT_TIER", "default")
+    rate_limit_bytes_per_token: int = int(os.getenv("RATE_LIMIT_BYTES_PER_TOKEN", "3"))  # 按请求体大小估算 token
+    
+    # 上游调用调度（每个 worker）：并发槽位数（0 表示不限制）、最多排队数、bulk 最多占用的槽位数（0 表示一半）
+    scheduler_max_concurrency: int = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+    scheduler_max_queue: int = int(os.getenv("SCHEDULER_MAX_QUEUE", "1000"))
+    scheduler_bulk_max_running: int = int(os.getenv("SCHEDULER_BULK_MAX_RUNNING", "0"))
+    
+    # 自适应准入控制：每个检查间隔内的最小排队时间超过目标即视为过载，拒绝新的 bulk 请求（503），
+    # 超过目标 4 倍时同样拒绝 standard 请求；进行中调用数上限为 0 时取并发槽位数的两倍
+    admission_enabled: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    admission_target_delay: float = float(os.getenv("ADMISSION_TARGET_DELAY", "2"))
+    admission_interval: float = float(os.getenv("ADMISSION_INTERVAL", "5"))
+    admission_max_inflight: int = int(os.getenv("ADMISSION_MAX_INFLIGHT", "0"))
+    
+    # 按需 CPU 分析接口（/ai/profile，仅管理员）单次最长持续秒数
+    profile_max_seconds: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    
     # 认证配置
     default_admin_username: str = os.getenv("DEFAULT_ADMIN_USERNAME", "admin")
     default_admin_password: str = os.getenv("DEFAULT_ADMIN_PASSWORD", "123456")
@@ -41,10 +171,45 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-# 验证必要的配置
-if not settings.openai_api_key:
-    import sys
-    print("错误: OPENAI_API_KEY 未配置！")
-    print("请在 .env 文件中设置您的 API 密钥")
-    print("您可以参考 .env.example 文件了解配置格式")
-    sys.exit(1)
+
+def validate_settings() -> List[str]:
+    """
+    检查必要的配置（在应用启动时调用，而不是导入模块时直接退出进程）
+    
+    Returns:
+        List[str]: 错误信息列表，为空表示配置完整
+    """
+    errors = []
+    if not settings.openai_api_key:
+        errors.append("OPENAI_API_KEY 未配置！请在 .env 文件中设置您的 API 密钥，可参考 .env.example 了解配置格式")
+    if settings.rate_limit_tiers.strip():
+        from app.core.rate_limit import parse_tiers
+        try:
+            parse_tiers(settings.rate_limit_tiers)
+        except (ValueError, TypeError) as e:
+            errors.append(f"RATE_LIMIT_TIERS 配置无效: {e}")
+    if settings.semantic_cache_thresholds.strip():
+        from app.services.semantic_cache import parse_thresholds
+        try:
+            parse_thresholds(settings.semantic_cache_thresholds)
+        except (ValueError, TypeError) as e:
+            errors.append(f"SEMANTIC_CACHE_THRESHOLDS 配置无效: {e}")
+    if settings.history_token_budgets.strip():
+        from app.services.history_compaction import parse_budgets as parse_history_budgets
+        try:
+            parse_history_budgets(settings.history_token_budgets)
+        except (ValueError, TypeError) as e:
+            errors.append(f"HISTORY_TOKEN_BUDGETS 配置无效: {e}")
+    if settings.static_immutable_pattern:
+        import re
+        try:
+            re.compile(settings.static_immutable_pattern)
+        except re.error as e:
+            errors.append(f"STATIC_IMMUTABLE_PATTERN 配置无效: {e}")
+    if settings.deadline_budgets.strip():
+        from app.core.deadline import parse_budgets
+        try:
+            parse_budgets(settings.deadline_budgets)
+        except (ValueError, TypeError) as e:
+            errors.append(f"DEADLINE_BUDGETS 配置无效: {e}")
+    return errors
@@ -0,0 +1,173 @@
+"""
+请求截止时间
+每个请求进入 /ai 接口时确定一个截止时间：取接口的总预算（DEADLINE_BUDGETS，未配置的接口为 API_TIMEOUT）
+与客户端通过 X-Request-Timeout 头传入的剩余秒数中较小者。截止时间写入请求上下文，贯穿调度排队与上游调用：
+- 排队与上游调用的总耗时不超过剩余时间
+- 上游请求分阶段超时：建立连接（API_CONNECT_TIMEOUT）、流式响应的首个片段（API_FIRST_BYTE_TIMEOUT）、
+  片段之间的空闲（API_IDLE_TIMEOUT），均不超过剩余时间
+- 剩余时间不足以覆盖该接口的预期耗时（历史上游耗时中位数，样本不足时取 DEADLINE_MIN_REMAINING）时提前拒绝，
+  不再排队或发起注定超时的上游请求
+"""
+
+import time
+from typing import Dict, Optional
+
+import httpx
+from fastapi import HTTPException, Request
+
+from app.core import json_backend
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.request_context import current_deadline, current_endpoint
+
+# 客户端传入的剩余时间（秒）
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# 未配置 DEADLINE_BUDGETS 时使用的接口预算（秒），其余接口为 API_TIMEOUT
+DEFAULT_BUDGETS = {
+    "/ai/image/edit": 120,
+}
+
+# 预期耗时至少需要的样本数
+MIN_LATENCY_SAMPLES = 20
+
+metrics.describe("upstream_latency_seconds", "上游模型调用耗时（不含排队）")
+metrics.describe("deadline_exceeded_total", "因截止时间不足被拒绝或中止的模型调用数")
+
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足或已超过截止时间"""
+
+
+def parse_budgets(raw: str) -> Dict[str, float]:
+    """
+    解析 DEADLINE_BUDGETS 配置
+
+    Args:
+        raw: JSON 字符串，形如 {"/ai/chat": 120, "/ai/batch": 600}，为空时使用默认预算
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    data = json_backend.loads(raw) if raw.strip() else DEFAULT_BUDGETS
+    if not isinstance(data, dict):
+        raise ValueError("DEADLINE_BUDGETS 必须是 JSON 对象")
+    return {path: float(seconds) for path, seconds in data.items()}
+
+
+def _load_budgets() -> Dict[str, float]:
+    try:
+        return parse_budgets(settings.deadline_budgets)
+    except (ValueError, TypeError) as e:
+        app_logger.error(f"DEADLINE_BUDGETS 配置无效，使用默认预算: {e}")
+        return dict(DEFAULT_BUDGETS)
+
+
+_budgets = _load_budgets()
+
+
+def budget_for(endpoint: Optional[str]) -> float:
+    """接口的总时间预算（秒）"""
+    if endpoint:
+        for suffix, seconds in _budgets.items():
+            if endpoint.endswith(suffix):
+                return seconds
+    return float(settings.api_timeout)
+
+
+def time_left() -> Optional[float]:
+    """当前请求剩余的秒数，不在请求上下文中时返回 None"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def total_timeout() -> float:
+    """本次调用（排队 + 上游）最多可用的秒数"""
+    remaining = time_left()
+    return float(settings.api_timeout) if remaining is None else max(0.0, remaining)
+
+
+def phase_timeout(limit: float) -> float:
+    """单个阶段的超时：阶段上限与剩余时间中较小者"""
+    return min(limit, total_timeout())
+
+
+def upstream_timeout(stream: bool) -> httpx.Timeout:
+    """
+    单次上游请求的 httpx 超时
+
+    非流式请求在生成完成前收不到任何响应字节，读超时只能取剩余时间；
+    流式请求的首个片段与片段间空闲由调用方按事件计时，读超时取首字节超时作为兜底。
+    """
+    remaining = total_timeout()
+    read = phase_timeout(settings.api_first_byte_timeout) if stream else remaining
+    return httpx.Timeout(
+        connect=phase_timeout(settings.api_connect_timeout),
+        read=read,
+        write=remaining,
+        pool=remaining,
+    )
+
+
+def expected_latency(endpoint: Optional[str]) -> float:
+    """接口的预期上游耗时：历史中位数，样本不足时取 DEADLINE_MIN_REMAINING"""
+    observed = metrics.quantile(
+        "upstream_latency_seconds", 0.5, min_count=MIN_LATENCY_SAMPLES, endpoint=endpoint or "-"
+    )
+    return max(settings.deadline_min_remaining, observed or 0.0)
+
+
+def ensure_budget(phase: str, endpoint: Optional[str] = None):
+    """
+    剩余时间不足以覆盖预期耗时时提前放弃
+
+    Args:
+        phase: 检查所处阶段（admission / dispatch），用于统计
+        endpoint: 接口路径，默认取当前请求上下文
+
+    Raises:
+        DeadlineExceeded: 剩余时间不足
+    """
+    remaining = time_left()
+    if remaining is None:
+        return
+    endpoint = endpoint or current_endpoint.get()
+    expected = expected_latency(endpoint)
+    if remaining < expected:
+        metrics.inc("deadline_exceeded_total", endpoint=endpoint or "-", phase=phase)
+        raise DeadlineExceeded(f"剩余时间 {max(0.0, remaining):.1f}s 不足以完成调用（预期 {expected:.1f}s），已提前放弃")
+
+
+def record_latency(seconds: float):
+    """记录一次成功的上游调用耗时，用于估算预期耗时"""
+    metrics.observe("upstream_latency_seconds", seconds, endpoint=current_endpoint.get() or "-")
+
+
+def record_timeout(phase: str):
+    """记录一次调用过程中超过截止时间或阶段超时"""
+    metrics.inc("deadline_exceeded_total", endpoint=current_endpoint.get() or "-", phase=phase)
+
+
+async def apply_deadline(request: Request):
+    """
+    确定请求截止时间的依赖：接口预算与客户端 X-Request-Timeout 取较小者，剩余时间不足时返回 504
+    """
+    budget = budget_for(request.url.path)
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            client_budget = float(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} 必须是秒数")
+        if client_budget <= 0:
+            raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} 必须大于 0")
+        budget = min(budget, client_budget)
+    current_deadline.set(time.monotonic() + budget)
+    try:
+        ensure_budget("admission", request.url.path)
+    except DeadlineExceeded as e:
+        app_logger.warning(f"请求截止时间不足，拒绝: {request.url.path}, {e}")
+        raise HTTPException(status_code=504, detail=str(e))
@@ -0,0 +1,100 @@
+"""
+客户端断开检测
+浏览器关闭或请求被中止后，继续等待上游模型生成只会白白消耗 token 和连接池中的连接。
+watch_disconnect 依赖在请求期间监听 ASGI 的 http.disconnect 消息，cancel_on_disconnect
+让模型调用（含排队等待）与断开事件竞争：客户端先断开时取消上游请求并关闭连接。
+
+请求体在依赖解析前已被 FastAPI 读完，监听任务之后读到的只会是断开消息，不会与请求体读取冲突。
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from fastapi import Request
+
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.request_context import current_disconnect
+
+T = TypeVar("T")
+
+metrics.describe("upstream_cancelled_total", "客户端断开后被取消的模型调用数")
+metrics.describe("upstream_cancel_saved_tokens_total", "取消时尚未生成的 max_tokens 额度（节省 token 的上限估算）")
+
+
+class ClientDisconnected(Exception):
+    """客户端已断开连接，模型调用被取消"""
+
+
+async def _listen(request: Request, disconnected: asyncio.Event):
+    """等待 http.disconnect 消息（其余消息忽略）"""
+    try:
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+    except Exception as e:
+        # 无法继续监听时只是失去提前取消的能力，不影响请求本身
+        app_logger.debug(f"监听客户端断开失败: {e}")
+
+
+async def watch_disconnect(request: Request) -> AsyncIterator[None]:
+    """请求期间监听客户端断开的依赖，断开事件写入请求上下文"""
+    disconnected = asyncio.Event()
+    current_disconnect.set(disconnected)
+    listener = asyncio.create_task(_listen(request, disconnected))
+    try:
+        yield
+    finally:
+        listener.cancel()
+
+
+async def cancel_on_disconnect(awaitable: Awaitable[T]) -> T:
+    """
+    执行 awaitable，客户端先断开时取消它
+
+    Args:
+        awaitable: 模型调用等可取消的协程
+
+    Returns:
+        awaitable 的结果
+
+    Raises:
+        ClientDisconnected: 客户端已断开，awaitable 已被取消并完成清理
+    """
+    disconnected = current_disconnect.get()
+    if disconnected is None:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    waiter = asyncio.ensure_future(disconnected.wait())
+    try:
+        await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        waiter.cancel()
+
+    if task.done():
+        return task.result()
+
+    task.cancel()
+    # 等待取消完成，确保上游响应已关闭、调度槽位已释放
+    await asyncio.gather(task, return_exceptions=True)
+    raise ClientDisconnected("客户端已断开连接，已取消模型调用")
+
+
+def record_cancellation(endpoint: str, phase: str, saved_tokens: int):
+    """
+    记录一次因客户端断开而取消的模型调用
+
+    Args:
+        endpoint: 接口路径
+        phase: 取消时所处阶段：queued（排队中）或 upstream（已发往上游）
+        saved_tokens: 估算节省的 token 数
+    """
+    metrics.inc("upstream_cancelled_total", endpoint=endpoint, phase=phase)
+    metrics.inc("upstream_cancel_saved_tokens_total", saved_tokens, endpoint=endpoint)
+    app_logger.info(f"客户端已断开，取消模型调用: {endpoint}, 阶段={phase}, 约节省 {saved_tokens} tokens")
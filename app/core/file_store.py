@@ -0,0 +1,56 @@
+"""
+多进程共享的 JSON 文件读写工具
+多个 worker 进程同时读写同一个数据文件时：写入先写临时文件再原子替换，读取方永远看到完整内容；
+读-改-写操作在文件锁内进行，避免并发更新互相覆盖。
+"""
+
+import os
+import json
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 下没有 fcntl，退化为不加锁（仅适合单进程运行）
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    获取数据文件的进程间排他锁
+
+    Args:
+        path: 数据文件路径，锁文件为同目录下的 <path>.lock
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, data: Any, indent: int = 2):
+    """
+    原子写入 JSON 文件
+
+    Args:
+        path: 目标文件路径
+        data: 要写入的数据
+        indent: 缩进空格数，None 表示紧凑格式
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
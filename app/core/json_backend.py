@@ -0,0 +1,73 @@
+"""
+JSON 序列化后端
+统一 API 响应、上游请求体和 SSE 数据块的编解码，优先使用 orjson，不可用时回退到标准库 json。
+通过 JSON_BACKEND 配置选择：auto（默认，有 orjson 则用）、orjson、stdlib。
+"""
+
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.logger import app_logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装 orjson 时回退到标准库
+    orjson = None
+
+
+def _select_backend(name: str) -> str:
+    """根据配置和已安装的依赖确定实际使用的后端"""
+    name = (name or "auto").strip().lower()
+    if name not in ("auto", "orjson", "stdlib"):
+        app_logger.warning(f"未知的 JSON_BACKEND: {name}，使用 auto")
+        name = "auto"
+    if name == "stdlib":
+        return "stdlib"
+    if orjson is None:
+        if name == "orjson":
+            app_logger.warning("JSON_BACKEND=orjson 但未安装 orjson，回退到标准库 json")
+        return "stdlib"
+    return "orjson"
+
+
+BACKEND = _select_backend(settings.json_backend)
+
+# 解码失败时抛出的异常（orjson.JSONDecodeError 是 json.JSONDecodeError 的子类）
+JSONDecodeError = json.JSONDecodeError
+
+if BACKEND == "orjson":
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的 UTF-8 字节"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    def dumps_pretty(obj: Any) -> str:
+        """序列化为带缩进的字符串（用于日志）"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS | orjson.OPT_INDENT_2).decode("utf-8")
+
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的 UTF-8 字节"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+    def dumps_pretty(obj: Any) -> str:
+        """序列化为带缩进的字符串（用于日志）"""
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """反序列化 JSON 文本或 UTF-8 字节"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用当前 JSON 后端渲染的响应类"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -5,51 +5,33 @@
 作者: ZHANGCHAO
 """
 
-import os
-import json
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Optional
 from app.core.logger import app_logger
+from app.core.storage import get_storage
 
-# 模型配置文件路径
-MODELS_CONFIG_FILE = "data/models_config.json"
+# 模型配置在存储后端中的命名空间（JSON 存储时即 data/models_config.json）
+MODELS_CONFIG_NAMESPACE = "models_config"
 
 
 class ModelsConfigManager:
     """模型配置管理器"""
     
     def __init__(self):
-        """初始化配置管理器"""
-        self._ensure_config_file()
+        """初始化配置管理器（不做文件操作，导入模块时保持轻量）"""
     
-    def _ensure_config_file(self):
-        """确保配置文件存在"""
-        os.makedirs(os.path.dirname(MODELS_CONFIG_FILE), exist_ok=True)
-        if not os.path.exists(MODELS_CONFIG_FILE):
-            # 创建默认配置
-            default_config = {
-                "enabled_models": [],
-                "updated_at": None
-            }
-            self._save_config(default_config)
-    
-    def _save_config(self, config: Dict[str, Any]):
-        """保存配置到文件"""
-        try:
-            with open(MODELS_CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-            app_logger.info("模型配置已保存")
-        except Exception as e:
-            app_logger.error(f"保存模型配置失败: {e}")
-            raise
+    def initialize(self):
+        """准备存储（应用启动时调用）"""
+        get_storage().initialize()
     
     def _load_config(self) -> Dict[str, Any]:
-        """从文件加载配置"""
+        """从存储加载配置"""
         try:
-            with open(MODELS_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            config = get_storage().get_namespace(MODELS_CONFIG_NAMESPACE)
         except Exception as e:
             app_logger.error(f"加载模型配置失败: {e}")
-            return {"enabled_models": [], "updated_at": None}
+            config = {}
+        return {"enabled_models": config.get("enabled_models", []), "updated_at": config.get("updated_at")}
     
     def get_enabled_models(self) -> List[Dict[str, Any]]:
         """
@@ -72,18 +54,31 @@ class ModelsConfigManager:
             bool: 是否保存成功
         """
         try:
-            from datetime import datetime
             config = {
                 "enabled_models": models,
                 "updated_at": datetime.now().isoformat()
             }
-            self._save_config(config)
+            # 模型列表与更新时间在同一个事务内写入
+            get_storage().set_values(MODELS_CONFIG_NAMESPACE, config)
             app_logger.info(f"已保存 {len(models)} 个模型配置")
             return True
         except Exception as e:
             app_logger.error(f"保存模型配置失败: {e}")
             return False
     
+    def get_version(self) -> Optional[str]:
+        """
+        获取配置版本（最后更新时间），只读取一个值，用于判断缓存的响应是否仍然有效
+
+        Returns:
+            Optional[str]: 更新时间，尚未保存过配置时返回 None
+        """
+        try:
+            return get_storage().get_value(MODELS_CONFIG_NAMESPACE, "updated_at")
+        except Exception as e:
+            app_logger.error(f"读取模型配置版本失败: {e}")
+            return None
+    
     def get_config_info(self) -> Dict[str, Any]:
         """
         获取配置信息
@@ -95,7 +90,7 @@ class ModelsConfigManager:
         return {
             "total_models": len(config.get("enabled_models", [])),
             "updated_at": config.get("updated_at"),
-            "config_file": MODELS_CONFIG_FILE
+            "config_file": get_storage().location
         }
 
 
@@ -0,0 +1,211 @@
+"""
+运行中实例的按需 CPU 分析
+管理员接口触发，持续指定秒数后返回结果，未分析时不安装任何钩子、不启动线程，没有额外开销：
+
+- sampling（默认）：后台线程按固定间隔读取所有线程的调用栈（sys._current_frames），
+  事件循环线程上正在执行的协程、asyncio.to_thread 的工作线程都会被采到；
+  输出 flamegraph 兼容的折叠栈（collapsed stacks，可直接交给 flamegraph.pl / speedscope），或按函数汇总的文本
+- deterministic：在事件循环线程上启用 cProfile，所有协程都在该线程执行，因此都会被统计
+  （线程池中的阻塞调用不在其中）；输出 pstats 文件（python -m pstats 或 snakeviz 打开），或按累计耗时排序的文本
+
+同一 worker 同时只能进行一次分析；多 worker 部署时只分析处理该请求的 worker（响应头 X-Profile-PID）。
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import marshal
+import sysconfig
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.logger import app_logger
+
+SAMPLING = "sampling"
+DETERMINISTIC = "deterministic"
+
+# 各模式支持的输出格式，第一个为默认
+FORMATS: Dict[str, Tuple[str, ...]] = {
+    SAMPLING: ("collapsed", "text"),
+    DETERMINISTIC: ("pstats", "text"),
+}
+
+# 文本报告列出的函数数
+TEXT_TOP = 40
+
+_SITE_MARKERS = ("site-packages" + os.sep, "dist-packages" + os.sep)
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+
+class ProfilerBusy(Exception):
+    """本 worker 已有分析在进行中"""
+
+
+def _short_path(filename: str) -> str:
+    """缩短文件路径：第三方库从包名开始，标准库相对于其安装目录，项目文件相对于工作目录"""
+    for marker in _SITE_MARKERS:
+        index = filename.rfind(marker)
+        if index >= 0:
+            return filename[index + len(marker):]
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:
+        return filename
+    return filename if relative.startswith("..") else relative
+
+
+class StackSampler:
+    """在后台线程中周期性采集所有线程调用栈的采样器"""
+
+    def __init__(self, interval: float):
+        """
+        Args:
+            interval: 采样间隔（秒）
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cpu-profiler", daemon=True)
+        # 同一个代码对象的帧名只格式化一次
+        self._labels: Dict[object, str] = {}
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(self._label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """折叠栈格式：每行 `线程;外层帧;...;内层帧 次数`"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def text(self) -> str:
+        """按函数汇总：自身采样数（栈顶）与包含子调用的采样数"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        samples = max(1, sum(self.stacks.values()))
+        lines = [f"采样 {self.samples} 次（间隔 {self.interval * 1000:.0f}ms），共 {samples} 个线程栈", ""]
+        lines.append(f"{'self%':>7} {'total%':>7}  function")
+        for frame, count in own.most_common(TEXT_TOP):
+            lines.append(f"{count / samples:>7.1%} {total[frame] / samples:>7.1%}  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+class CPUProfiler:
+    """按需 CPU 分析（每个 worker 同时只进行一次）"""
+
+    def __init__(self):
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def profile(self, mode: str, seconds: float, fmt: Optional[str] = None, interval: float = 0.005) -> Tuple[bytes, str]:
+        """
+        分析本 worker 指定秒数
+
+        Args:
+            mode: sampling / deterministic
+            seconds: 持续时间（秒）
+            fmt: 输出格式，为空时取该模式的默认格式
+            interval: 采样间隔（秒），仅 sampling 模式使用
+
+        Returns:
+            Tuple[bytes, str]: (结果内容, 实际使用的格式)
+
+        Raises:
+            ValueError: 模式或格式不受支持
+            ProfilerBusy: 已有分析在进行中
+        """
+        if mode not in FORMATS:
+            raise ValueError(f"不支持的分析模式: {mode}，可选 {', '.join(FORMATS)}")
+        fmt = fmt or FORMATS[mode][0]
+        if fmt not in FORMATS[mode]:
+            raise ValueError(f"{mode} 模式不支持 {fmt} 格式，可选 {', '.join(FORMATS[mode])}")
+        if self._running:
+            raise ProfilerBusy("本 worker 已有 CPU 分析在进行中，请稍后重试")
+
+        self._running = True
+        started = time.perf_counter()
+        app_logger.info(f"开始 CPU 分析: mode={mode}, seconds={seconds}")
+        try:
+            if mode == SAMPLING:
+                result = await self._sample(seconds, fmt, interval)
+            else:
+                result = await self._trace(seconds, fmt)
+        finally:
+            self._running = False
+        app_logger.info(f"CPU 分析完成: mode={mode}, 耗时 {time.perf_counter() - started:.1f}s, 结果 {len(result)} 字节")
+        return result, fmt
+
+    @staticmethod
+    async def _sample(seconds: float, fmt: str, interval: float) -> bytes:
+        sampler = StackSampler(interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            # join 等待的是一个采样周期，放到线程中避免阻塞事件循环
+            await asyncio.to_thread(sampler.stop)
+        output = sampler.collapsed() if fmt == "collapsed" else sampler.text()
+        return output.encode("utf-8")
+
+    @staticmethod
+    async def _trace(seconds: float, fmt: str) -> bytes:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        if fmt == "pstats":
+            # 与 pstats.Stats.dump_stats 写出的文件格式一致
+            return marshal.dumps(profiler.stats)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(TEXT_TOP)
+        return stream.getvalue().encode("utf-8")
+
+
+# 全局实例
+cpu_profiler = CPUProfiler()
@@ -0,0 +1,265 @@
+"""
+按用户限流（令牌桶）
+每个用户两个令牌桶：
+- 请求数：每秒补充 rps 个，最多积攒 burst 个（允许短时突发）
+- 估算 token 数：每分钟补充 tpm 个，最多积攒 token_burst 个。请求进入时按 JSON 请求体大小预扣估算的
+  prompt token，模型返回实际 usage 后多退少补（允许欠账，欠账期间后续请求需要等待）
+
+任一令牌桶不足时返回 429，并通过 Retry-After 告知需要等待的秒数。
+
+限流档位（tier）通过 RATE_LIMIT_TIERS 配置，管理员可为用户单独指定档位。
+RATE_LIMIT_BACKEND=memory 时令牌桶保存在各 worker 进程内（多 worker 时实际上限为配置值乘以 worker 数）；
+shared 时保存在存储后端（SQLite 事务内原子更新），多个 worker 共享同一组令牌桶。
+"""
+
+import math
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from app.core import json_backend
+from app.core.auth import get_current_user
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.request_context import current_reservation
+from app.core.storage import get_storage
+
+# 未配置 RATE_LIMIT_TIERS 时使用的档位
+DEFAULT_TIERS = {
+    "default": {"rps": 5, "burst": 20, "tpm": 200000},
+    "unlimited": {},
+}
+
+# 用户档位在存储中的命名空间：{username: tier}
+TIER_NAMESPACE = "rate_limit_tiers"
+
+
+@dataclass(frozen=True)
+class RateLimitTier:
+    """限流档位，数值为 0 表示该维度不限制"""
+    name: str
+    rps: float = 0
+    burst: float = 0
+    tpm: float = 0
+    token_burst: float = 0
+
+    @property
+    def request_burst(self) -> float:
+        return self.burst or max(1.0, self.rps)
+
+    @property
+    def tokens_burst(self) -> float:
+        return self.token_burst or self.tpm
+
+
+def parse_tiers(raw: str) -> Dict[str, RateLimitTier]:
+    """
+    解析 RATE_LIMIT_TIERS 配置
+
+    Args:
+        raw: JSON 字符串，形如 {"default": {"rps": 5, "burst": 20, "tpm": 200000}}，为空时使用默认档位
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    data = json_backend.loads(raw) if raw.strip() else DEFAULT_TIERS
+    if not isinstance(data, dict):
+        raise ValueError("RATE_LIMIT_TIERS 必须是 JSON 对象")
+    return {
+        name: RateLimitTier(name=name, **{key: float(value) for key, value in (limits or {}).items()})
+        for name, limits in data.items()
+    }
+
+
+def _take(
+    state: Optional[Tuple[float, float]],
+    rate: float,
+    burst: float,
+    amount: float,
+    debit: float,
+    now: float,
+) -> Tuple[float, float, float]:
+    """
+    令牌桶计算：先按经过的时间补充令牌，再强制扣除 debit（可为负数表示退还），最后尝试取 amount 个令牌
+
+    Args:
+        state: 当前 (tokens, updated_at)，None 表示新桶（满桶）
+        rate: 每秒补充的令牌数
+        burst: 桶容量
+        amount: 本次需要的令牌数
+        debit: 无论成功与否都要扣除的令牌数（实际用量的欠账或退还）
+        now: 当前时间
+
+    Returns:
+        (剩余令牌数, 更新时间, 需要等待的秒数)，等待 0 表示成功取得
+    """
+    tokens = burst if state is None or state[0] is None else min(burst, state[0] + (now - state[1]) * rate)
+    tokens = min(burst, tokens - debit)
+    if tokens >= amount:
+        return tokens - amount, now, 0.0
+    return tokens, now, (amount - tokens) / rate
+
+
+class RateLimiter:
+    """按用户的令牌桶限流器"""
+
+    def __init__(self):
+        self.tiers: Dict[str, RateLimitTier] = {}
+        try:
+            self.tiers = parse_tiers(settings.rate_limit_tiers)
+        except (ValueError, TypeError) as e:
+            app_logger.error(f"RATE_LIMIT_TIERS 配置无效，使用默认档位: {e}")
+            self.tiers = parse_tiers("")
+        self.shared = settings.rate_limit_backend.lower() == "shared"
+        # 进程内令牌桶：key -> [tokens, updated_at, 桶补满的时间]
+        self._buckets: Dict[str, List[float]] = {}
+        self._takes = 0
+        # 尚未计入令牌桶的实际用量差额：username -> tokens（下次请求时一并结算，热路径不做 I/O）
+        self._debts: Dict[str, float] = {}
+        # 用户档位缓存
+        self._user_tiers: Dict[str, str] = {}
+        self._user_tiers_loaded_at = float("-inf")
+
+    # ---------- 档位 ----------
+
+    def default_tier(self) -> RateLimitTier:
+        return self.tiers.get(settings.rate_limit_default_tier) or RateLimitTier(name=settings.rate_limit_default_tier)
+
+    async def tier_for(self, username: str) -> RateLimitTier:
+        """用户所属档位（单独指定优先；档位映射每 10 秒从存储刷新一次）"""
+        if time.monotonic() - self._user_tiers_loaded_at > 10:
+            self._user_tiers = await asyncio.to_thread(get_storage().get_namespace, TIER_NAMESPACE)
+            self._user_tiers_loaded_at = time.monotonic()
+        name = self._user_tiers.get(username)
+        return self.tiers.get(name) if name in self.tiers else self.default_tier()
+
+    def set_user_tier(self, username: str, tier: Optional[str]):
+        """
+        指定用户档位（阻塞调用）
+
+        Args:
+            username: 用户名
+            tier: 档位名称，None 表示恢复默认档位
+
+        Raises:
+            ValueError: 档位不存在
+        """
+        storage = get_storage()
+        if tier is None:
+            storage.delete_value(TIER_NAMESPACE, username)
+        elif tier not in self.tiers:
+            raise ValueError(f"档位不存在: {tier}")
+        else:
+            storage.set_value(TIER_NAMESPACE, username, tier)
+        self._user_tiers_loaded_at = float("-inf")
+
+    # ---------- 令牌桶 ----------
+
+    async def _bucket_take(self, key: str, rate: float, burst: float, amount: float, debit: float = 0) -> float:
+        """从指定令牌桶取令牌，返回需要等待的秒数"""
+        if self.shared:
+            # 多进程共享时使用墙上时钟
+            now = time.time()
+
+            def update(tokens: Optional[float], updated_at: Optional[float]) -> Tuple[float, float, float]:
+                return _take(None if tokens is None else (tokens, updated_at), rate, burst, amount, debit, now)
+
+            return await asyncio.to_thread(get_storage().update_bucket, key, update)
+
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        tokens, updated_at, wait = _take(None if bucket is None else (bucket[0], bucket[1]), rate, burst, amount, debit, now)
+        self._buckets[key] = [tokens, updated_at, now + max(0.0, burst - tokens) / rate]
+        self._takes += 1
+        if self._takes % 1024 == 0:
+            self._sweep(now)
+        return wait
+
+    def _sweep(self, now: float):
+        """清理已补满的进程内令牌桶（与新桶等价），避免用户数很多时无限增长"""
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+
+    async def acquire(self, username: str, estimated_tokens: int = 0) -> float:
+        """
+        请求进入时检查限流
+
+        Args:
+            username: 用户名
+            estimated_tokens: 估算的 prompt token 数（预扣，实际用量返回后结算）
+
+        Returns:
+            需要等待的秒数，0 表示放行
+        """
+        tier = await self.tier_for(username)
+        if tier.rps > 0:
+            wait = await self._bucket_take(f"{username}:requests", tier.rps, tier.request_burst, 1)
+            if wait > 0:
+                return wait
+
+        debt = self._debts.pop(username, 0)
+        if tier.tpm > 0 and (estimated_tokens > 0 or debt):
+            # 单次估算超过桶容量时按桶容量计，避免永远无法放行
+            amount = min(float(estimated_tokens), tier.tokens_burst)
+            wait = await self._bucket_take(f"{username}:tokens", tier.tpm / 60, tier.tokens_burst, amount, debt)
+            if wait > 0:
+                # 未放行的请求退还已扣的请求数令牌
+                if tier.rps > 0:
+                    await self._bucket_take(f"{username}:requests", tier.rps, tier.request_burst, 0, -1)
+                return wait
+        return 0.0
+
+    def settle(self, username: Optional[str], actual_tokens: int):
+        """
+        记录一次调用的实际 token 用量（只更新内存，下次请求时计入令牌桶）
+
+        当前请求有预扣额度时，首次结算抵扣预扣部分，多退少补。
+        """
+        if not username or actual_tokens <= 0:
+            return
+        reservation = current_reservation.get()
+        reserved = 0
+        if reservation is not None:
+            reserved, reservation["tokens"] = reservation["tokens"], 0
+        self._debts[username] = self._debts.get(username, 0) + actual_tokens - reserved
+
+
+def estimate_request_tokens(request: Request) -> int:
+    """
+    按 JSON 请求体大小估算 prompt token 数（multipart 上传的图片等按实际用量事后结算）
+
+    中文在 UTF-8 中每个字约 3 字节、约 1 个 token，RATE_LIMIT_BYTES_PER_TOKEN 默认取 3 偏保守。
+    """
+    if not request.headers.get("content-type", "").startswith("application/json"):
+        return 0
+    try:
+        length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        return 0
+    return length // max(1, settings.rate_limit_bytes_per_token)
+
+
+async def enforce_rate_limit(request: Request, current_user: dict = Depends(get_current_user)):
+    """限流依赖：超过限制时返回 429 与 Retry-After"""
+    if not settings.rate_limit_enabled:
+        return
+    username = current_user["username"]
+    estimated = estimate_request_tokens(request)
+    wait = await rate_limiter.acquire(username, estimated)
+    if wait > 0:
+        retry_after = max(1, math.ceil(wait))
+        app_logger.warning(f"用户 {username} 触发限流: {request.url.path}, {retry_after}s 后重试")
+        raise HTTPException(
+            status_code=429,
+            detail=f"请求过于频繁，请在 {retry_after} 秒后重试",
+            headers={"Retry-After": str(retry_after)},
+        )
+    if estimated:
+        current_reservation.set({"tokens": estimated})
+
+
+# 全局实例
+rate_limiter = RateLimiter()
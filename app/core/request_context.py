@@ -0,0 +1,40 @@
+"""
+请求上下文
+认证依赖解析出当前用户后写入上下文变量，服务层（用量统计等）无需层层传参即可读取。
+上下文变量随 asyncio 任务复制，同一请求内创建的子任务（批量处理、流式响应）也能读到。
+"""
+
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# 当前请求的用户名
+current_username: ContextVar[Optional[str]] = ContextVar("current_username", default=None)
+
+# 当前请求的接口路径
+current_endpoint: ContextVar[Optional[str]] = ContextVar("current_endpoint", default=None)
+
+# 显式指定的调度优先级（interactive / standard / bulk），未指定时调度器按接口路径确定
+current_priority: ContextVar[Optional[str]] = ContextVar("current_priority", default=None)
+
+# 限流时为当前请求预扣的估算 token 数：{"tokens": int}，首次记录实际用量时多退少补
+# （保存可变对象，批量处理等子任务共享同一份预扣额度）
+current_reservation: ContextVar[Optional[Dict[str, int]]] = ContextVar("current_reservation", default=None)
+
+# 客户端断开连接时置位的事件（由 app.core.disconnect.watch_disconnect 设置），模型调用据此提前取消
+current_disconnect: ContextVar[Optional[asyncio.Event]] = ContextVar("current_disconnect", default=None)
+
+# 请求截止时间（time.monotonic() 时刻，由 app.core.deadline.apply_deadline 设置），排队与上游调用不得超过
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+def bind_request(username: Optional[str], endpoint: Optional[str]):
+    """
+    记录当前请求的用户与接口
+
+    Args:
+        username: 用户名
+        endpoint: 接口路径
+    """
+    current_username.set(username)
+    current_endpoint.set(endpoint)
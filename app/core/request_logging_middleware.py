@@ -6,12 +6,12 @@
 """
 
 import time
-import json
 from typing import Callable
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import StreamingResponse
 from app.core.logger import app_logger
+from app.core import json_backend
 
 
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
@@ -61,18 +61,25 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             # 请求体
             if request.method in ["POST", "PUT", "PATCH"]:
                 try:
+                    original_receive = request._receive
                     body = await request.body()
-                    
-                    # 重置请求体以便后续处理
+                    body_replayed = False
+
+                    # 重放已读取的请求体以便后续处理；之后转交原始 receive，
+                    # 否则下游永远收不到 http.disconnect，无法感知客户端断开
                     async def receive():
-                        return {"type": "http.request", "body": body}
+                        nonlocal body_replayed
+                        if not body_replayed:
+                            body_replayed = True
+                            return {"type": "http.request", "body": body, "more_body": False}
+                        return await original_receive()
                     request._receive = receive
                     
                     if body:
                         content_type = request.headers.get("content-type", "")
                         if "application/json" in content_type:
                             try:
-                                log_data["body"] = json.loads(body.decode())
+                                log_data["body"] = json_backend.loads(body)
                             except Exception:
                                 log_data["body"] = body.decode()[:500]
                         elif "multipart/form-data" in content_type:
@@ -90,11 +97,11 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             app_logger.info(f"  客户端: {log_data['client']}")
             
             if "query_params" in log_data:
-                app_logger.info(f"  查询参数: {json.dumps(log_data['query_params'], ensure_ascii=False)}")
+                app_logger.info(f"  查询参数: {json_backend.dumps(log_data['query_params']).decode('utf-8')}")
             
             if "body" in log_data:
                 if isinstance(log_data['body'], dict):
-                    app_logger.info(f"  请求体: {json.dumps(log_data['body'], ensure_ascii=False, indent=2)}")
+                    app_logger.info(f"  请求体: {json_backend.dumps_pretty(log_data['body'])}")
                 else:
                     app_logger.info(f"  请求体: {log_data['body']}")
                     
@@ -122,7 +129,7 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             response_data = None
             if response_body:
                 try:
-                    response_data = json.loads(response_body.decode())
+                    response_data = json_backend.loads(response_body)
                 except Exception:
                     response_data = response_body.decode()[:500]
 
@@ -133,7 +140,7 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 
             if response_data:
                 if isinstance(response_data, dict):
-                    app_logger.info(f"  响应体: {json.dumps(response_data, ensure_ascii=False, indent=2)}")
+                    app_logger.info(f"  响应体: {json_backend.dumps_pretty(response_data)}")
                 else:
                     app_logger.info(f"  响应体: {response_data}")
 
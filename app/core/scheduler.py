@@ -0,0 +1,287 @@
+"""
+上游调用调度器
+所有模型调用（PureAIService.call_ai）在发往上游前先申请一个并发槽位，槽位已满时排队：
+- 三个优先级：interactive（对话、快速调用）> standard（其他接口）> bulk（批量处理），高优先级总是先出队
+- 同一优先级内按用户做加权公平排队（WFQ）：每个请求的虚拟完成时间 = max(队列虚拟时间, 该用户上一个请求的完成时间) + 1，
+  取最小者出队，单个用户一次提交大量任务时不会挤占其他用户
+- bulk 同时占用的槽位有上限（默认一半），保证交互请求总能拿到空闲槽位
+- 排队已满时，交互/普通请求会抢占最后进入队列、尚未开始执行的 bulk 任务（被抢占的任务返回失败），否则拒绝新请求
+
+每个优先级的排队耗时、排队长度与运行数记录在 app.core.metrics 中。
+"""
+
+import time
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.request_context import current_endpoint, current_priority, current_username
+
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BULK = "bulk"
+
+# 按优先级从高到低
+PRIORITIES = (INTERACTIVE, STANDARD, BULK)
+
+# 接口路径（/api/v1 之后的部分）对应的优先级，未列出的接口为 standard
+ENDPOINT_PRIORITIES = {
+    "/ai/chat": INTERACTIVE,
+    "/ai/quick": INTERACTIVE,
+    "/messages": INTERACTIVE,  # /ai/sessions/{session_id}/messages
+    "/ws/chat": INTERACTIVE,
+    "/ai/batch": BULK,
+}
+
+metrics.describe("scheduler_queue_wait_seconds", "模型调用在调度队列中的等待时间")
+metrics.describe("scheduler_queued", "当前排队的模型调用数")
+metrics.describe("scheduler_running", "当前占用槽位的模型调用数")
+metrics.describe("scheduler_rejected_total", "因排队已满被拒绝或被抢占的模型调用数")
+
+
+class SchedulerRejected(Exception):
+    """排队已满被拒绝，或排队中被高优先级请求抢占"""
+
+
+def classify(endpoint: Optional[str] = None) -> str:
+    """
+    确定当前调用的优先级：请求上下文中显式指定的优先，否则按接口路径
+
+    Args:
+        endpoint: 接口路径，默认取当前请求上下文
+    """
+    priority = current_priority.get()
+    if priority in PRIORITIES:
+        return priority
+    endpoint = endpoint if endpoint is not None else current_endpoint.get()
+    if endpoint:
+        for suffix, mapped in ENDPOINT_PRIORITIES.items():
+            if endpoint.endswith(suffix):
+                return mapped
+    return STANDARD
+
+
+class _Waiter:
+    """排队中的调用"""
+
+    __slots__ = ("priority", "username", "finish", "seq", "future", "removed", "enqueued_at")
+
+    def __init__(self, priority: str, username: str, finish: float, seq: int):
+        self.priority = priority
+        self.username = username
+        self.finish = finish
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.removed = False
+        self.enqueued_at = time.perf_counter()
+
+
+class PriorityScheduler:
+    """优先级 + 用户公平排队的并发槽位调度器（单个事件循环内使用）"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, bulk_max_running: int = 0):
+        """
+        Args:
+            max_concurrency: 并发槽位数，0 表示不限制（直接放行）
+            max_queue: 最多排队数
+            bulk_max_running: bulk 最多同时占用的槽位数，0 表示槽位数的一半
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.bulk_max_running = bulk_max_running or max(1, max_concurrency // 2)
+        self.running: Dict[str, int] = dict.fromkeys(PRIORITIES, 0)
+        self._queues: Dict[str, List[Tuple[float, int, _Waiter]]] = {priority: [] for priority in PRIORITIES}
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        # WFQ 状态：每个优先级的虚拟时间、每个 (优先级, 用户) 最后一个请求的虚拟完成时间
+        self._virtual_time = dict.fromkeys(PRIORITIES, 0.0)
+        self._user_finish: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        # 每个优先级自上次取样以来的最小排队时间，供准入控制判断是否存在持续排队
+        self._min_wait: Dict[str, Optional[float]] = dict.fromkeys(PRIORITIES)
+
+    @property
+    def total_running(self) -> int:
+        return sum(self.running.values())
+
+    @property
+    def total_queued(self) -> int:
+        return sum(self._queued.values())
+
+    def _can_run(self, priority: str) -> bool:
+        if self.total_running >= self.max_concurrency:
+            return False
+        return priority != BULK or self.running[BULK] < self.bulk_max_running
+
+    def _start(self, priority: str):
+        self.running[priority] += 1
+        metrics.set("scheduler_running", self.running[priority], priority=priority)
+
+    def _update_queued(self, priority: str, delta: int):
+        self._queued[priority] += delta
+        metrics.set("scheduler_queued", self._queued[priority], priority=priority)
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, username: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        申请一个上游调用槽位，退出时释放
+
+        Args:
+            priority: 优先级，默认按请求上下文确定
+            username: 用户名，默认取请求上下文
+
+        Raises:
+            SchedulerRejected: 排队已满或排队中被抢占
+        """
+        if self.max_concurrency <= 0:
+            yield
+            return
+
+        priority = priority or classify()
+        username = username or current_username.get() or "-"
+        started = time.perf_counter()
+
+        if not self.total_queued and self._can_run(priority):
+            self._start(priority)
+        else:
+            waiter = self._enqueue(priority, username)
+            # 队列中可能只有受 bulk 槽位上限阻塞的任务，新请求有空闲槽位时立即放行
+            self._dispatch()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                    # 已分配到槽位但调用方被取消，交还槽位
+                    self._release(priority)
+                else:
+                    self._discard(waiter)
+                raise
+
+        wait = time.perf_counter() - started
+        metrics.observe("scheduler_queue_wait_seconds", wait, priority=priority)
+        previous = self._min_wait[priority]
+        self._min_wait[priority] = wait if previous is None else min(previous, wait)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def take_min_wait(self, priority: str) -> Optional[float]:
+        """
+        取出并重置该优先级自上次调用以来的最小排队时间
+
+        Returns:
+            Optional[float]: 最小排队秒数，期间没有调用获得槽位时返回 None
+        """
+        value = self._min_wait[priority]
+        self._min_wait[priority] = None
+        return value
+
+    def oldest_wait(self, priority: str) -> float:
+        """该优先级队列中等待最久的调用已等待的秒数，队列为空时返回 0"""
+        now = time.perf_counter()
+        waits = [now - waiter.enqueued_at for _, _, waiter in self._queues[priority] if not waiter.removed]
+        return max(waits, default=0.0)
+
+    def queued(self, priority: str) -> int:
+        """该优先级当前排队数"""
+        return self._queued[priority]
+
+    def _enqueue(self, priority: str, username: str) -> _Waiter:
+        """加入所属优先级的公平队列，排队已满时抢占或拒绝"""
+        if self.total_queued >= self.max_queue:
+            if priority != BULK and self._queued[BULK]:
+                self._preempt_bulk()
+            else:
+                metrics.inc("scheduler_rejected_total", priority=priority, reason="queue_full")
+                raise SchedulerRejected("服务繁忙，排队已满，请稍后重试")
+
+        key = (priority, username)
+        start = max(self._virtual_time[priority], self._user_finish.get(key, 0.0))
+        finish = start + 1.0
+        self._user_finish[key] = finish
+        waiter = _Waiter(priority, username, finish, next(self._seq))
+        heapq.heappush(self._queues[priority], (finish, waiter.seq, waiter))
+        self._update_queued(priority, 1)
+        return waiter
+
+    def _preempt_bulk(self):
+        """抢占最后进入队列、尚未开始执行的 bulk 任务"""
+        queue = self._queues[BULK]
+        pending = [entry for entry in queue if not entry[2].removed]
+        victim = max(pending, key=lambda entry: entry[1])[2]
+        victim.future.set_exception(SchedulerRejected("排队中的批量任务被高优先级请求抢占，请稍后重试"))
+        self._discard(victim)
+        metrics.inc("scheduler_rejected_total", priority=BULK, reason="preempted")
+        app_logger.warning(f"排队已满，抢占用户 {victim.username} 的批量任务")
+
+    def _discard(self, waiter: _Waiter):
+        """从队列中移除（惰性删除：出队时跳过已移除的任务）"""
+        if waiter.removed:
+            return
+        waiter.removed = True
+        self._update_queued(waiter.priority, -1)
+        self._rollback_finish(waiter)
+        queue = self._queues[waiter.priority]
+        # 队首就是被移除的任务时顺便弹出，其余的等出队时跳过
+        while queue and queue[0][2].removed:
+            heapq.heappop(queue)
+
+    def _rollback_finish(self, waiter: _Waiter):
+        """未执行的请求不计入用户的虚拟完成时间"""
+        key = (waiter.priority, waiter.username)
+        if self._user_finish.get(key) == waiter.finish:
+            previous = waiter.finish - 1.0
+            if previous <= self._virtual_time[waiter.priority]:
+                del self._user_finish[key]
+            else:
+                self._user_finish[key] = previous
+
+    def _release(self, priority: str):
+        """释放槽位并按优先级唤醒排队的调用"""
+        self.running[priority] -= 1
+        metrics.set("scheduler_running", self.running[priority], priority=priority)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.total_running < self.max_concurrency:
+            waiter = self._pop_next()
+            if waiter is None:
+                return
+            self._start(waiter.priority)
+            waiter.future.set_result(None)
+
+    def _pop_next(self) -> Optional[_Waiter]:
+        """取出下一个可以执行的调用：优先级从高到低，同一优先级按虚拟完成时间"""
+        for priority in PRIORITIES:
+            if not self._can_run(priority):
+                continue
+            queue = self._queues[priority]
+            while queue:
+                finish, _, waiter = heapq.heappop(queue)
+                if waiter.removed:
+                    continue
+                if waiter.future.done():
+                    # 等待方已被取消（如超过截止时间）但尚未运行到清理逻辑，不能再分配槽位
+                    self._discard(waiter)
+                    continue
+                waiter.removed = True
+                self._update_queued(priority, -1)
+                self._virtual_time[priority] = finish
+                if self._user_finish.get((priority, waiter.username)) == finish:
+                    # 该用户已没有排队的请求，清理状态避免无限增长
+                    del self._user_finish[(priority, waiter.username)]
+                return waiter
+        return None
+
+
+# 全局实例
+scheduler = PriorityScheduler(
+    settings.scheduler_max_concurrency,
+    settings.scheduler_max_queue,
+    settings.scheduler_bulk_max_running,
+)
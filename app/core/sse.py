@@ -0,0 +1,177 @@
+"""
+SSE（Server-Sent Events）增量解析器
+直接处理原始字节块，按规范支持多行 data 字段、注释行以及 \\n、\\r\\n、\\r 三种换行，
+并提供面向 Chat Completions 流式增量的快速提取。
+"""
+
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Any, Dict, List, Optional
+
+from app.core import json_backend
+
+
+@dataclass(slots=True)
+class SSEEvent:
+    """一条完整的 SSE 事件"""
+    data: str
+    event: str = "message"
+    id: Optional[str] = None
+    retry: Optional[int] = None
+
+
+@dataclass(slots=True)
+class ChatDelta:
+    """Chat Completions 流式数据块中的关键字段"""
+    content: Optional[str] = None
+    finish_reason: Optional[str] = None
+    model: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+
+
+class SSEDecoder:
+    """增量 SSE 解码器，可多次 feed 任意切分的字节块"""
+
+    def __init__(self):
+        self._buffer = b""
+        self._data_lines: List[str] = []
+        self._event_type = ""
+        self._last_event_id: Optional[str] = None
+        self._retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        输入一个字节块，返回其中已完整的事件
+
+        Args:
+            chunk: 原始字节块，可以在任意位置切分（包括多字节字符中间）
+
+        Returns:
+            List[SSEEvent]: 本次解析出的完整事件
+        """
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            # 末尾的 \r 可能与下一块开头的 \n 组成 \r\n，先保留
+            held = b""
+            if buffer.endswith(b"\r"):
+                buffer, held = buffer[:-1], b"\r"
+            buffer = buffer.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            lines = buffer.split(b"\n")
+            self._buffer = lines.pop() + held
+        else:
+            lines = buffer.split(b"\n")
+            self._buffer = lines.pop()
+
+        events: List[SSEEvent] = []
+        data_lines = self._data_lines
+        for line in lines:
+            if not line:
+                event = self._dispatch()
+                if event is not None:
+                    events.append(event)
+                data_lines = self._data_lines
+            elif line.startswith(b"data: "):
+                # 快速路径：绝大多数行都是 "data: {...}"
+                data_lines.append(line[6:].decode("utf-8", errors="replace"))
+            else:
+                self._process_line(line)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """
+        流结束时处理剩余数据
+
+        规范要求丢弃未以空行结束的事件，这里为兼容不规范的上游，仍然派发已收集到的 data。
+        """
+        events: List[SSEEvent] = []
+        if self._buffer:
+            line = self._buffer.rstrip(b"\r")
+            self._buffer = b""
+            if line:
+                self._process_line(line)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _process_line(self, line: bytes):
+        """处理一行非空内容"""
+        # 以冒号开头的是注释（常用于心跳）
+        if line[0] == 0x3A:
+            return
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+
+        if field == b"data":
+            self._data_lines.append(value.decode("utf-8", errors="replace"))
+        elif field == b"event":
+            self._event_type = value.decode("utf-8", errors="replace")
+        elif field == b"id":
+            if b"\x00" not in value:
+                self._last_event_id = value.decode("utf-8", errors="replace")
+        elif field == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        # 其他字段按规范忽略
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        """空行触发事件派发"""
+        if not self._data_lines:
+            self._event_type = ""
+            return None
+        data = self._data_lines[0] if len(self._data_lines) == 1 else "\n".join(self._data_lines)
+        event = SSEEvent(
+            data=data,
+            event=self._event_type or "message",
+            id=self._last_event_id,
+            retry=self._retry,
+        )
+        self._data_lines = []
+        self._event_type = ""
+        return event
+
+
+async def aiter_sse(byte_stream: AsyncIterable[bytes]) -> AsyncIterator[SSEEvent]:
+    """
+    把异步字节流转换为 SSE 事件流
+
+    Args:
+        byte_stream: 原始字节块的异步迭代器，如 httpx.Response.aiter_bytes()
+
+    Yields:
+        SSEEvent: 解析出的事件
+    """
+    decoder = SSEDecoder()
+    async for chunk in byte_stream:
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.flush():
+        yield event
+
+
+def parse_chat_chunk(data: str) -> Optional[ChatDelta]:
+    """
+    从 Chat Completions 流式数据块中提取增量
+
+    Args:
+        data: 事件的 data 字段（JSON 字符串）
+
+    Returns:
+        Optional[ChatDelta]: 提取结果，JSON 无效时返回None
+    """
+    try:
+        payload = json_backend.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+
+    delta = ChatDelta(model=payload.get("model"), usage=payload.get("usage"))
+    choices = payload.get("choices")
+    if choices:
+        choice = choices[0]
+        delta.finish_reason = choice.get("finish_reason")
+        content = (choice.get("delta") or {}).get("content")
+        if content is not None:
+            delta.content = content
+    return delta
@@ -0,0 +1,160 @@
+"""
+启动耗时分析
+- 记录从导入 main 开始各启动阶段的耗时（模块导入、应用构建、lifespan 就绪），开销可忽略
+- 设置环境变量 PROFILE_IMPORTS=true 时安装导入计时钩子，启动完成后输出类似
+  `python -X importtime` 的报告：每个模块的自身耗时与累计耗时（含其导入的子模块）
+
+本模块只依赖标准库，需要在 main.py 中最先导入，才能统计到后续所有模块。
+"""
+
+import os
+import sys
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_START = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+
+
+def mark(phase: str):
+    """记录一个启动阶段完成的时间点（同名阶段只记录第一次，如 python main.py 时 main 会被导入两次）"""
+    if all(name != phase for name, _ in _phases):
+        _phases.append((phase, time.perf_counter()))
+
+
+def phase_durations() -> List[Tuple[str, float]]:
+    """
+    各阶段耗时
+
+    Returns:
+        List[Tuple[str, float]]: (阶段名, 该阶段耗时毫秒)，最后一项为总耗时
+    """
+    result = []
+    previous = _START
+    for phase, at in _phases:
+        result.append((phase, (at - previous) * 1000))
+        previous = at
+    result.append(("total", (previous - _START) * 1000))
+    return result
+
+
+class _TimedLoader:
+    """包装模块加载器，统计 exec_module 的耗时"""
+
+    def __init__(self, loader: Any, profiler: "ImportProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._name)
+            # 恢复原始加载器，避免影响依赖加载器类型的代码
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class ImportProfiler:
+    """通过 sys.meta_path 钩子统计模块导入耗时"""
+
+    def __init__(self):
+        # 模块名 -> [自身耗时, 累计耗时（秒）, 导入嵌套深度]
+        self.timings: Dict[str, List[float]] = {}
+        self._stack: List[List[Any]] = []
+        self._local = threading.local()
+
+    def install(self):
+        """安装到 sys.meta_path 最前面"""
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        """移除导入钩子"""
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        # 委托给其余查找器，只替换找到的加载器
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self, fullname)
+                    return spec
+            return None
+        finally:
+            self._local.finding = False
+
+    def _enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name: str):
+        _, started, children = self._stack.pop()
+        cumulative = time.perf_counter() - started
+        if self._stack:
+            self._stack[-1][2] += cumulative
+        self.timings[name] = [cumulative - children, cumulative, len(self._stack)]
+
+    def report(self, top: int = 30) -> str:
+        """
+        生成导入耗时报告
+
+        Args:
+            top: 输出累计耗时最长的前 N 个模块
+
+        Returns:
+            str: 格式与 -X importtime 类似的多行文本
+        """
+        rows = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        total_self = sum(timing[0] for timing in self.timings.values())
+        lines = [
+            f"导入模块 {len(self.timings)} 个，自身耗时合计 {total_self * 1000:.1f}ms，累计耗时最长的 {len(rows)} 个：",
+            f"{'self [us]':>12} | {'cumulative':>12} | imported package",
+        ]
+        for name, (self_time, cumulative, depth) in rows:
+            lines.append(f"{self_time * 1e6:>12.0f} | {cumulative * 1e6:>12.0f} | {'  ' * depth}{name}")
+        return "\n".join(lines)
+
+
+profiler: Optional[ImportProfiler] = None
+
+
+def install_if_enabled() -> Optional[ImportProfiler]:
+    """PROFILE_IMPORTS=true 时安装导入计时钩子"""
+    global profiler
+    if os.getenv("PROFILE_IMPORTS", "false").lower() == "true" and profiler is None:
+        profiler = ImportProfiler()
+        profiler.install()
+    return profiler
+
+
+def log_report(logger):
+    """
+    输出启动耗时（启用导入分析时附带导入耗时报告）
+
+    Args:
+        logger: 日志记录器
+    """
+    durations = phase_durations()
+    summary = ", ".join(f"{phase} {elapsed:.0f}ms" for phase, elapsed in durations[:-1])
+    logger.info(f"启动耗时 {durations[-1][1]:.0f}ms（{summary}）")
+    if profiler is not None:
+        profiler.uninstall()
+        logger.info(profiler.report(int(os.getenv("PROFILE_IMPORTS_TOP", "30"))))
@@ -0,0 +1,217 @@
+"""
+前端静态资源服务
+在 Starlette StaticFiles 基础上增加：
+- 启动时扫描目录，预先计算每个文件的强 ETag（内容摘要）、Content-Type 与缓存策略
+- 按 Accept-Encoding 选择预压缩版本：优先使用构建产物中已有的 .br / .gz 文件，
+  缺失时在启动阶段生成（brotli 需要安装可选依赖 brotli，否则只生成 gzip）
+- 带内容哈希的文件名（如 assets/index-4f3a2b1c.js）返回 `Cache-Control: immutable`，
+  其他文件（index.html 等）返回 `no-cache`，由 If-None-Match 协商后返回 304
+- 小文件及生成的压缩版本在内存预算内常驻内存，命中时不再读磁盘
+
+启动后新增的文件、目录跳转与 404 仍交给 StaticFiles 原有逻辑处理。
+"""
+
+import os
+import re
+import time
+import hashlib
+import mimetypes
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.compression import accepted_encodings, compress, is_compressible
+from app.core.conditional import etag_matches
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 按优先级排列的内容编码及对应的预压缩文件后缀
+ENCODINGS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"))
+_ENCODING_NAMES = tuple(name for name, _ in ENCODINGS)
+
+# 压缩后至少要比原文件小这么多才保留
+_MIN_RATIO = 0.9
+
+
+class StaticAsset:
+    """一个静态文件及其可用的压缩版本"""
+
+    __slots__ = ("path", "media_type", "cache_control", "etag", "last_modified", "body", "variants")
+
+    def __init__(self, path: str, media_type: str, cache_control: str, etag: str, last_modified: str):
+        self.path = path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = etag
+        self.last_modified = last_modified
+        # 原始内容（仅在内存预算内缓存时存在）
+        self.body: Optional[bytes] = None
+        # 编码 -> (磁盘路径或 None, 内存中的内容或 None, ETag)
+        self.variants: Dict[str, Tuple[Optional[str], Optional[bytes], str]] = {}
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """支持预压缩、强 ETag 与长期缓存的 StaticFiles"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._assets: Dict[str, StaticAsset] = {}
+        self._immutable = re.compile(settings.static_immutable_pattern) if settings.static_immutable_pattern else None
+        self._prepared = False
+
+    def prepare(self):
+        """
+        扫描目录并预先计算所有文件的元数据与压缩版本（阻塞操作，启动时在线程中调用）
+
+        同一实例可以挂载到多个路径，只需准备一次。
+        """
+        started = time.perf_counter()
+        budget = int(settings.static_memory_cache_mb * 1024 * 1024)
+        max_file = settings.static_memory_max_file_kb * 1024
+        assets: Dict[str, StaticAsset] = {}
+        used = 0
+        generated = 0
+
+        for key, full_path in self._walk():
+            try:
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                mtime = os.stat(full_path).st_mtime
+            except OSError as e:
+                app_logger.warning(f"读取静态文件失败 {full_path}: {e}")
+                continue
+
+            media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            asset = StaticAsset(
+                path=full_path,
+                media_type=media_type,
+                cache_control=self._cache_control(key),
+                etag=f'"{digest}"',
+                last_modified=formatdate(mtime, usegmt=True),
+            )
+            if len(data) <= max_file and used + len(data) <= budget:
+                asset.body = data
+                used += len(data)
+
+            if is_compressible(media_type) and len(data) >= settings.static_min_compress_size:
+                for encoding, suffix in ENCODINGS:
+                    etag = f'"{digest}-{encoding}"'
+                    sibling = full_path + suffix
+                    if os.path.isfile(sibling):
+                        # 构建产物中已有的预压缩文件：小文件读入内存，否则从磁盘发送
+                        content = None
+                        size = os.path.getsize(sibling)
+                        if size <= max_file and used + size <= budget:
+                            with open(sibling, "rb") as f:
+                                content = f.read()
+                            used += size
+                        asset.variants[encoding] = (sibling, content, etag)
+                    elif settings.static_precompress:
+                        content = self._compress(data, encoding)
+                        if content is not None and len(content) <= len(data) * _MIN_RATIO and used + len(content) <= budget:
+                            asset.variants[encoding] = (None, content, etag)
+                            used += len(content)
+                            generated += 1
+            assets[key] = asset
+
+        self._assets = assets
+        self._prepared = True
+        app_logger.info(
+            f"静态资源预处理完成: {len(assets)} 个文件，生成压缩版本 {generated} 个，"
+            f"内存缓存 {used / 1024 / 1024:.1f}MB，耗时 {(time.perf_counter() - started) * 1000:.0f}ms"
+            + ("" if brotli is not None else "（未安装 brotli，仅生成 gzip）")
+        )
+
+    def _walk(self):
+        """遍历目录中的文件，返回 (相对路径键, 完整路径)；跳过已有原文件的 .br/.gz"""
+        root = str(self.directory)
+        for dirpath, _, filenames in os.walk(root, followlinks=self.follow_symlink):
+            names = set(filenames)
+            for name in filenames:
+                stem, ext = os.path.splitext(name)
+                if ext in (".br", ".gz") and stem in names:
+                    continue
+                full_path = os.path.join(dirpath, name)
+                key = os.path.relpath(full_path, root).replace(os.sep, "/")
+                yield key, full_path
+
+    def _cache_control(self, key: str) -> str:
+        """带内容哈希的文件名可长期缓存，其余文件每次都需要协商"""
+        if self._immutable is not None and self._immutable.search(key):
+            return f"public, max-age={settings.static_max_age}, immutable"
+        return "no-cache"
+
+    @staticmethod
+    def _compress(data: bytes, encoding: str) -> Optional[bytes]:
+        """以最高级别生成压缩版本（只在启动时执行一次）"""
+        if encoding == "br" and brotli is None:
+            return None
+        return compress(data, encoding, level=11 if encoding == "br" else 9)
+
+    def _lookup(self, path: str, scope: Scope) -> Optional[StaticAsset]:
+        """在预处理的索引中查找请求路径，HTML 模式下目录请求返回其 index.html"""
+        key = path.replace(os.sep, "/")
+        if key in (".", ""):
+            key = ""
+        asset = self._assets.get(key)
+        if asset is None and self.html and scope["path"].endswith("/"):
+            asset = self._assets.get(f"{key}/index.html" if key else "index.html")
+        return asset
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """
+        返回静态文件响应；索引中没有的路径交给 StaticFiles 原有逻辑
+
+        Args:
+            path: get_path 规范化后的相对路径
+            scope: ASGI scope
+
+        Returns:
+            Response: 200 / 304 响应，或父类的跳转与 404 处理结果
+        """
+        asset = self._lookup(path, scope) if self._prepared and scope["method"] in ("GET", "HEAD") else None
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        request_headers = {k: v for k, v in scope["headers"] if k in (b"accept-encoding", b"if-none-match")}
+        encoding = None
+        if asset.variants:
+            accept = request_headers.get(b"accept-encoding", b"").decode("latin-1")
+            encoding = next((e for e in accepted_encodings(accept, _ENCODING_NAMES) if e in asset.variants), None)
+
+        etag = asset.variants[encoding][2] if encoding else asset.etag
+        headers = {
+            "etag": etag,
+            "cache-control": asset.cache_control,
+            "last-modified": asset.last_modified,
+        }
+        if asset.variants:
+            headers["vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get(b"if-none-match")
+        # 压缩中间件会去掉 If-None-Match 中的编码后缀，因此原始表示的 ETag 同样视为命中
+        if if_none_match is not None and (
+            etag_matches(if_none_match.decode("latin-1"), etag)
+            or etag_matches(if_none_match.decode("latin-1"), asset.etag)
+        ):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["content-encoding"] = encoding
+            disk_path, content, _ = asset.variants[encoding]
+        else:
+            disk_path, content = asset.path, asset.body
+
+        if content is not None:
+            # HEAD 请求的响应体由服务器丢弃
+            return Response(content=content, media_type=asset.media_type, headers=headers)
+        return FileResponse(disk_path, media_type=asset.media_type, headers=headers, method=scope["method"])
@@ -0,0 +1,658 @@
+"""
+持久化存储层
+用户、模型配置等运行时状态统一通过 StorageBackend 读写，后端可通过 STORAGE_BACKEND 切换：
+- sqlite（默认）：单个 SQLite 数据库文件，WAL 模式下多个 worker 进程可同时读、串行写；
+  按主键索引查询，用户数增长到数万时登录/鉴权的查询耗时基本不变；写操作在事务内完成。
+  首次启动时自动把已有的 data/users.json、data/models_config.json 一次性导入数据库。
+- json：沿用原有的 JSON 文件存储（文件锁 + 原子替换），适合不方便使用 SQLite 的环境。
+
+后端方法都是同步阻塞调用（SQLite 每个线程持有独立连接），在异步代码中请通过
+asyncio.to_thread 调用，避免阻塞事件循环。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core import json_backend
+from app.core.logger import app_logger
+from app.core.file_store import file_lock, write_json_atomic
+
+# JSON 存储的数据目录（也是迁移到 SQLite 时读取旧文件的位置）
+DATA_DIR = "data"
+USERS_FILE = "users.json"
+USAGE_FILE = "usage.json"
+RATE_BUCKETS_FILE = "rate_buckets.json"
+
+# 需要从 JSON 文件迁移到 SQLite 的键值命名空间（文件名为 <namespace>.json）
+MIGRATED_NAMESPACES = ("models_config",)
+
+# 用户记录的字段
+USER_FIELDS = ("username", "nickname", "password_hash", "created_at")
+
+# 用量记录的字段（前四项为聚合维度）
+USAGE_FIELDS = ("day", "username", "model", "endpoint", "prompt_tokens", "completion_tokens", "total_tokens", "requests")
+
+
+class StorageBackend(ABC):
+    """存储后端接口"""
+
+    name: str = ""
+
+    @property
+    @abstractmethod
+    def location(self) -> str:
+        """存储位置（数据库文件或数据目录），用于展示"""
+
+    def initialize(self):
+        """准备存储（建表、迁移等），可重复调用"""
+
+    def close(self):
+        """释放当前线程持有的资源"""
+
+    # ---------- 用户 ----------
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        按用户名查询用户
+
+        Args:
+            username: 用户名
+
+        Returns:
+            用户记录（包含 password_hash），不存在返回 None
+        """
+
+    def user_exists(self, username: str) -> bool:
+        """用户是否存在"""
+        return self.get_user(username) is not None
+
+    @abstractmethod
+    def insert_user(self, record: Dict[str, Any]) -> bool:
+        """
+        新增用户
+
+        Args:
+            record: 用户记录，包含 USER_FIELDS 中的字段
+
+        Returns:
+            是否新增成功（用户名已存在时返回 False）
+        """
+
+    @abstractmethod
+    def update_user(self, username: str, fields: Dict[str, Any], expected: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        更新用户字段
+
+        Args:
+            username: 用户名
+            fields: 要更新的字段
+            expected: 可选的前置条件，只有当前值与之相同时才更新（用于修改密码等比较后再写的场景）
+
+        Returns:
+            是否更新成功
+        """
+
+    @abstractmethod
+    def list_usernames(self) -> List[str]:
+        """所有用户名"""
+
+    @abstractmethod
+    def import_users(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        批量导入用户，已存在的用户名保持不变
+
+        Returns:
+            实际导入的用户数
+        """
+
+    # ---------- 键值（模型配置等运行时状态） ----------
+
+    @abstractmethod
+    def get_namespace(self, namespace: str) -> Dict[str, Any]:
+        """读取命名空间下的全部键值"""
+
+    @abstractmethod
+    def set_values(self, namespace: str, values: Dict[str, Any]):
+        """在一个事务内写入命名空间下的多个键值"""
+
+    @abstractmethod
+    def delete_value(self, namespace: str, key: str) -> bool:
+        """删除一个键，返回键是否存在"""
+
+    def get_value(self, namespace: str, key: str, default: Any = None) -> Any:
+        """读取单个键值"""
+        return self.get_namespace(namespace).get(key, default)
+
+    def set_value(self, namespace: str, key: str, value: Any):
+        """写入单个键值"""
+        self.set_values(namespace, {key: value})
+
+    @abstractmethod
+    def update_value(self, namespace: str, key: str, update: Callable[[Optional[Any]], Tuple[Optional[Any], Any]]) -> Any:
+        """
+        原子地读-改-写一个键值（多 worker 之间串行）
+
+        Args:
+            namespace: 命名空间
+            key: 键
+            update: 接收当前值（不存在时为 None），返回 (新值, 结果)；新值为 None 时不写入
+
+        Returns:
+            update 返回的结果
+        """
+
+    # ---------- token 用量 ----------
+
+    @abstractmethod
+    def add_usage(self, rows: Iterable[Tuple]):
+        """
+        累加 token 用量
+
+        Args:
+            rows: (day, username, model, endpoint, prompt_tokens, completion_tokens, total_tokens, requests) 元组
+        """
+
+    @abstractmethod
+    def query_usage(self, start_day: str, end_day: str, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询日期范围内（含首尾，YYYY-MM-DD）的用量明细
+
+        Args:
+            start_day: 开始日期
+            end_day: 结束日期
+            username: 只查询该用户，None 表示全部用户
+
+        Returns:
+            按 (day, username, model, endpoint) 聚合的用量记录
+        """
+
+
+    # ---------- 限流令牌桶（多 worker 共享） ----------
+
+    @abstractmethod
+    def update_bucket(self, key: str, update: Callable[[Optional[float], Optional[float]], Tuple[float, float, Any]]) -> Any:
+        """
+        原子地读-改-写一个令牌桶
+
+        Args:
+            key: 令牌桶标识
+            update: 接收当前 (tokens, updated_at)（不存在时为 None），返回 (新 tokens, 新 updated_at, 结果)
+
+        Returns:
+            update 返回的结果
+        """
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite 存储后端（WAL 模式）"""
+
+    name = "sqlite"
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            nickname TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID
+        """,
+        # 主键以用户名开头：按用户查询日期范围走主键；管理员查询全部用户时走 day 索引
+        """
+        CREATE TABLE IF NOT EXISTS usage (
+            username TEXT NOT NULL,
+            day TEXT NOT NULL,
+            model TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            total_tokens INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, day, model, endpoint)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS usage_day ON usage (day)",
+        """
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+    )
+
+    # 元数据命名空间：记录迁移状态等
+    META_NAMESPACE = "_meta"
+
+    def __init__(self, path: str, data_dir: str = DATA_DIR, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: 数据库文件路径
+            data_dir: 旧 JSON 数据文件所在目录（用于一次性迁移）
+            busy_timeout: 等待其他进程写锁的最长时间（秒）
+        """
+        self.path = path
+        self.data_dir = data_dir
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @property
+    def location(self) -> str:
+        return self.path
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（fork 出的子进程会重新建立连接）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # isolation_level=None：自动提交，写操作显式使用 BEGIN IMMEDIATE 事务
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：开始时即获取写锁，避免读后升级写锁时与其他进程死锁"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def initialize(self):
+        """建表并执行一次性 JSON 迁移"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            with self._transaction() as conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                self._migrate_json(conn)
+            self._initialized = True
+
+    def _migrate_json(self, conn: sqlite3.Connection):
+        """
+        把旧的 JSON 数据文件导入数据库（在建表事务内执行，多个 worker 同时启动也只会导入一次）
+
+        原 JSON 文件保留不动，之后不再读取。
+        """
+        marker = conn.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = 'json_migrated'", (self.META_NAMESPACE,)
+        ).fetchone()
+        if marker is not None:
+            return
+
+        users = _read_json_file(os.path.join(self.data_dir, USERS_FILE)) or {}
+        imported = self._insert_users(conn, users.values())
+        if imported:
+            app_logger.info(f"已从 {USERS_FILE} 迁移 {imported} 个用户到 {self.path}")
+
+        for namespace in MIGRATED_NAMESPACES:
+            values = _read_json_file(os.path.join(self.data_dir, f"{namespace}.json"))
+            if values:
+                self._upsert_values(conn, namespace, values)
+                app_logger.info(f"已从 {namespace}.json 迁移配置到 {self.path}")
+
+        self._upsert_values(conn, self.META_NAMESPACE, {"json_migrated": time.time()})
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    # ---------- 用户 ----------
+
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        self.initialize()
+        row = self._connection().execute(
+            "SELECT username, nickname, password_hash, created_at FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def user_exists(self, username: str) -> bool:
+        self.initialize()
+        row = self._connection().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+
+    def insert_user(self, record: Dict[str, Any]) -> bool:
+        self.initialize()
+        with self._transaction() as conn:
+            return self._insert_users(conn, [record]) == 1
+
+    def update_user(self, username: str, fields: Dict[str, Any], expected: Optional[Dict[str, Any]] = None) -> bool:
+        self.initialize()
+        expected = expected or {}
+        columns = [name for name in fields if name in USER_FIELDS and name != "username"]
+        conditions = [name for name in expected if name in USER_FIELDS]
+        if not columns:
+            return self.user_exists(username)
+        sql = (
+            f"UPDATE users SET {', '.join(f'{name} = ?' for name in columns)} "
+            f"WHERE username = ?{''.join(f' AND {name} = ?' for name in conditions)}"
+        )
+        params = [fields[name] for name in columns] + [username] + [expected[name] for name in conditions]
+        with self._transaction() as conn:
+            return conn.execute(sql, params).rowcount == 1
+
+    def list_usernames(self) -> List[str]:
+        self.initialize()
+        return [row[0] for row in self._connection().execute("SELECT username FROM users ORDER BY created_at, username")]
+
+    def import_users(self, records: Iterable[Dict[str, Any]]) -> int:
+        self.initialize()
+        with self._transaction() as conn:
+            return self._insert_users(conn, records)
+
+    @staticmethod
+    def _insert_users(conn: sqlite3.Connection, records: Iterable[Dict[str, Any]]) -> int:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, nickname, password_hash, created_at) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    record["username"],
+                    record.get("nickname") or record["username"],
+                    record["password_hash"],
+                    record.get("created_at") or "",
+                )
+                for record in records
+            ),
+        )
+        return conn.total_changes - before
+
+    # ---------- 键值 ----------
+
+    def get_namespace(self, namespace: str) -> Dict[str, Any]:
+        self.initialize()
+        rows = self._connection().execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,))
+        return {key: json_backend.loads(value) for key, value in rows}
+
+    def get_value(self, namespace: str, key: str, default: Any = None) -> Any:
+        self.initialize()
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json_backend.loads(row[0]) if row is not None else default
+
+    def set_values(self, namespace: str, values: Dict[str, Any]):
+        self.initialize()
+        with self._transaction() as conn:
+            self._upsert_values(conn, namespace, values)
+
+    def delete_value(self, namespace: str, key: str) -> bool:
+        self.initialize()
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount == 1
+
+    def update_value(self, namespace: str, key: str, update: Callable[[Optional[Any]], Tuple[Optional[Any], Any]]) -> Any:
+        self.initialize()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value, result = update(json_backend.loads(row[0]) if row is not None else None)
+            if value is not None:
+                self._upsert_values(conn, namespace, {key: value})
+        return result
+
+    @staticmethod
+    def _upsert_values(conn: sqlite3.Connection, namespace: str, values: Dict[str, Any]):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            ((namespace, key, json_backend.dumps(value).decode("utf-8"), now) for key, value in values.items()),
+        )
+
+
+    # ---------- token 用量 ----------
+
+    def add_usage(self, rows: Iterable[Tuple]):
+        self.initialize()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO usage (day, username, model, endpoint, prompt_tokens, completion_tokens, total_tokens, requests) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (username, day, model, endpoint) DO UPDATE SET "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "total_tokens = total_tokens + excluded.total_tokens, "
+                "requests = requests + excluded.requests",
+                rows,
+            )
+
+    def query_usage(self, start_day: str, end_day: str, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        self.initialize()
+        sql = f"SELECT {', '.join(USAGE_FIELDS)} FROM usage WHERE day BETWEEN ? AND ?"
+        params: List[Any] = [start_day, end_day]
+        if username is not None:
+            sql += " AND username = ?"
+            params.append(username)
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+
+    # ---------- 限流令牌桶 ----------
+
+    def update_bucket(self, key: str, update: Callable[[Optional[float], Optional[float]], Tuple[float, float, Any]]) -> Any:
+        self.initialize()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at, result = update(*(tuple(row) if row is not None else (None, None)))
+            conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, updated_at),
+            )
+        return result
+
+
+class JSONStorage(StorageBackend):
+    """JSON 文件存储后端：用户保存在 users.json，每个键值命名空间保存为 <namespace>.json"""
+
+    name = "json"
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+
+    @property
+    def location(self) -> str:
+        return self.data_dir
+
+    @property
+    def users_file(self) -> str:
+        return os.path.join(self.data_dir, USERS_FILE)
+
+    def _namespace_file(self, namespace: str) -> str:
+        return os.path.join(self.data_dir, f"{namespace}.json")
+
+    def initialize(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        with file_lock(self.users_file):
+            if not os.path.exists(self.users_file):
+                write_json_atomic(self.users_file, {})
+
+    def _load_users(self) -> Dict[str, Dict[str, Any]]:
+        return _read_json_file(self.users_file) or {}
+
+    # ---------- 用户 ----------
+
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        user = self._load_users().get(username)
+        return dict(user) if user is not None else None
+
+    def insert_user(self, record: Dict[str, Any]) -> bool:
+        # 读-改-写在文件锁内完成，避免多进程并发更新互相覆盖
+        with file_lock(self.users_file):
+            users = self._load_users()
+            if record["username"] in users:
+                return False
+            users[record["username"]] = {name: record.get(name) for name in USER_FIELDS}
+            write_json_atomic(self.users_file, users)
+        return True
+
+    def update_user(self, username: str, fields: Dict[str, Any], expected: Optional[Dict[str, Any]] = None) -> bool:
+        with file_lock(self.users_file):
+            users = self._load_users()
+            user = users.get(username)
+            if user is None:
+                return False
+            if any(user.get(name) != value for name, value in (expected or {}).items()):
+                return False
+            user.update({name: value for name, value in fields.items() if name in USER_FIELDS and name != "username"})
+            write_json_atomic(self.users_file, users)
+        return True
+
+    def list_usernames(self) -> List[str]:
+        return list(self._load_users().keys())
+
+    def import_users(self, records: Iterable[Dict[str, Any]]) -> int:
+        with file_lock(self.users_file):
+            users = self._load_users()
+            imported = 0
+            for record in records:
+                if record["username"] not in users:
+                    users[record["username"]] = {name: record.get(name) for name in USER_FIELDS}
+                    imported += 1
+            write_json_atomic(self.users_file, users)
+        return imported
+
+    # ---------- 键值 ----------
+
+    def get_namespace(self, namespace: str) -> Dict[str, Any]:
+        return _read_json_file(self._namespace_file(namespace)) or {}
+
+    def set_values(self, namespace: str, values: Dict[str, Any]):
+        path = self._namespace_file(namespace)
+        with file_lock(path):
+            data = self.get_namespace(namespace)
+            data.update(values)
+            write_json_atomic(path, data)
+
+    def delete_value(self, namespace: str, key: str) -> bool:
+        path = self._namespace_file(namespace)
+        with file_lock(path):
+            data = self.get_namespace(namespace)
+            if key not in data:
+                return False
+            del data[key]
+            write_json_atomic(path, data)
+        return True
+
+    def update_value(self, namespace: str, key: str, update: Callable[[Optional[Any]], Tuple[Optional[Any], Any]]) -> Any:
+        path = self._namespace_file(namespace)
+        with file_lock(path):
+            data = self.get_namespace(namespace)
+            value, result = update(data.get(key))
+            if value is not None:
+                data[key] = value
+                write_json_atomic(path, data)
+        return result
+
+
+    # ---------- token 用量 ----------
+
+    @property
+    def usage_file(self) -> str:
+        return os.path.join(self.data_dir, USAGE_FILE)
+
+    def add_usage(self, rows: Iterable[Tuple]):
+        # 以 "day|username|model|endpoint" 为键保存累计值
+        with file_lock(self.usage_file):
+            data = _read_json_file(self.usage_file) or {}
+            for row in rows:
+                key = "|".join(row[:4])
+                counters = data.setdefault(key, [0, 0, 0, 0])
+                for index, value in enumerate(row[4:]):
+                    counters[index] += value
+            write_json_atomic(self.usage_file, data, indent=None)
+
+    def query_usage(self, start_day: str, end_day: str, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        records = []
+        for key, counters in (_read_json_file(self.usage_file) or {}).items():
+            row = key.split("|", 3) + counters
+            if start_day <= row[0] <= end_day and (username is None or row[1] == username):
+                records.append(dict(zip(USAGE_FIELDS, row)))
+        return records
+
+
+    # ---------- 限流令牌桶 ----------
+
+    def update_bucket(self, key: str, update: Callable[[Optional[float], Optional[float]], Tuple[float, float, Any]]) -> Any:
+        path = os.path.join(self.data_dir, RATE_BUCKETS_FILE)
+        with file_lock(path):
+            buckets = _read_json_file(path) or {}
+            tokens, updated_at, result = update(*buckets.get(key, (None, None)))
+            buckets[key] = [tokens, updated_at]
+            write_json_atomic(path, buckets, indent=None)
+        return result
+
+
+def _read_json_file(path: str) -> Optional[Dict[str, Any]]:
+    """读取 JSON 文件，不存在或内容损坏时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        app_logger.error(f"读取数据文件失败: {path}, {e}")
+        return None
+
+
+def create_storage(backend: str, db_path: str) -> StorageBackend:
+    """
+    按名称创建存储后端
+
+    Args:
+        backend: sqlite 或 json
+        db_path: SQLite 数据库文件路径
+    """
+    backend = backend.lower()
+    if backend == "json":
+        return JSONStorage()
+    if backend != "sqlite":
+        app_logger.warning(f"未知的存储后端 {backend}，使用 sqlite")
+    return SQLiteStorage(db_path)
+
+
+# 全局实例（首次使用时创建）
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """获取全局存储后端"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                from app.core.config import settings
+                _storage = create_storage(settings.storage_backend, settings.storage_db_path)
+    return _storage
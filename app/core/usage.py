@@ -0,0 +1,266 @@
+"""
+token 用量统计与配额
+- 每次模型调用返回的 usage 按 (日期, 用户, 模型, 接口) 累加到内存计数器，热路径上没有任何 I/O
+- 后台任务每隔 USAGE_FLUSH_INTERVAL 秒把计数器批量写入存储（SQLite 中为累加 UPSERT，多 worker 各自写入互不覆盖）
+- 调用模型前按用户检查本周期（日 / 月）用量：超过软配额记录告警，超过硬配额拒绝请求
+
+注意：其他 worker 进程尚未写入的计数要等其下一次批量写入后才可见，配额检查因此允许少量超出。
+"""
+
+import time
+import asyncio
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.storage import get_storage
+
+# 用户单独设置的配额在存储中的命名空间：{username: {"soft": int, "hard": int}}
+QUOTA_NAMESPACE = "usage_quotas"
+
+# 查询结果可选的分组维度
+GROUP_FIELDS = ("day", "username", "model", "endpoint")
+
+# 计数器顺序
+COUNTER_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens", "requests")
+
+
+def period_start(period: str, today: Optional[date] = None) -> date:
+    """
+    统计周期的第一天
+
+    Args:
+        period: day 或 month
+        today: 计算基准日期，默认今天
+    """
+    today = today or date.today()
+    return today if period == "day" else today.replace(day=1)
+
+
+class UsageTracker:
+    """token 用量统计器"""
+
+    def __init__(self):
+        # (day, username, model, endpoint) -> [prompt_tokens, completion_tokens, total_tokens, requests]
+        self._pending: Dict[Tuple[str, str, str, str], List[int]] = {}
+        self._lock = threading.Lock()
+        # 用户本周期已写入存储的用量缓存：username -> (读取时间, 周期开始日期, total_tokens)
+        self._period_totals: Dict[str, Tuple[float, str, int]] = {}
+        # 已告警过软配额的 (用户, 周期开始日期)，避免重复刷日志
+        self._soft_warned: Set[Tuple[str, str]] = set()
+        # 是否有用户单独设置了配额（未配置全局配额时用于跳过检查），按写入间隔刷新
+        self._has_custom_quotas = False
+        self._custom_quotas_checked_at = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, username: Optional[str], model: Optional[str], endpoint: Optional[str], usage: Optional[Dict[str, Any]]):
+        """
+        累加一次调用的用量（只更新内存计数）
+
+        Args:
+            username: 用户名，未认证的调用记为 "-"
+            model: 模型名称
+            endpoint: 接口路径
+            usage: 上游返回的 usage
+        """
+        if not usage:
+            return
+        prompt = int(usage.get("prompt_tokens") or 0)
+        completion = int(usage.get("completion_tokens") or 0)
+        total = int(usage.get("total_tokens") or prompt + completion)
+        key = (date.today().isoformat(), username or "-", model or "-", endpoint or "-")
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                counters = self._pending[key] = [0, 0, 0, 0]
+            counters[0] += prompt
+            counters[1] += completion
+            counters[2] += total
+            counters[3] += 1
+
+    def flush(self) -> int:
+        """
+        把内存计数批量写入存储（阻塞调用，在线程池中执行）
+
+        Returns:
+            写入的记录数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            get_storage().add_usage(key + tuple(counters) for key, counters in pending.items())
+        except Exception as e:
+            # 写入失败时把计数合并回去，下次再试
+            app_logger.error(f"写入 token 用量失败: {e}")
+            with self._lock:
+                for key, counters in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0])
+                    for index, value in enumerate(counters):
+                        current[index] += value
+            return 0
+        # 已写入的用量从本地计数移到存储，缓存需要重新读取
+        self._period_totals.clear()
+        return len(pending)
+
+    async def _flush_loop(self):
+        """定期批量写入"""
+        while True:
+            await asyncio.sleep(settings.usage_flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        """启动后台批量写入任务（应用启动时调用）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并写入剩余计数（应用关闭时调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def _pending_rows(self, start_day: str, end_day: str, username: Optional[str] = None) -> List[Dict[str, Any]]:
+        """本进程尚未写入存储的用量"""
+        with self._lock:
+            items = [(key, list(counters)) for key, counters in self._pending.items()]
+        return [
+            dict(zip(GROUP_FIELDS + COUNTER_FIELDS, key + tuple(counters)))
+            for key, counters in items
+            if start_day <= key[0] <= end_day and (username is None or key[1] == username)
+        ]
+
+    def query(
+        self,
+        start_day: str,
+        end_day: str,
+        username: Optional[str] = None,
+        group_by: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        查询日期范围内的用量（阻塞调用，在线程池中执行）
+
+        Args:
+            start_day: 开始日期（YYYY-MM-DD，含）
+            end_day: 结束日期（含）
+            username: 只统计该用户，None 表示全部用户
+            group_by: 分组维度，取自 GROUP_FIELDS，默认按天
+
+        Returns:
+            Dict: items 为分组后的用量，total 为合计
+        """
+        group_by = group_by or ["day"]
+        rows = get_storage().query_usage(start_day, end_day, username) + self._pending_rows(start_day, end_day, username)
+
+        groups: Dict[Tuple, Dict[str, Any]] = {}
+        total = dict.fromkeys(COUNTER_FIELDS, 0)
+        for row in rows:
+            key = tuple(row[field] for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {**dict(zip(group_by, key)), **dict.fromkeys(COUNTER_FIELDS, 0)}
+            for field in COUNTER_FIELDS:
+                group[field] += row[field]
+                total[field] += row[field]
+        return {
+            "start": start_day,
+            "end": end_day,
+            "group_by": group_by,
+            "items": sorted(groups.values(), key=lambda item: tuple(item[field] for field in group_by)),
+            "total": total,
+        }
+
+    # ---------- 配额 ----------
+
+    def get_quota(self, username: str) -> Dict[str, int]:
+        """用户的软/硬配额（单独设置优先，否则使用全局配置；0 表示不限制）"""
+        custom = get_storage().get_value(QUOTA_NAMESPACE, username) or {}
+        return {
+            "soft": int(custom.get("soft", settings.usage_soft_quota)),
+            "hard": int(custom.get("hard", settings.usage_hard_quota)),
+        }
+
+    def set_quota(self, username: str, soft: Optional[int], hard: Optional[int]):
+        """
+        设置用户配额
+
+        Args:
+            username: 用户名
+            soft: 软配额，None 表示恢复全局配置
+            hard: 硬配额，None 表示恢复全局配置
+        """
+        quota = {name: value for name, value in (("soft", soft), ("hard", hard)) if value is not None}
+        storage = get_storage()
+        if quota:
+            storage.set_value(QUOTA_NAMESPACE, username, quota)
+        else:
+            storage.delete_value(QUOTA_NAMESPACE, username)
+        self._period_totals.pop(username, None)
+        self._custom_quotas_checked_at = float("-inf")
+
+    def _period_used(self, username: str, start_day: str) -> int:
+        """用户本周期已用 token（存储部分按写入间隔缓存）+ 本进程尚未写入的部分"""
+        cached = self._period_totals.get(username)
+        if cached is None or cached[1] != start_day or time.monotonic() - cached[0] > settings.usage_flush_interval:
+            rows = get_storage().query_usage(start_day, date.today().isoformat(), username)
+            cached = (time.monotonic(), start_day, sum(row["total_tokens"] for row in rows))
+            self._period_totals[username] = cached
+        pending = sum(row["total_tokens"] for row in self._pending_rows(start_day, "9999-12-31", username))
+        return cached[2] + pending
+
+    def quota_status(self, username: str) -> Dict[str, Any]:
+        """
+        用户本周期的配额使用情况（阻塞调用，在线程池中执行）
+
+        Returns:
+            Dict: period、period_start、used、soft、hard、soft_exceeded、hard_exceeded
+        """
+        start_day = period_start(settings.usage_quota_period).isoformat()
+        quota = self.get_quota(username)
+        used = self._period_used(username, start_day)
+        return {
+            "period": settings.usage_quota_period,
+            "period_start": start_day,
+            "used": used,
+            "soft": quota["soft"],
+            "hard": quota["hard"],
+            "soft_exceeded": bool(quota["soft"]) and used >= quota["soft"],
+            "hard_exceeded": bool(quota["hard"]) and used >= quota["hard"],
+        }
+
+    async def check_quota(self, username: str) -> Dict[str, Any]:
+        """
+        调用模型前检查配额：超过软配额记录告警（每个周期一次），是否拒绝由调用方根据 hard_exceeded 决定
+
+        未配置任何配额时直接返回，不访问存储。
+        """
+        if not settings.usage_soft_quota and not settings.usage_hard_quota:
+            if time.monotonic() - self._custom_quotas_checked_at > settings.usage_flush_interval:
+                namespace = await asyncio.to_thread(get_storage().get_namespace, QUOTA_NAMESPACE)
+                self._has_custom_quotas = bool(namespace)
+                self._custom_quotas_checked_at = time.monotonic()
+            if not self._has_custom_quotas:
+                return {"soft_exceeded": False, "hard_exceeded": False}
+        status = await asyncio.to_thread(self.quota_status, username)
+        if status["soft_exceeded"] and (username, status["period_start"]) not in self._soft_warned:
+            self._soft_warned.add((username, status["period_start"]))
+            app_logger.warning(f"用户 {username} 本周期 token 用量 {status['used']} 已超过软配额 {status['soft']}")
+        return status
+
+
+def default_range(days: int = 30) -> Tuple[str, str]:
+    """默认查询范围：最近 N 天（含今天）"""
+    today = date.today()
+    return (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+
+
+# 全局实例
+usage_tracker = UsageTracker()
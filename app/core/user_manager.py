@@ -1,37 +1,56 @@
 """
-用户管理模块 - 使用 JSON 文件存储用户信息
+用户管理模块 - 用户信息保存在存储后端（默认 SQLite，见 app.core.storage）
 Author: ZHANGCHAO
 """
 
-import os
-import json
-from pathlib import Path
+import threading
 from typing import Dict, List, Optional
 from datetime import datetime
 from passlib.context import CryptContext
-from dotenv import load_dotenv
 from app.core.logger import app_logger
+from app.core.storage import StorageBackend, get_storage
 
 # 密码加密
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# 用户数据文件路径
-USER_DATA_FILE = "data/users.json"
-
 
 class UserManager:
     """用户管理器"""
     
     def __init__(self):
-        """初始化用户管理器"""
-        self._ensure_data_dir()
-        self._ensure_default_admin()
+        """初始化用户管理器（不做文件操作，导入模块时保持轻量）"""
+        self._storage: Optional[StorageBackend] = None
+        self._initialized = False
+        self._initializing = False
+        self._init_lock = threading.RLock()
+    
+    def initialize(self):
+        """
+        准备存储并创建默认管理员（只执行一次）
+        
+        应用启动时在后台线程中预先调用；首次读取用户数据时也会触发，
+        期间其他线程会等待初始化完成。首次创建管理员需要 bcrypt 哈希，耗时约数百毫秒。
+        """
+        if self._initialized:
+            return
+        with self._init_lock:
+            # 初始化过程中本线程读取用户数据会重入，直接返回
+            if self._initialized or self._initializing:
+                return
+            self._initializing = True
+            try:
+                self.storage.initialize()
+                self._ensure_default_admin()
+                self._initialized = True
+            finally:
+                self._initializing = False
     
-    def _ensure_data_dir(self):
-        """确保数据目录存在"""
-        os.makedirs(os.path.dirname(USER_DATA_FILE), exist_ok=True)
-        if not os.path.exists(USER_DATA_FILE):
-            self._save_users({})
+    @property
+    def storage(self) -> StorageBackend:
+        """存储后端（首次使用时获取全局实例）"""
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
     
     def _ensure_default_admin(self):
         """确保默认管理员账号存在"""
@@ -40,23 +59,14 @@ class UserManager:
         default_password = settings.default_admin_password
         default_nickname = "🍒樱桃七喜丸子"
         
-        users = self._load_users()
-        if default_username not in users:
-            self.create_user(default_username, default_password, default_nickname)
+        # 多个 worker 同时启动时只有一个会真正创建成功
+        if not self.storage.user_exists(default_username) and self.create_user(default_username, default_password, default_nickname):
             app_logger.info(f"创建默认管理员账号: {default_username}")
     
-    def _load_users(self) -> Dict:
-        """加载用户数据"""
-        try:
-            with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_users(self, users: Dict):
-        """保存用户数据"""
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
+    def _get_record(self, username: str) -> Optional[Dict]:
+        """按用户名查询用户记录（包含密码哈希）"""
+        self.initialize()
+        return self.storage.get_user(username)
     
     def get_password_hash(self, password: str) -> str:
         """加密密码"""
@@ -78,21 +88,16 @@ class UserManager:
         Returns:
             是否创建成功
         """
-        users = self._load_users()
-        
-        # 检查用户是否已存在
-        if username in users:
-            return False
-        
-        # 创建新用户
-        users[username] = {
+        self.initialize()
+        record = {
             "username": username,
             "nickname": nickname or username,  # 如果没有昵称，使用用户名
             "password_hash": self.get_password_hash(password),
             "created_at": datetime.now().isoformat()  # 使用当前时间
         }
-        
-        self._save_users(users)
+        # 用户名已存在时插入失败（由存储后端保证并发安全）
+        if not self.storage.insert_user(record):
+            return False
         app_logger.info(f"创建新用户: {username}, 昵称: {nickname or username}")
         return True
     
@@ -107,12 +112,9 @@ class UserManager:
         Returns:
             验证是否成功
         """
-        users = self._load_users()
-        
-        if username not in users:
+        user = self._get_record(username)
+        if user is None:
             return False
-        
-        user = users[username]
         return self.verify_password(password, user["password_hash"])
     
     def user_exists(self, username: str) -> bool:
@@ -125,8 +127,8 @@ class UserManager:
         Returns:
             用户是否存在
         """
-        users = self._load_users()
-        return username in users
+        self.initialize()
+        return self.storage.user_exists(username)
     
     def get_user(self, username: str) -> Optional[Dict]:
         """
@@ -138,12 +140,10 @@ class UserManager:
         Returns:
             用户信息（不包含密码）
         """
-        users = self._load_users()
-        
-        if username not in users:
+        user = self._get_record(username)
+        if user is None:
             return None
         
-        user = users[username].copy()
         user.pop("password_hash", None)  # 移除密码哈希
         return user
     
@@ -154,8 +154,8 @@ class UserManager:
         Returns:
             用户名列表
         """
-        users = self._load_users()
-        return list(users.keys())
+        self.initialize()
+        return self.storage.list_usernames()
     
     def update_nickname(self, username: str, nickname: str) -> bool:
         """
@@ -168,13 +168,9 @@ class UserManager:
         Returns:
             是否更新成功
         """
-        users = self._load_users()
-        
-        if username not in users:
+        self.initialize()
+        if not self.storage.update_user(username, {"nickname": nickname}):
             return False
-        
-        users[username]["nickname"] = nickname
-        self._save_users(users)
         app_logger.info(f"更新用户昵称: {username} -> {nickname}")
         return True
     
@@ -190,18 +186,21 @@ class UserManager:
         Returns:
             是否更新成功
         """
-        users = self._load_users()
-        
-        if username not in users:
+        user = self._get_record(username)
+        if user is None:
             return False
         
         # 验证旧密码
-        if not self.verify_password(old_password, users[username]["password_hash"]):
+        if not self.verify_password(old_password, user["password_hash"]):
             return False
         
-        # 更新密码
-        users[username]["password_hash"] = self.get_password_hash(new_password)
-        self._save_users(users)
+        # 更新密码：仅当密码哈希未被并发修改时才写入
+        if not self.storage.update_user(
+            username,
+            {"password_hash": self.get_password_hash(new_password)},
+            expected={"password_hash": user["password_hash"]},
+        ):
+            return False
         app_logger.info(f"更新用户密码: {username}")
         return True
 
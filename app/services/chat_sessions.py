@@ -0,0 +1,439 @@
+"""
+服务端对话会话
+/ai/chat 要求客户端每一轮都上传完整的对话历史，长对话的请求体可达数百 KB，每轮都要重新解析、记录日志和序列化。
+会话接口把对话历史保存在服务端：客户端创建会话得到 session_id，之后每一轮只上传新的用户消息，
+服务端拼接历史后调用模型，并把模型回复追加到历史中。
+
+- 单 worker 且未开启 CHAT_SESSION_PERSIST 时，会话保存在进程内存中，按最近使用顺序排列；
+  超过 CHAT_SESSION_MAX_SESSIONS 个或 CHAT_SESSION_MAX_MB 时淘汰最久未使用的会话
+- 开启 CHAT_SESSION_PERSIST 或以多 worker 运行（serve.py）时，存储后端是会话的唯一数据源：
+  每次读取都从存储读，每一轮在事务中领取租约并读取最新历史，结束时在事务中追加，各 worker 不缓存会话，
+  请求落在哪个 worker 上都能看到一致的历史
+- 空闲超过 CHAT_SESSION_TTL 秒的会话被删除
+- 同一会话同一时刻只允许一轮对话进行（多 worker 之间通过存储中的租约保证），避免两轮回复交错写入历史；
+  一轮进行中会话被删除时，结束时不再写回
+"""
+
+import os
+import time
+import asyncio
+import secrets
+import itertools
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.storage import get_storage
+
+# 会话在存储中的命名空间：{session_id: 会话记录}
+SESSION_NAMESPACE = "chat_sessions"
+
+# 过期会话的清理间隔（秒）
+SWEEP_INTERVAL = 60
+
+# 多 worker 租约在本轮总超时之外的余量（秒）：持有租约的 worker 异常退出时，租约到期后会话自动解除占用
+TURN_LEASE_MARGIN = 30
+
+# 每条消息除内容外的估算内存开销（字典、角色字符串等）
+MESSAGE_OVERHEAD_BYTES = 120
+
+metrics.describe("chat_sessions", "内存中的对话会话数")
+metrics.describe("chat_session_bytes", "内存中对话会话的估算占用（字节）")
+metrics.describe("chat_session_evictions_total", "对话会话淘汰次数（reason: lru / ttl）")
+
+
+class SessionBusy(Exception):
+    """会话正在进行另一轮对话"""
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    return len(message.get("content") or "") * 2 + MESSAGE_OVERHEAD_BYTES
+
+
+def _worker_count() -> int:
+    """同时服务的 worker 数：serve.py 启动 worker 前写入 WEB_WORKER_COUNT，其他启动方式参考 uvicorn 的 WEB_CONCURRENCY"""
+    for name in ("WEB_WORKER_COUNT", "WEB_CONCURRENCY"):
+        try:
+            return max(1, int(os.getenv(name, "")))
+        except ValueError:
+            continue
+    return 1
+
+
+class ChatSession:
+    """单个对话会话"""
+
+    __slots__ = (
+        "session_id", "username", "model", "system_prompt", "temperature", "max_tokens",
+        "messages", "created_at", "updated_at", "size", "busy", "turn_id",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        username: str,
+        model: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        messages: Optional[List[Dict[str, str]]] = None,
+        created_at: Optional[float] = None,
+        updated_at: Optional[float] = None,
+    ):
+        now = time.time()
+        self.session_id = session_id
+        self.username = username
+        self.model = model
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.messages: List[Dict[str, str]] = list(messages or [])
+        self.created_at = created_at or now
+        self.updated_at = updated_at or now
+        self.size = sum(map(_message_size, self.messages)) + len(system_prompt or "") * 2
+        self.busy = False
+        # 共享存储模式下本轮持有的租约标识
+        self.turn_id: Optional[str] = None
+
+    def append(self, messages: List[Dict[str, str]]):
+        self.messages.extend(messages)
+        self.size += sum(map(_message_size, messages))
+        self.updated_at = time.time()
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "username": self.username,
+            "model": self.model,
+            "system_prompt": self.system_prompt,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "messages": list(self.messages),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_record(cls, session_id: str, record: Dict[str, Any]) -> "ChatSession":
+        return cls(
+            session_id,
+            record["username"],
+            model=record.get("model"),
+            system_prompt=record.get("system_prompt"),
+            temperature=record.get("temperature", 0.7),
+            max_tokens=record.get("max_tokens", 2000),
+            messages=record.get("messages"),
+            created_at=record.get("created_at"),
+            updated_at=record.get("updated_at"),
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "model": self.model,
+            "system_prompt": self.system_prompt,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "message_count": len(self.messages),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class ChatSessionStore:
+    """对话会话存储：单 worker 时使用内存 LRU，多 worker 或开启持久化时以存储后端为唯一数据源（单个事件循环内使用）"""
+
+    def __init__(self):
+        self.max_sessions = settings.chat_session_max_sessions
+        self.max_bytes = int(settings.chat_session_max_mb * 1024 * 1024)
+        self.ttl = settings.chat_session_ttl
+        self.persist = settings.chat_session_persist
+        # 是否以存储后端为数据源；worker 数在 fork 之后才能确定，start() 时重新判断
+        self.shared = self.persist
+        # 内存模式下的会话，最久未使用的在前
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._bytes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _cache(self, session: ChatSession):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        self._bytes += session.size
+        self._shrink()
+
+    def _drop(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.size
+        return session
+
+    def _shrink(self):
+        """超过会话数或内存上限时淘汰最久未使用的空闲会话"""
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and self._bytes <= self.max_bytes:
+                break
+            if self._sessions[session_id].busy:
+                continue
+            self._drop(session_id)
+            metrics.inc("chat_session_evictions_total", reason="lru")
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.set("chat_sessions", len(self._sessions))
+        metrics.set("chat_session_bytes", self._bytes)
+
+    def _expired(self, updated_at: float, now: Optional[float] = None) -> bool:
+        return self.ttl > 0 and (now or time.time()) - updated_at > self.ttl
+
+    @staticmethod
+    def _leased(record: Dict[str, Any], now: float) -> bool:
+        return bool(record.get("turn_id")) and (record.get("turn_until") or 0) > now
+
+    async def create(
+        self,
+        username: str,
+        model: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        messages: Optional[List[Dict[str, str]]] = None,
+    ) -> ChatSession:
+        """
+        创建会话
+
+        Args:
+            username: 会话所属用户
+            model: 默认模型
+            system_prompt: 系统提示词
+            temperature: 默认温度
+            max_tokens: 默认最大生成 token 数
+            messages: 初始对话历史（从 /ai/chat 迁移已有对话时使用）
+        """
+        session = ChatSession(
+            secrets.token_urlsafe(16), username, model, system_prompt, temperature, max_tokens, messages
+        )
+        if self.shared:
+            await asyncio.to_thread(get_storage().set_value, SESSION_NAMESPACE, session.session_id, session.to_record())
+        else:
+            self._cache(session)
+        app_logger.debug(f"创建对话会话: {session.session_id}, 用户: {username}")
+        return session
+
+    async def get(self, session_id: str, username: str) -> Optional[ChatSession]:
+        """
+        获取用户的会话（共享存储模式下每次都从存储读取）
+
+        Returns:
+            Optional[ChatSession]: 会话不存在、已过期或不属于该用户时返回 None
+        """
+        if self.shared:
+            record = await asyncio.to_thread(get_storage().get_value, SESSION_NAMESPACE, session_id)
+            if record is None or record.get("username") != username:
+                return None
+            now = time.time()
+            if self._expired(record.get("updated_at") or 0, now) and not self._leased(record, now):
+                await asyncio.to_thread(get_storage().delete_value, SESSION_NAMESPACE, session_id)
+                return None
+            session = ChatSession.from_record(session_id, record)
+            session.busy = self._leased(record, now)
+            return session
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._expired(session.updated_at) and not session.busy:
+            self._drop(session_id)
+            self._update_gauges()
+            return None
+        self._sessions.move_to_end(session_id)
+        return session if session.username == username else None
+
+    async def begin_turn(self, session_id: str, username: str) -> Optional[ChatSession]:
+        """
+        开始一轮对话：占用会话并返回包含最新历史的会话
+
+        共享存储模式下在一个事务中检查并写入租约（有效期为本轮总超时加 TURN_LEASE_MARGIN），
+        其他 worker 上同一会话的并发请求会看到租约而被拒绝。
+
+        Returns:
+            Optional[ChatSession]: 会话不存在、已过期或不属于该用户时返回 None
+
+        Raises:
+            SessionBusy: 会话正在进行另一轮对话
+        """
+        if not self.shared:
+            session = await self.get(session_id, username)
+            if session is None:
+                return None
+            if session.busy:
+                raise SessionBusy("该会话正在进行另一轮对话，请等待上一轮完成")
+            session.busy = True
+            return session
+
+        turn_id = secrets.token_urlsafe(8)
+        lease = deadline.total_timeout() + TURN_LEASE_MARGIN
+
+        def update(record):
+            now = time.time()
+            if record is None or record.get("username") != username or self._expired(record.get("updated_at") or 0, now):
+                return None, None
+            if self._leased(record, now):
+                return None, False
+            return {**record, "turn_id": turn_id, "turn_until": now + lease}, record
+
+        record = await asyncio.to_thread(get_storage().update_value, SESSION_NAMESPACE, session_id, update)
+        if record is False:
+            raise SessionBusy("该会话正在进行另一轮对话，请等待上一轮完成")
+        if record is None:
+            return None
+        session = ChatSession.from_record(session_id, record)
+        session.busy = True
+        session.turn_id = turn_id
+        return session
+
+    async def end_turn(self, session: ChatSession, messages: Optional[List[Dict[str, str]]] = None):
+        """
+        结束一轮对话，成功时把本轮的用户消息与模型回复追加到历史；本轮进行中会话已被删除时不再写回
+
+        Args:
+            session: begin_turn 返回的会话
+            messages: 本轮新增的消息，调用失败时为 None（历史保持不变）
+        """
+        session.busy = False
+        if not self.shared:
+            if not messages or self._sessions.get(session.session_id) is not session:
+                return
+            self._bytes -= session.size
+            session.append(messages)
+            self._bytes += session.size
+            self._shrink()
+            return
+
+        turn_id, session.turn_id = session.turn_id, None
+
+        def update(record):
+            # 会话已删除，或租约已过期并被其他请求接手时，不再写入
+            if record is None or record.get("turn_id") != turn_id:
+                return None, False
+            record = {**record, "turn_id": None, "turn_until": None}
+            if messages:
+                record["messages"] = list(record.get("messages") or []) + list(messages)
+                record["updated_at"] = time.time()
+            return record, True
+
+        try:
+            written = await asyncio.to_thread(get_storage().update_value, SESSION_NAMESPACE, session.session_id, update)
+        except Exception as e:
+            app_logger.error(f"对话会话 {session.session_id} 写入存储失败，本轮历史未保存: {e}")
+            return
+        if not written and messages:
+            app_logger.warning(f"对话会话 {session.session_id} 在本轮进行中被删除或租约已过期，本轮历史未保存")
+        elif messages:
+            session.append(messages)
+
+    async def delete(self, session_id: str, username: str) -> bool:
+        """删除用户的会话"""
+        session = await self.get(session_id, username)
+        if session is None:
+            return False
+        if self.shared:
+            await asyncio.to_thread(get_storage().delete_value, SESSION_NAMESPACE, session_id)
+        else:
+            self._drop(session_id)
+            self._update_gauges()
+        return True
+
+    async def list_sessions(self, username: str) -> List[Dict[str, Any]]:
+        """用户的会话（最近使用的在前）"""
+        if not self.shared:
+            return [
+                session.summary()
+                for session in reversed(self._sessions.values())
+                if session.username == username
+            ]
+        stored = await asyncio.to_thread(get_storage().get_namespace, SESSION_NAMESPACE)
+        now = time.time()
+        sessions = [
+            ChatSession.from_record(session_id, record)
+            for session_id, record in stored.items()
+            if record.get("username") == username
+            and (self._leased(record, now) or not self._expired(record.get("updated_at") or 0, now))
+        ]
+        sessions.sort(key=lambda session: session.updated_at, reverse=True)
+        return [session.summary() for session in sessions]
+
+    def sweep(self) -> List[str]:
+        """删除内存中空闲超过 TTL 的会话，返回被删除的会话 id"""
+        now = time.time()
+        expired = [
+            session_id for session_id, session in self._sessions.items()
+            if not session.busy and self._expired(session.updated_at, now)
+        ]
+        for session_id in expired:
+            self._drop(session_id)
+        if expired:
+            metrics.inc("chat_session_evictions_total", len(expired), reason="ttl")
+            self._update_gauges()
+        return expired
+
+    async def _purge_stored(self):
+        """删除存储中已过期且不在对话中的会话"""
+        storage = get_storage()
+        now = time.time()
+        stored = await asyncio.to_thread(storage.get_namespace, SESSION_NAMESPACE)
+        expired = 0
+        for session_id, record in stored.items():
+            if self._expired(record.get("updated_at") or 0, now) and not self._leased(record, now):
+                await asyncio.to_thread(storage.delete_value, SESSION_NAMESPACE, session_id)
+                expired += 1
+        if expired:
+            metrics.inc("chat_session_evictions_total", expired, reason="ttl")
+
+    async def _maintenance_loop(self):
+        """定期清理过期会话；共享存储模式下存储中的过期会话每小时（TTL 更短时按 TTL）清理一次"""
+        purge_every = max(1, int(min(self.ttl or 3600, 3600) / SWEEP_INTERVAL))
+        for round_number in itertools.count(1):
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                if not self.shared:
+                    self.sweep()
+                elif self.ttl > 0 and round_number % purge_every == 0:
+                    await self._purge_stored()
+            except Exception:
+                app_logger.exception("对话会话维护任务异常")
+
+    def start(self):
+        """确定存储模式并启动后台维护任务（应用启动时，在各 worker 进程中调用）"""
+        workers = _worker_count()
+        self.shared = self.persist or workers > 1
+        if self.shared and not self.persist:
+            app_logger.info(f"以 {workers} 个 worker 运行，对话会话保存在存储后端中，由各 worker 共享")
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        """停止后台任务（应用关闭时调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shared": self.shared,
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "persist": self.persist,
+        }
+
+
+# 全局实例
+chat_sessions = ChatSessionStore()
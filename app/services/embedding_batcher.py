@@ -0,0 +1,149 @@
+"""
+向量化请求微批处理
+RAG 场景大量并发发送单条文本的向量化请求，逐条转发会让上游调用次数与每次调用的固定开销（排队、连接、鉴权）
+随请求数线性增长。EmbeddingBatcher 把同一模型的并发请求收集几毫秒（或凑满最大批量），合并成一次上游
+/embeddings 调用，再把向量按下标分发回各个调用方。
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+
+# 批量大小直方图分桶
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+metrics.describe("embedding_batch_size", "每次上游向量化调用合并的文本数")
+metrics.describe("embedding_upstream_calls_total", "上游向量化调用次数")
+metrics.describe("embedding_inputs_total", "收到的待向量化文本数")
+
+# 上游调用：(model, texts) -> {"success", "embeddings": [[float]], "usage", "error"}
+SendBatch = Callable[[str, List[str]], Awaitable[Dict[str, Any]]]
+
+
+class _Pending:
+    """某个模型正在收集中的批次"""
+
+    __slots__ = ("texts", "futures", "timer")
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """按模型合并并发向量化请求的微批处理器（单个事件循环内使用）"""
+
+    def __init__(self, send_batch: SendBatch, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            send_batch: 发送一批文本到上游的协程函数
+            max_batch_size: 单次上游调用最多合并的文本数
+            max_wait_ms: 第一条文本到达后最多等待多少毫秒再发送
+        """
+        self._send_batch = send_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: Dict[str, _Pending] = {}
+        self._inflight: set = set()
+
+    async def embed(self, model: str, text: str) -> Dict[str, Any]:
+        """
+        获取单条文本的向量
+
+        Args:
+            model: 向量模型
+            text: 文本
+
+        Returns:
+            Dict[str, Any]:
+                - success: 是否成功
+                - embedding: 向量
+                - prompt_tokens: 按文本长度分摊的本批次 token 数
+                - batch_size: 所在批次的文本数
+                - error: 错误信息(如果失败)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.get(model)
+        if pending is None:
+            pending = self._pending[model] = _Pending()
+            pending.timer = loop.call_later(self.max_wait, self._flush, model)
+        pending.texts.append(text)
+        pending.futures.append(future)
+        metrics.inc("embedding_inputs_total", model=model)
+        if len(pending.texts) >= self.max_batch_size:
+            self._flush(model)
+        return await future
+
+    def _flush(self, model: str):
+        """把收集中的批次交给后台任务发送"""
+        pending = self._pending.pop(model, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._run(model, pending.texts, pending.futures))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, model: str, texts: List[str], futures: List[asyncio.Future]):
+        """发送一批文本并把结果分发给各个调用方"""
+        # 收集期间已取消的调用方（客户端断开或超时）不再发往上游
+        live = [index for index, future in enumerate(futures) if not future.done()]
+        if not live:
+            return
+        if len(live) < len(texts):
+            texts = [texts[index] for index in live]
+            futures = [futures[index] for index in live]
+
+        metrics.observe("embedding_batch_size", len(texts), buckets=BATCH_SIZE_BUCKETS, model=model)
+        metrics.inc("embedding_upstream_calls_total", model=model)
+        try:
+            result = await self._send_batch(model, texts)
+        except Exception as e:
+            app_logger.exception("批量向量化调用异常")
+            result = {"success": False, "error": f"向量化调用异常: {e}"}
+
+        if not result.get("success"):
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+            return
+
+        embeddings = result.get("embeddings") or []
+        usage = result.get("usage") or {}
+        shares = self._split_tokens(usage.get("prompt_tokens") or usage.get("total_tokens") or 0, texts)
+        for index, future in enumerate(futures):
+            if future.done():
+                # 调用方已取消（客户端断开或超时），结果直接丢弃
+                continue
+            if index < len(embeddings) and embeddings[index] is not None:
+                future.set_result({
+                    "success": True,
+                    "embedding": embeddings[index],
+                    "prompt_tokens": shares[index],
+                    "batch_size": len(texts),
+                })
+            else:
+                future.set_result({"success": False, "error": "上游未返回该文本的向量"})
+
+    @staticmethod
+    def _split_tokens(total: int, texts: List[str]) -> List[int]:
+        """按文本长度把整批的 token 用量分摊到每条文本（余数给最长的文本）"""
+        if not total:
+            return [0] * len(texts)
+        lengths = [max(1, len(text)) for text in texts]
+        weight = sum(lengths)
+        shares = [total * length // weight for length in lengths]
+        shares[lengths.index(max(lengths))] += total - sum(shares)
+        return shares
+
+    async def close(self):
+        """立即发送所有收集中的批次并等待进行中的调用完成"""
+        for model in list(self._pending):
+            self._flush(model)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,325 @@
+"""
+对话历史压缩
+custom_chat 原样转发客户端（或服务端会话）提供的全部历史，长对话的提示词 token、延迟和费用随轮数线性增长，
+直到超出模型上下文而失败。发往上游前按 HISTORY_COMPACTION 策略压缩历史，使提示词不超过模型的 token 预算：
+
+- none：不压缩
+- window：滑动窗口，保留开头的系统提示词和预算内尽可能多的最近消息
+- last_turns：保留系统提示词和最近 HISTORY_KEEP_TURNS 轮（每轮从一条用户消息开始），仍超预算时再按窗口裁剪
+- summary：同 last_turns，更早的轮次用滚动摘要代替。摘要在本轮响应返回后于后台生成（低优先级，不占用本轮的截止时间），
+  按 "之前的摘要 + 新移出窗口的轮次" 增量更新；下一轮请求的历史前缀与已摘要部分一致时使用摘要，
+  摘要尚未生成时退化为窗口裁剪
+
+token 数按 UTF-8 字节数估算（与限流一致，约 3 字节 / token），每轮节省的 token 数随响应返回并记入指标。
+"""
+
+import asyncio
+import hashlib
+import itertools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core import json_backend
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.request_context import (
+    current_deadline,
+    current_disconnect,
+    current_endpoint,
+    current_priority,
+    current_reservation,
+    current_username,
+)
+from app.core.scheduler import BULK
+from app.services.prompt_registry import prompt_registry
+
+STRATEGIES = ("none", "window", "last_turns", "summary")
+
+# 估算 token：UTF-8 字节数 / BYTES_PER_TOKEN，每条消息另加角色等固定开销
+BYTES_PER_TOKEN = 3
+MESSAGE_OVERHEAD_TOKENS = 4
+# 多模态消息中每张图片按固定 token 数估算
+IMAGE_TOKENS = 1000
+
+# 内存中最多保留的历史摘要数（按最近使用淘汰）
+SUMMARY_CACHE_MAX_ENTRIES = 2000
+
+# 后台生成摘要时使用的接口路径（用量统计与耗时指标单独归类）
+SUMMARY_ENDPOINT = "/ai/history/summary"
+
+ROLE_NAMES = {"user": "用户", "assistant": "助手", "system": "系统"}
+
+metrics.describe("history_compaction_saved_tokens_total", "历史压缩节省的估算提示词 token 数")
+metrics.describe("history_compaction_total", "历史压缩次数（result: unchanged / compacted）")
+metrics.describe("history_summaries_total", "后台生成历史摘要的次数（result: success / failure）")
+
+# 生成摘要：(messages, model) -> call_ai 结果
+Summarize = Callable[[List[Dict[str, Any]], str], Awaitable[Dict[str, Any]]]
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的 token 数"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return len(content.encode("utf-8")) // BYTES_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in content or ():
+        if isinstance(part, dict) and part.get("type") == "text":
+            tokens += len(str(part.get("text", "")).encode("utf-8")) // BYTES_PER_TOKEN
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def parse_budgets(raw: str) -> Dict[str, int]:
+    """
+    解析 HISTORY_TOKEN_BUDGETS 配置
+
+    Args:
+        raw: JSON 字符串，形如 {"Qwen/Qwen2.5-7B-Instruct": 28000}
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    data = json_backend.loads(raw) if raw.strip() else {}
+    if not isinstance(data, dict):
+        raise ValueError("HISTORY_TOKEN_BUDGETS 必须是 JSON 对象")
+    return {model: int(tokens) for model, tokens in data.items()}
+
+
+class Compaction:
+    """一次压缩的结果"""
+
+    __slots__ = (
+        "messages", "strategy", "tokens_before", "tokens_after", "dropped", "summarized", "summary_job",
+    )
+
+    def __init__(self, messages: List[Dict[str, Any]], strategy: str, tokens_before: int, tokens_after: int):
+        self.messages = messages
+        self.strategy = strategy
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        # 被移出提示词的消息数（含被摘要代替的）、由摘要代替的消息数
+        self.dropped = 0
+        self.summarized = 0
+        # 响应返回后需要生成的摘要：(摘要键, 之前的摘要, 待摘要的消息)
+        self.summary_job: Optional[Tuple[bytes, Optional[str], List[Dict[str, Any]]]] = None
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "saved_tokens": self.saved_tokens,
+            "dropped_messages": self.dropped,
+            "summarized_messages": self.summarized,
+        }
+
+
+class HistoryCompactor:
+    """对话历史压缩器（单个事件循环内使用）"""
+
+    def __init__(self):
+        strategy = settings.history_compaction.lower()
+        if strategy not in STRATEGIES:
+            app_logger.error(f"HISTORY_COMPACTION 配置无效: {strategy}，使用 window")
+            strategy = "window"
+        self.strategy = strategy
+        self.default_budget = settings.history_token_budget
+        try:
+            self.budgets = parse_budgets(settings.history_token_budgets)
+        except (ValueError, TypeError) as e:
+            app_logger.error(f"HISTORY_TOKEN_BUDGETS 配置无效，使用默认预算: {e}")
+            self.budgets = {}
+        self.keep_turns = max(1, settings.history_keep_turns)
+        # 摘要键（用户 + 已摘要的历史前缀）-> 摘要文本，最久未使用的在前
+        self._summaries: "OrderedDict[bytes, str]" = OrderedDict()
+        self._pending: set = set()
+        self._tasks: set = set()
+
+    def budget_for(self, model: Optional[str]) -> int:
+        """模型的提示词 token 预算"""
+        return self.budgets.get(model or "", self.default_budget)
+
+    def compact(self, messages: List[Dict[str, Any]], model: Optional[str]) -> Compaction:
+        """
+        按配置的策略压缩历史
+
+        Args:
+            messages: 完整的对话消息（开头可以是系统提示词）
+            model: 模型名称，用于确定 token 预算
+
+        Returns:
+            Compaction: 压缩后的消息与统计
+        """
+        lead = len(list(itertools.takewhile(lambda message: message.get("role") == "system", messages)))
+        costs = [estimate_tokens(message) for message in messages]
+        total = sum(costs)
+        if self.strategy == "none" or len(messages) - lead <= 1:
+            return Compaction(messages, self.strategy, total, total)
+
+        body, body_costs = messages[lead:], costs[lead:]
+        budget = self.budget_for(model)
+        fixed = sum(costs[:lead])
+        if self.strategy == "summary":
+            # 为摘要预留空间
+            fixed += settings.history_summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+
+        start = 0
+        if self.strategy != "window":
+            turn_starts = [index for index, message in enumerate(body) if message.get("role") == "user"]
+            if len(turn_starts) > self.keep_turns:
+                start = turn_starts[-self.keep_turns]
+        # 仍超预算时从最早的消息开始裁剪，至少保留最后一条
+        kept_tokens = sum(body_costs[start:])
+        while start < len(body) - 1 and fixed + kept_tokens > budget:
+            kept_tokens -= body_costs[start]
+            start += 1
+        # 保留部分不以助手回复开头
+        while start < len(body) - 1 and body[start].get("role") != "user":
+            kept_tokens -= body_costs[start]
+            start += 1
+
+        if start == 0:
+            return Compaction(messages, self.strategy, total, total)
+
+        older = body[:start]
+        summary_messages: List[Dict[str, Any]] = []
+        summarized = 0
+        job = None
+        if self.strategy == "summary":
+            summary, summarized, key = self._find_summary(older)
+            if summary is not None:
+                summary_messages = [{"role": "system", "content": f"此前对话的摘要：{summary}"}]
+            if key not in self._summaries:
+                job = (key, summary, older[summarized:])
+
+        tokens_after = sum(costs[:lead]) + sum(map(estimate_tokens, summary_messages)) + kept_tokens
+        result = Compaction(messages[:lead] + summary_messages + body[start:], self.strategy, total, tokens_after)
+        result.dropped = len(older)
+        result.summarized = summarized
+        result.summary_job = job
+        return result
+
+    def _prefix_keys(self, older: List[Dict[str, Any]]) -> List[Tuple[int, bytes]]:
+        """已移出窗口的历史在每个轮次边界处的前缀摘要键：[(前缀消息数, 键)]，最后一项覆盖全部 older"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update((current_username.get() or "-").encode("utf-8"))
+        keys = []
+        for index, message in enumerate(older):
+            if index and message.get("role") == "user":
+                keys.append((index, digest.digest()))
+            digest.update(b"\x00" + str(message.get("role")).encode("utf-8") + b"\x01")
+            digest.update(json_backend.dumps(message.get("content")))
+        keys.append((len(older), digest.digest()))
+        return keys
+
+    def _find_summary(self, older: List[Dict[str, Any]]) -> Tuple[Optional[str], int, bytes]:
+        """
+        查找覆盖 older 最长前缀的已有摘要
+
+        Returns:
+            Tuple: (摘要文本或 None, 摘要覆盖的消息数, 覆盖全部 older 的摘要键)
+        """
+        keys = self._prefix_keys(older)
+        for length, key in reversed(keys):
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary, length, keys[-1][1]
+        return None, 0, keys[-1][1]
+
+    def record(self, compaction: Compaction, model: Optional[str]):
+        """记录压缩统计"""
+        if compaction.saved_tokens:
+            metrics.inc("history_compaction_total", strategy=compaction.strategy, result="compacted")
+            metrics.inc(
+                "history_compaction_saved_tokens_total", compaction.saved_tokens,
+                strategy=compaction.strategy, model=model or "-",
+            )
+            app_logger.info(
+                f"对话历史已压缩: strategy={compaction.strategy}, model={model}, "
+                f"tokens {compaction.tokens_before} -> {compaction.tokens_after}, "
+                f"移出 {compaction.dropped} 条消息（其中 {compaction.summarized} 条由摘要代替）"
+            )
+        else:
+            metrics.inc("history_compaction_total", strategy=compaction.strategy, result="unchanged")
+
+    def schedule_summary(self, compaction: Compaction, model: str, summarize: Summarize):
+        """
+        在后台为移出窗口的轮次生成滚动摘要（响应返回后调用）
+
+        Args:
+            compaction: 本轮的压缩结果
+            model: 对话使用的模型（未配置 HISTORY_SUMMARY_MODEL 时用于生成摘要）
+            summarize: 调用模型生成摘要的协程函数
+        """
+        job = compaction.summary_job
+        if job is None or job[0] in self._pending:
+            return
+        key = job[0]
+        self._pending.add(key)
+        task = asyncio.get_running_loop().create_task(
+            self._summarize(key, job[1], job[2], settings.history_summary_model or model, summarize)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(
+        self, key: bytes, previous: Optional[str], messages: List[Dict[str, Any]], model: str, summarize: Summarize
+    ):
+        # 任务复制了请求的上下文：摘要不随客户端断开取消、不受本轮截止时间限制、不占用本轮的限流预扣，
+        # 以低优先级排队，用量单独记在 SUMMARY_ENDPOINT 下
+        current_disconnect.set(None)
+        current_deadline.set(None)
+        current_reservation.set(None)
+        current_priority.set(BULK)
+        current_endpoint.set(SUMMARY_ENDPOINT)
+        try:
+            lines = [
+                f"{ROLE_NAMES.get(message.get('role'), message.get('role'))}: {self._text_of(message)}"
+                for message in messages
+            ]
+            transcript = "\n".join(lines)
+            if previous:
+                transcript = f"此前的摘要：\n{previous}\n\n新增的对话：\n{transcript}"
+            result = await summarize(prompt_registry.build_messages("history_summary", None, transcript), model)
+            if result.get("success") and result.get("content"):
+                self._summaries[key] = result["content"].strip()
+                while len(self._summaries) > SUMMARY_CACHE_MAX_ENTRIES:
+                    self._summaries.popitem(last=False)
+                metrics.inc("history_summaries_total", result="success")
+            else:
+                metrics.inc("history_summaries_total", result="failure")
+                app_logger.warning(f"对话历史摘要生成失败: {result.get('error')}")
+        except Exception:
+            metrics.inc("history_summaries_total", result="failure")
+            app_logger.exception("对话历史摘要生成异常")
+        finally:
+            self._pending.discard(key)
+
+    @staticmethod
+    def _text_of(message: Dict[str, Any]) -> str:
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        return " ".join(
+            str(part.get("text", "")) if isinstance(part, dict) and part.get("type") == "text" else "[图片]"
+            for part in content or ()
+        )
+
+    async def close(self):
+        """取消进行中的摘要任务（摘要只是优化，关闭服务时不必等待上游生成）"""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# 全局实例
+history_compactor = HistoryCompactor()
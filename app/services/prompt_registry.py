@@ -0,0 +1,238 @@
+"""
+提示词模板注册表
+集中管理各功能的系统提示词与任务指令，启动时构建一次，并支持从文件热加载
+
+消息布局固定为：系统提示词 -> 任务指令 -> 可变内容。
+相同功能、相同任务的请求共享完全一致的消息前缀，便于上游命中前缀缓存（KV Cache）。
+"""
+
+import os
+import copy
+import json
+import time
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.core.config import settings
+from app.core.logger import app_logger
+
+
+# 默认模板，可被模板文件中的同名字段覆盖
+DEFAULT_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "text_analysis": {
+        "system": "你是一个专业的文本分析助手，能够准确理解和分析各种类型的文本内容。请用中文回答。",
+        "default": "analyze",
+        "instructions": {
+            "analyze": "请详细分析以下文本的内容，提取关键信息，分析主题和要点。",
+            "summarize": "请简明扼要地总结以下文本的主要内容，保留核心信息。",
+            "extract": "请从以下文本中提取所有重要的实体、数字、日期和关键信息。",
+            "translate": "请将以下文本翻译成中文（如果是中文则翻译成英文）。",
+            "sentiment": "请分析以下文本的情感倾向（正面/负面/中性）和情感强度。",
+            "classify": "请对以下文本进行分类，并说明分类依据。",
+            "keywords": "请提取以下文本的关键词和主题词，按重要性排序。",
+            "qa": "请基于以下文本回答用户的问题。"
+        }
+    },
+    "code_assist": {
+        "system": "你是一个专业的编程助手，精通各种编程语言和最佳实践。",
+        "default": "review",
+        "instructions": {
+            "review": "请对以下代码进行代码审查，指出潜在问题和改进建议。",
+            "optimize": "请优化以下代码，提高性能和可读性。",
+            "explain": "请详细解释以下代码的功能和实现逻辑。",
+            "debug": "请帮助调试以下代码，找出并修复错误。",
+            "generate": "请根据需求生成代码。",
+            "convert": "请将以下代码转换为指定的目标语言（未指定时转换为Python）。",
+            "test": "请为以下代码编写单元测试。",
+            "document": "请为以下代码生成详细的文档注释。"
+        }
+    },
+    "ocr": {
+        "system": "你是一个专业的OCR文字识别助手，能够准确识别图片中的文字内容。",
+        "default": "auto:medium",
+        "template": "请识别这张图片中的所有文字。\n要求：\n1. {language}\n2. {detail}\n3. 保持原始格式和布局\n4. 如果有表格，请用代码格式展示\n5. 标注不确定的文字",
+        "languages": {
+            "auto": "自动识别图片中的文字语言",
+            "zh": "识别中文文字",
+            "en": "识别英文文字",
+            "mix": "识别中英文混合文字"
+        },
+        "details": {
+            "high": "请尽可能详细地识别图片中的所有文字，包括小字、水印等",
+            "medium": "请识别图片中的主要文字内容",
+            "low": "请快速识别图片中的关键文字"
+        }
+    },
+    "history_summary": {
+        "system": "你负责压缩长对话的历史，为后续对话保留必要的上下文。",
+        "default": "rolling",
+        "instructions": {
+            "rolling": "请把以下对话（以及此前的摘要，如有）合并为一段简洁的摘要：保留用户的目标与偏好、已确认的事实和数据、"
+                       "已做出的决定以及尚未解决的问题，省略寒暄和重复内容。直接输出摘要，不超过 300 字。"
+        }
+    },
+    "image_description": {
+        "system": "你是一个专业的图像描述生成器，能够将简单的描述转换为详细、生动的图像描述。",
+        "default": "realistic",
+        "template": "{style}。\n\n请根据用户提供的基础描述生成一个详细的图像描述，包括：\n1. 主体物体的详细特征\n2. 背景和环境\n3. 光线和色彩\n4. 氛围和情绪\n5. 艺术风格",
+        "styles": {
+            "realistic": "请生成一个超现实、高清、细节丰富的图像描述",
+            "artistic": "请生成一个艺术风格、富有创意的图像描述",
+            "cartoon": "请生成一个卡通风格、生动有趣的图像描述"
+        }
+    }
+}
+
+
+def _deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """递归合并字典，override 中的值覆盖 base"""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class PromptRegistry:
+    """提示词模板注册表"""
+
+    def __init__(self, templates_file: Optional[str] = None, reload_interval: float = 2.0):
+        """
+        初始化注册表
+
+        Args:
+            templates_file: 模板覆盖文件路径（JSON），不存在时使用默认模板
+            reload_interval: 检查模板文件变更的最小间隔（秒）
+        """
+        self.templates_file = templates_file
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._file_mtime: Optional[float] = None
+        self._next_check = 0.0
+        # (功能, 任务键) -> (系统消息, 指令消息)，消息对象构建后不再修改
+        self._prefixes: Dict[Tuple[str, str], Tuple[Dict[str, str], Dict[str, str]]] = {}
+        self._defaults: Dict[str, str] = {}
+        # 功能 -> 组合键各段的合法取值 {(段序号, 取值)}
+        self._key_parts: Dict[str, set] = {}
+        self._load()
+
+    def _read_overrides(self) -> Dict[str, Any]:
+        """读取模板覆盖文件"""
+        if not self.templates_file or not os.path.exists(self.templates_file):
+            self._file_mtime = None
+            return {}
+        self._file_mtime = os.path.getmtime(self.templates_file)
+        try:
+            with open(self.templates_file, "r", encoding="utf-8") as f:
+                overrides = json.load(f)
+            return overrides if isinstance(overrides, dict) else {}
+        except Exception as e:
+            app_logger.error(f"加载提示词模板文件失败: {e}")
+            return {}
+
+    def _load(self):
+        """构建全部消息前缀"""
+        templates = _deep_merge(DEFAULT_TEMPLATES, self._read_overrides())
+        prefixes: Dict[Tuple[str, str], Tuple[Dict[str, str], Dict[str, str]]] = {}
+        defaults: Dict[str, str] = {}
+        key_parts: Dict[str, set] = {}
+
+        for kind, template in templates.items():
+            system_message = {"role": "system", "content": template["system"]}
+            key_parts[kind] = set()
+            for key, instruction in self._expand_instructions(template).items():
+                prefixes[(kind, key)] = (system_message, {"role": "user", "content": instruction})
+                key_parts[kind].update(enumerate(key.split(":")))
+            defaults[kind] = template.get("default", "")
+
+        self._prefixes = prefixes
+        self._defaults = defaults
+        self._key_parts = key_parts
+        app_logger.info(f"提示词模板已加载: {len(prefixes)} 个消息前缀")
+
+    @staticmethod
+    def _expand_instructions(template: Dict[str, Any]) -> Dict[str, str]:
+        """把模板展开为 任务键 -> 指令文本，组合型模板预先生成全部组合"""
+        if "instructions" in template:
+            return dict(template["instructions"])
+        if "languages" in template:
+            return {
+                f"{language}:{detail}": template["template"].format(language=language_text, detail=detail_text)
+                for language, language_text in template["languages"].items()
+                for detail, detail_text in template["details"].items()
+            }
+        if "styles" in template:
+            return {
+                style: template["template"].format(style=style_text)
+                for style, style_text in template["styles"].items()
+            }
+        return {}
+
+    def _maybe_reload(self):
+        """按间隔检查模板文件是否变更，变更时重新构建"""
+        if not self.templates_file:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.reload_interval
+            try:
+                mtime = os.path.getmtime(self.templates_file)
+            except OSError:
+                mtime = None
+            if mtime != self._file_mtime:
+                app_logger.info("检测到提示词模板文件变更，重新加载")
+                self._load()
+
+    def _fallback_key(self, kind: str, key: Optional[str]) -> str:
+        """未知任务键回退到默认值；组合键（如 zh:high）逐段回退"""
+        default = self._defaults[kind]
+        parts = (key or "").split(":")
+        default_parts = default.split(":")
+        if len(default_parts) == 1 or len(parts) != len(default_parts):
+            return default
+        resolved = [
+            part if (index, part) in self._key_parts[kind] else default_part
+            for index, (part, default_part) in enumerate(zip(parts, default_parts))
+        ]
+        return ":".join(resolved)
+
+    def build_messages(
+        self,
+        kind: str,
+        key: Optional[str],
+        content: Any,
+        instruction: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        构建对话消息
+
+        Args:
+            kind: 功能名称，如 text_analysis、code_assist、ocr、image_description
+            key: 任务键，不存在时回退到该功能的默认任务
+            content: 可变内容（文本或多模态内容列表），放在最后一条消息
+            instruction: 自定义指令，提供时替换任务指令（不再共享前缀）
+
+        Returns:
+            List[Dict[str, Any]]: 系统提示词、任务指令、可变内容三条消息
+        """
+        self._maybe_reload()
+        prefix = self._prefixes.get((kind, key)) or self._prefixes[(kind, self._fallback_key(kind, key))]
+        system_message, instruction_message = prefix
+        if instruction:
+            instruction_message = {"role": "user", "content": instruction}
+        return [system_message, instruction_message, {"role": "user", "content": content}]
+
+    def reload(self):
+        """强制重新加载模板"""
+        with self._lock:
+            self._load()
+
+
+# 全局实例
+prompt_registry = PromptRegistry(settings.prompt_templates_file, settings.prompt_reload_interval)
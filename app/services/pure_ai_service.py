@@ -4,14 +4,31 @@
 """
 
 import os
-import json
+import time
 import base64
-from typing import Optional, Dict, Any, List
+import asyncio
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 
 import httpx
 from httpx import RequestError, ResponseNotRead
 from app.core.config import settings
 from app.core.logger import app_logger
+from app.core import json_backend
+from app.core.blob_store import blob_store
+from app.core.sse import aiter_sse, parse_chat_chunk
+from app.core.usage import usage_tracker
+from app.core.rate_limit import rate_limiter
+from app.core.scheduler import scheduler, SchedulerRejected, STANDARD
+from app.core.request_context import current_username, current_endpoint
+from app.core.disconnect import ClientDisconnected, cancel_on_disconnect, record_cancellation
+from app.core import deadline
+from app.services.prompt_registry import prompt_registry
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.history_compaction import history_compactor
+
+# 流式内容片段回调：每收到一段增量内容调用一次
+DeltaCallback = Callable[[str], Awaitable[None]]
 
 
 class PureAIService:
@@ -30,9 +47,9 @@ class PureAIService:
             "Content-Type": "application/json"
         }
 
-        # 设置默认模型和超时配置
+        # 设置默认模型和超时配置（模型调用按请求截止时间单独设置超时，见 app.core.deadline）
         self.default_model = settings.default_model
-        self._timeout = httpx.Timeout(self.timeout)
+        self._timeout = httpx.Timeout(self.timeout, connect=settings.api_connect_timeout)
 
         # 复用单一 AsyncClient，避免每次请求重建 TCP/TLS 连接
         self._client = httpx.AsyncClient(
@@ -41,9 +58,29 @@ class PureAIService:
             timeout=self._timeout,
         )
 
+        # 下载 CDN 资源（如编辑后的图片）使用独立客户端，不携带平台认证头，超时使用 BLOB_FETCH_TIMEOUT
+        self._download_client = httpx.AsyncClient(
+            headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+                "Referer": "https://cloud.siliconflow.cn/"
+            },
+            timeout=httpx.Timeout(settings.blob_fetch_timeout, connect=settings.api_connect_timeout),
+            follow_redirects=True,
+        )
+
+        # 并发的单条文本向量化请求合并成批量上游调用
+        self._embedding_batcher = EmbeddingBatcher(
+            self._send_embedding_batch,
+            max_batch_size=settings.embedding_batch_max_size,
+            max_wait_ms=settings.embedding_batch_wait_ms,
+        )
+
     async def close(self):
         """关闭 HTTP 客户端（应用关闭时调用）"""
+        await history_compactor.close()
+        await self._embedding_batcher.close()
         await self._client.aclose()
+        await self._download_client.aclose()
         
     async def call_ai(
         self, 
@@ -51,7 +88,9 @@ class PureAIService:
         model: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 2000,
-        stream: bool = True
+        stream: bool = True,
+        n: int = 1,
+        on_delta: Optional[DeltaCallback] = None
     ) -> Dict[str, Any]:
         """
         调用AI模型的通用接口
@@ -62,11 +101,14 @@ class PureAIService:
             temperature: 温度参数，控制生成文本的随机性(0-1)
             max_tokens: 最大token数，限制生成文本的长度
             stream: 是否使用流式输出，True为流式，False为一次性返回
+            n: 单次请求生成的候选数量，大于1时使用上游原生 n 参数并强制非流式
+            on_delta: 流式调用时每收到一个内容片段调用一次（用于向 WebSocket 等客户端转发增量），结果仍返回完整内容
             
         Returns:
             Dict[str, Any]: 包含调用结果的字典
                 - success: 调用是否成功
                 - content: AI生成的内容
+                - contents: 全部候选内容列表（仅 n>1 时返回）
                 - model: 实际使用的模型名称
                 - usage: token使用情况
                 - finish_reason: 完成原因
@@ -80,9 +122,6 @@ class PureAIService:
                     "error": "未指定模型，请先在模型管理页面配置可用模型"
                 }
 
-            # 移除敏感信息，只记录部分内容用于日志
-            log_messages = json.dumps(messages, ensure_ascii=False)
-
             # 记录API配置信息用于调试
             app_logger.info(f"API配置检查 - base_url: {self.base_url}")
             app_logger.debug(f"API配置检查 - headers: {self._redact_headers(self.headers)}")
@@ -95,7 +134,8 @@ class PureAIService:
                 max_tokens,
                 stream,
             )
-            app_logger.debug(f"AI请求内容: {log_messages}")
+            # 请求内容可能包含大段 base64，仅在开启 DEBUG 日志时才序列化
+            app_logger.opt(lazy=True).debug("AI请求内容: {}", lambda: json_backend.dumps_pretty(messages))
 
             # 构造请求参数
             payload = {
@@ -105,15 +145,123 @@ class PureAIService:
                 "max_tokens": max_tokens,
                 "stream": stream,
             }
+            # 多候选生成只走非流式接口，便于按 index 收集全部 choices
+            if n > 1:
+                payload["n"] = n
+                payload["stream"] = stream = False
 
             # 复用已有的异步HTTP客户端
             endpoint = "/chat/completions"
             app_logger.info(f"完整请求路径: {endpoint}")
-            app_logger.debug(f"请求payload: {payload}")
 
+            # 使用 JSON 后端编码请求体（客户端默认头已声明 application/json）
+            body = json_backend.dumps(payload)
+
+            # 客户端断开时取消排队或进行中的上游请求，避免为无人接收的回答继续消耗 token；
+            # 排队与上游调用的总耗时不超过请求截止时间
+            progress = {"phase": "queued", "generated": 0}
+            try:
+                return await cancel_on_disconnect(
+                    asyncio.wait_for(
+                        self._dispatch(endpoint, body, model, stream, n, progress, on_delta),
+                        timeout=deadline.total_timeout(),
+                    )
+                )
+            except ClientDisconnected as exc:
+                saved = max(0, max_tokens * n - progress["generated"])
+                record_cancellation(current_endpoint.get() or endpoint, progress["phase"], saved)
+                return {
+                    "success": False,
+                    "error": str(exc),
+                    "cancelled": True,
+                }
+            except asyncio.TimeoutError:
+                deadline.record_timeout(progress["phase"])
+                stage = "排队中" if progress["phase"] == "queued" else "等待上游响应时"
+                app_logger.warning(f"模型调用超过截止时间（{stage}）: model={model}")
+                return {
+                    "success": False,
+                    "error": f"模型调用超过截止时间（{stage}）",
+                    "deadline_exceeded": True,
+                }
+
+        except deadline.DeadlineExceeded as exc:
+            # 排队结束后剩余时间已不足以完成调用，未发起上游请求
+            app_logger.warning(f"模型调用未发起: {exc}")
+            return {
+                "success": False,
+                "error": str(exc),
+                "deadline_exceeded": True,
+            }
+        except SchedulerRejected as exc:
+            # 排队已满或被高优先级请求抢占
+            app_logger.warning(f"模型调用未能排队: {exc}")
+            return {
+                "success": False,
+                "error": str(exc),
+            }
+        except httpx.TimeoutException as exc:
+            # 建立连接、等待首个片段等阶段超时
+            deadline.record_timeout("upstream")
+            app_logger.error(f"上游请求超时: {exc!r}")
+            return {
+                "success": False,
+                "error": f"上游请求超时: {exc!r}",
+                "deadline_exceeded": True,
+            }
+        except RequestError as exc:
+            # 处理HTTP请求异常
+            app_logger.error(f"HTTP请求异常: {exc}")
+            return {
+                "success": False,
+                "error": f"HTTP请求异常: {exc}",
+            }
+        except Exception as e:
+            # 处理其他异常
+            app_logger.exception("AI API调用异常")
+            return {
+                "success": False,
+                "error": f"API调用异常: {str(e)}",
+            }
+
+    async def _dispatch(
+        self,
+        endpoint: str,
+        body: bytes,
+        model: str,
+        stream: bool,
+        n: int,
+        progress: Dict[str, Any],
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        获取调度槽位并发送上游请求
+
+        Args:
+            endpoint: 上游接口路径
+            body: 已编码的请求体
+            model: 模型名称
+            stream: 是否流式读取上游响应
+            n: 候选数量
+            progress: 调用进度，供取消时统计：phase（queued / upstream）、generated（已收到的内容片段数）
+            on_delta: 流式内容片段回调
+
+        Returns:
+            Dict[str, Any]: 与 call_ai 相同的结果字典
+
+        Raises:
+            DeadlineExceeded: 排队结束后剩余时间不足以完成调用
+        """
+        # 按优先级与用户公平排队获取上游调用槽位，槽位内完成请求与响应读取
+        async with scheduler.slot():
+            # 排队可能耗尽了预算，注定超时的请求不再发往上游
+            deadline.ensure_budget("dispatch")
+            progress["phase"] = "upstream"
+            started = time.perf_counter()
+            timeout = deadline.upstream_timeout(stream)
             # 根据是否流式输出选择不同的处理方式
             if stream:
-                async with self._client.stream("POST", endpoint, json=payload) as response:
+                async with self._client.stream("POST", endpoint, content=body, timeout=timeout) as response:
                     app_logger.info(f"响应状态码: {response.status_code}")
                     app_logger.info(f"响应头: {dict(response.headers)}")
 
@@ -122,10 +270,14 @@ class PureAIService:
                         return await self._build_error_response(response)
 
                     # 处理流式响应
-                    return await self._consume_stream_response(response)
+                    result = await self._consume_stream_response(response, progress, on_delta)
+                    if result.get("success"):
+                        deadline.record_latency(time.perf_counter() - started)
+                    self._record_usage(result.get("model") or model, result.get("usage"))
+                    return result
 
             # 非流式请求处理
-            response = await self._client.post(endpoint, json=payload)
+            response = await self._client.post(endpoint, content=body, timeout=timeout)
             app_logger.info(f"响应状态码: {response.status_code}")
             app_logger.info(f"响应头: {dict(response.headers)}")
 
@@ -135,8 +287,8 @@ class PureAIService:
 
             # 解析JSON响应
             try:
-                result = response.json()
-            except json.JSONDecodeError as exc:
+                result = json_backend.loads(response.content)
+            except json_backend.JSONDecodeError as exc:
                 app_logger.error(f"解析响应JSON失败: {exc}")
                 return {
                     "success": False,
@@ -147,7 +299,8 @@ class PureAIService:
 
             # 提取响应信息
             usage = result.get("usage", {})
-            finish_reason = result.get("choices", [{}])[0].get("finish_reason")
+            choices = result.get("choices") or [{}]
+            finish_reason = choices[0].get("finish_reason")
 
             # 记录成功调用信息
             app_logger.info(
@@ -156,37 +309,45 @@ class PureAIService:
                 finish_reason,
             )
             app_logger.debug(f"AI响应 usage: {usage}")
+            deadline.record_latency(time.perf_counter() - started)
+            self._record_usage(result.get("model") or model, usage)
 
             # 返回成功结果
-            return {
+            response_data = {
                 "success": True,
-                "content": result.get("choices", [{}])[0].get("message", {}).get("content"),
+                "content": choices[0].get("message", {}).get("content"),
                 "model": result.get("model"),
                 "usage": usage,
                 "finish_reason": finish_reason,
             }
+            if n > 1:
+                ordered = sorted(choices, key=lambda choice: choice.get("index", 0))
+                response_data["contents"] = [
+                    choice.get("message", {}).get("content") for choice in ordered
+                ]
+            return response_data
 
-        except RequestError as exc:
-            # 处理HTTP请求异常
-            app_logger.error(f"HTTP请求异常: {exc}")
-            return {
-                "success": False,
-                "error": f"HTTP请求异常: {exc}",
-            }
-        except Exception as e:
-            # 处理其他异常
-            app_logger.exception("AI API调用异常")
-            return {
-                "success": False,
-                "error": f"API调用异常: {str(e)}",
-            }
+    @staticmethod
+    def _record_usage(model: str, usage: Optional[Dict[str, Any]]):
+        """按当前请求的用户与接口累计 token 用量，并结算限流预扣的 token（仅更新内存计数）"""
+        username = current_username.get()
+        usage_tracker.record(username, model, current_endpoint.get(), usage)
+        if usage:
+            rate_limiter.settle(username, int(usage.get("total_tokens") or 0))
 
-    async def _consume_stream_response(self, response: httpx.Response) -> Dict[str, Any]:
+    async def _consume_stream_response(
+        self,
+        response: httpx.Response,
+        progress: Optional[Dict[str, Any]] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> Dict[str, Any]:
         """
         处理流式响应数据
         
         Args:
             response: HTTP响应对象
+            progress: 调用进度，每收到一个内容片段 generated 加一（约等于一个 token）
+            on_delta: 每收到一个非空内容片段时调用
             
         Returns:
             Dict[str, Any]: 解析后的响应数据
@@ -201,48 +362,42 @@ class PureAIService:
         model_name: Optional[str] = None
         usage_info: Dict[str, Any] = {}
         finish_reason: Optional[str] = None
+        # 首个片段与片段之间分别限时（均不超过请求剩余时间），停滞的流不会长时间占用连接
+        waiting_first = True
 
         try:
-            # 逐行读取流式响应
-            async for line in response.aiter_lines():
-                # 跳过空行
-                if not line:
-                    continue
-                # 只处理以"data:"开头的行
-                if not line.startswith("data:"):
-                    continue
-
-                # 提取数据部分并去除首尾空格
-                data_str = line[5:].strip()
-                if not data_str:
-                    continue
-                # 遇到结束标记则停止处理
-                if data_str == "[DONE]":
-                    break
-
-                # 解析JSON数据
-                try:
-                    data = json.loads(data_str)
-                except json.JSONDecodeError:
-                    # JSON解析失败则跳过该行
-                    continue
-
-                # 提取响应内容
-                if "choices" in data and data["choices"]:
-                    delta = data["choices"][0].get("delta", {})
-                    if "content" in delta:
-                        content = delta["content"]
-                        # 确保content不是None后再添加到列表中
-                        if content is not None:
-                            content_parts.append(content)
-                    # 获取完成原因
-                    finish_reason = data["choices"][0].get("finish_reason") or finish_reason
-                # 提取模型名称
-                if "model" in data:
-                    model_name = data["model"]
-                # 提取使用情况
-                if "usage" in data:
-                    usage_info = data["usage"]
+            # 直接在原始字节块上增量解析 SSE 事件
+            async with aclosing(aiter_sse(response.aiter_bytes())) as events:
+                while True:
+                    limit = settings.api_first_byte_timeout if waiting_first else settings.api_idle_timeout
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), deadline.phase_timeout(limit))
+                    except StopAsyncIteration:
+                        break
+                    waiting_first = False
+
+                    # 遇到结束标记则停止处理
+                    if event.data == "[DONE]":
+                        break
+
+                    # 解析数据块，JSON 无效则跳过
+                    chunk = parse_chat_chunk(event.data)
+                    if chunk is None:
+                        continue
+
+                    # 提取响应内容和完成原因
+                    if chunk.content is not None:
+                        content_parts.append(chunk.content)
+                        if progress is not None:
+                            progress["generated"] += 1
+                        if on_delta is not None and chunk.content:
+                            await on_delta(chunk.content)
+                    finish_reason = chunk.finish_reason or finish_reason
+                    # 提取模型名称和使用情况
+                    if chunk.model:
+                        model_name = chunk.model
+                    if chunk.usage is not None:
+                        usage_info = chunk.usage
 
             # 将所有内容片段合并成完整内容
             full_content = "".join(content_parts)
@@ -263,6 +418,15 @@ class PureAIService:
                 "usage": usage_info,
                 "finish_reason": finish_reason,
             }
+        except asyncio.TimeoutError:
+            stage = "首个片段" if waiting_first else "后续片段"
+            deadline.record_timeout("first_byte" if waiting_first else "idle")
+            app_logger.warning(f"等待上游流式响应{stage}超时，已中止")
+            return {
+                "success": False,
+                "error": f"等待上游流式响应{stage}超时",
+                "deadline_exceeded": True,
+            }
         except Exception as exc:
             # 处理解析异常
             app_logger.error(f"解析流式响应失败: {exc}")
@@ -288,10 +452,10 @@ class PureAIService:
         # 尝试解析JSON格式的错误信息
         if raw_text:
             try:
-                parsed = json.loads(raw_text)
+                parsed = json_backend.loads(raw_text)
                 if isinstance(parsed, dict):
                     parsed_payload = parsed
-            except json.JSONDecodeError:
+            except json_backend.JSONDecodeError:
                 parsed_payload = None
 
         # 提取错误消息
@@ -405,32 +569,13 @@ class PureAIService:
                 - model: 实际使用的模型名称
                 - usage: token使用情况
         """
-        # 根据任务类型定义不同的提示词模板
-        task_prompts = {
-            "analyze": "请详细分析以下文本的内容，提取关键信息，分析主题和要点。",
-            "summarize": "请简明扼要地总结以下文本的主要内容，保留核心信息。",
-            "extract": "请从以下文本中提取所有重要的实体、数字、日期和关键信息。",
-            "translate": "请将以下文本翻译成中文（如果是中文则翻译成英文）。",
-            "sentiment": "请分析以下文本的情感倾向（正面/负面/中性）和情感强度。",
-            "classify": "请对以下文本进行分类，并说明分类依据。",
-            "keywords": "请提取以下文本的关键词和主题词，按重要性排序。",
-            "qa": "请基于以下文本回答用户的问题。"
-        }
-        
-        # 选择提示词：优先使用自定义提示词，其次根据任务类型选择，最后使用默认分析提示词
-        prompt = custom_prompt or task_prompts.get(task, task_prompts["analyze"])
-        
-        # 构造对话消息
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的文本分析助手，能够准确理解和分析各种类型的文本内容。请用中文回答。"
-            },
-            {
-                "role": "user",
-                "content": f"{prompt}\n\n文本内容：\n{text}"
-            }
-        ]
+        # 固定前缀（系统提示词 + 任务指令）由模板注册表提供，自定义提示词替换任务指令
+        messages = prompt_registry.build_messages(
+            "text_analysis",
+            task,
+            f"文本内容：\n{text}",
+            instruction=custom_prompt
+        )
         
         # 调用AI模型进行文本分析
         result = await self.call_ai(messages, model=model)
@@ -480,49 +625,19 @@ class PureAIService:
         
         vision_model = model
         
-        # 定义不同语言的识别提示词
-        language_prompts = {
-            "auto": "自动识别图片中的文字语言",
-            "zh": "识别中文文字",
-            "en": "识别英文文字",
-            "mix": "识别中英文混合文字"
-        }
-        
-        # 定义不同精度级别的识别要求
-        detail_prompts = {
-            "high": "请尽可能详细地识别图片中的所有文字，包括小字、水印等",
-            "medium": "请识别图片中的主要文字内容",
-            "low": "请快速识别图片中的关键文字"
-        }
-        
-        # 构造包含图片和指令的多模态消息
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的OCR文字识别助手，能够准确识别图片中的文字内容。"
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"""请识别这张图片中的所有文字。
-要求：
-1. {language_prompts.get(language, language_prompts["auto"])}
-2. {detail_prompts.get(detail_level, detail_prompts["medium"])}
-3. 保持原始格式和布局
-4. 如果有表格，请用代码格式展示
-5. 标注不确定的文字"""
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
+        # 识别指令按 语言:精度 组合预先构建，图片作为最后一条消息
+        messages = prompt_registry.build_messages(
+            "ocr",
+            f"{language}:{detail_level}",
+            [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image_base64}"
                     }
-                ]
-            }
-        ]
+                }
+            ]
+        )
         
         # 调用视觉模型进行OCR识别，使用较低的温度参数以提高准确性
         result = await self.call_ai(messages, model=vision_model, temperature=0.1)
@@ -581,43 +696,20 @@ class PureAIService:
         
         code_model = model
         
-        # 定义不同代码任务的提示词模板
-        task_prompts = {
-            "review": "请对以下代码进行代码审查，指出潜在问题和改进建议。",
-            "optimize": "请优化以下代码，提高性能和可读性。",
-            "explain": "请详细解释以下代码的功能和实现逻辑。",
-            "debug": "请帮助调试以下代码，找出并修复错误。",
-            "generate": "请根据需求生成代码。",
-            "convert": f"请将以下代码转换为{language or 'Python'}。",
-            "test": "请为以下代码编写单元测试。",
-            "document": "请为以下代码生成详细的文档注释。"
-        }
-        
-        # 选择任务提示词，并添加具体需求（如果提供）
-        prompt = task_prompts.get(task, task_prompts["review"])
-        if requirements:
-            prompt = f"{prompt}\n具体要求：{requirements}"
-        
-        # 构造包含代码和指令的内容
-        content = f"{prompt}\n\n"
+        # 目标语言、具体需求和代码都属于可变内容，放在固定指令之后
+        content_parts = []
+        if task == "convert":
+            content_parts.append(f"目标语言：{language or 'Python'}")
         if code:
+            if requirements:
+                content_parts.append(f"具体要求：{requirements}")
             # 如果提供了代码，则包含代码块
-            content += f"代码：\n```{language or ''}\n{code}\n```"
+            content_parts.append(f"代码：\n```{language or ''}\n{code}\n```")
         else:
             # 如果没有提供代码，则使用需求描述
-            content += f"需求：{requirements or '请生成一个示例代码'}"
+            content_parts.append(f"需求：{requirements or '请生成一个示例代码'}")
         
-        # 构造对话消息
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的编程助手，精通各种编程语言和最佳实践。"
-            },
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
+        messages = prompt_registry.build_messages("code_assist", task, "\n\n".join(content_parts))
         
         # 调用AI模型进行代码辅助，使用较低的温度参数以提高代码准确性
         result = await self.call_ai(
@@ -649,6 +741,7 @@ class PureAIService:
     ) -> Dict[str, Any]:
         """
         自定义对话接口，允许用户构建自己的对话消息并调用AI模型
+        发往上游前按 HISTORY_COMPACTION 策略压缩对话历史，使提示词不超过模型的 token 预算
         
         Args:
             messages: 对话消息列表，每个消息包含role(角色)和content(内容)
@@ -657,14 +750,124 @@ class PureAIService:
             **kwargs: 其他参数，如temperature、max_tokens、stream等
             
         Returns:
-            Dict[str, Any]: 对话结果，格式与call_ai方法返回值相同
+            Dict[str, Any]: 对话结果，格式与call_ai方法返回值相同，另含
+                - compaction: 历史压缩统计（策略、压缩前后的估算 token 数、节省的 token 数、移出的消息数）
         """
         # 如果提供了系统提示词，则将其添加到消息列表开头
         if system_prompt:
             messages = [{"role": "system", "content": system_prompt}] + messages
-        
+
+        compaction = history_compactor.compact(messages, model)
+        history_compactor.record(compaction, model)
+
         # 调用通用AI接口
-        return await self.call_ai(messages, model=model, **kwargs)
+        result = await self.call_ai(compaction.messages, model=model, **kwargs)
+        if result.get("success") and model:
+            # 响应返回后在后台为移出窗口的轮次生成滚动摘要
+            history_compactor.schedule_summary(compaction, model, self._summarize_history)
+        if compaction.strategy != "none":
+            result["compaction"] = compaction.report()
+        return result
+
+    async def _summarize_history(self, messages: List[Dict[str, Any]], model: str) -> Dict[str, Any]:
+        """生成对话历史摘要（由历史压缩器在后台调用）"""
+        return await self.call_ai(
+            messages,
+            model=model,
+            temperature=0.3,
+            max_tokens=settings.history_summary_max_tokens,
+            stream=False,
+        )
+
+    async def create_embeddings(self, texts: List[str], model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        文本向量化，每条文本交给微批处理器与其他并发请求合并后调用上游
+
+        Args:
+            texts: 待向量化的文本列表
+            model: 向量模型名称
+
+        Returns:
+            Dict[str, Any]: 向量化结果
+                - success: 是否成功
+                - embeddings: 与 texts 一一对应的向量列表
+                - model: 使用的模型名称
+                - usage: token使用情况（按文本长度从所在批次分摊）
+                - error: 错误信息(如果失败)
+        """
+        if not model:
+            return {
+                "success": False,
+                "error": "未指定模型，请在请求中指定向量模型"
+            }
+        if not texts:
+            return {
+                "success": False,
+                "error": "待向量化的文本不能为空"
+            }
+
+        endpoint = current_endpoint.get() or "/embeddings"
+        try:
+            results = await cancel_on_disconnect(
+                asyncio.wait_for(
+                    asyncio.gather(*[self._embedding_batcher.embed(model, text) for text in texts]),
+                    timeout=deadline.total_timeout(),
+                )
+            )
+        except ClientDisconnected as exc:
+            record_cancellation(endpoint, "upstream", 0)
+            return {"success": False, "error": str(exc), "cancelled": True}
+        except asyncio.TimeoutError:
+            deadline.record_timeout("upstream")
+            return {"success": False, "error": "向量化调用超过截止时间", "deadline_exceeded": True}
+
+        failed = next((result for result in results if not result.get("success")), None)
+        if failed is not None:
+            return {"success": False, "error": failed.get("error")}
+
+        prompt_tokens = sum(result["prompt_tokens"] for result in results)
+        usage = {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+        self._record_usage(model, usage)
+        app_logger.debug(f"向量化完成: model={model}, texts={len(texts)}, batch_sizes={[r['batch_size'] for r in results]}")
+        return {
+            "success": True,
+            "embeddings": [result["embedding"] for result in results],
+            "model": model,
+            "usage": usage,
+        }
+
+    async def _send_embedding_batch(self, model: str, texts: List[str]) -> Dict[str, Any]:
+        """
+        发送一批文本到上游 /embeddings 接口（由微批处理器调用，所在批次可能包含多个用户的请求）
+
+        Args:
+            model: 向量模型名称
+            texts: 文本列表
+
+        Returns:
+            Dict[str, Any]: success、embeddings（按输入顺序）、usage，失败时包含 error
+        """
+        payload = {"model": model, "input": texts, "encoding_format": "float"}
+        try:
+            # 合并后的批次不属于单个用户，以共享身份参与普通优先级排队
+            async with scheduler.slot(priority=STANDARD, username="embeddings"):
+                response = await self._client.post("/embeddings", content=json_backend.dumps(payload))
+            if not response.is_success:
+                return await self._build_error_response(response)
+            result = json_backend.loads(response.content)
+        except SchedulerRejected as exc:
+            return {"success": False, "error": str(exc)}
+        except RequestError as exc:
+            app_logger.error(f"向量化请求异常: {exc!r}")
+            return {"success": False, "error": f"HTTP请求异常: {exc!r}"}
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for item in result.get("data") or []:
+            index = item.get("index", 0)
+            if 0 <= index < len(texts):
+                embeddings[index] = item.get("embedding")
+        app_logger.info(f"向量化批次完成: model={model}, size={len(texts)}")
+        return {"success": True, "embeddings": embeddings, "usage": result.get("usage") or {}}
     
     def list_available_models(self) -> Dict[str, Any]:
         """
@@ -734,7 +937,7 @@ class PureAIService:
             if not response.is_success:
                 return await self._build_error_response(response)
 
-            result = response.json()
+            result = json_backend.loads(response.content)
 
             return {
                 "success": True,
@@ -776,7 +979,7 @@ class PureAIService:
             if not response.is_success:
                 return await self._build_error_response(response)
 
-            result = response.json()
+            result = json_backend.loads(response.content)
 
             # 硅基流动返回格式: {"code": 20000, "status": true, "data": {...}}
             if result.get("code") == 20000 and result.get("status"):
@@ -819,6 +1022,10 @@ class PureAIService:
                 - descriptions: 生成的图像描述列表
                 - model: 实际使用的模型名称
                 - count: 实际生成的描述数量
+                - failed: 失败的数量
+                - items: 每个候选的结果，包含 index、success、description/error 和 elapsed_ms
+                - mode: 生成方式，native_n(原生 n 参数) 或 fan_out(并发扇出)
+                - elapsed_ms: 总耗时（毫秒）
                 - error: 错误信息(如果失败)
         """
         # 检查是否提供了模型
@@ -827,34 +1034,30 @@ class PureAIService:
                 "success": False,
                 "error": "未指定模型，请先在模型管理页面配置可用的对话模型"
             }
-        # 定义不同风格的提示词模板
-        style_prompts = {
-            "realistic": "请生成一个超现实、高清、细节丰富的图像描述",
-            "artistic": "请生成一个艺术风格、富有创意的图像描述",
-            "cartoon": "请生成一个卡通风格、生动有趣的图像描述"
-        }
+        # 风格指令来自模板注册表，基础描述作为可变内容
+        messages = prompt_registry.build_messages("image_description", style, f"基础描述：{prompt}")
         
-        # 构造对话消息
-        messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的图像描述生成器，能够将简单的描述转换为详细、生动的图像描述。"
-            },
-            {
-                "role": "user",
-                "content": f"{style_prompts.get(style, style_prompts['realistic'])}。\n\n基础描述：{prompt}\n\n请生成一个详细的图像描述，包括：\n1. 主体物体的详细特征\n2. 背景和环境\n3. 光线和色彩\n4. 氛围和情绪\n5. 艺术风格"
-            }
-        ]
+        started = time.perf_counter()
+        items: Optional[List[Dict[str, Any]]] = None
+        mode = "fan_out"
         
-        # 生成指定数量的图像描述
-        descriptions = []
-        for i in range(n):
-            result = await self.call_ai(messages, model=model, temperature=0.8)
-            if result["success"]:
-                descriptions.append({
-                    "description": result["content"],
-                    "style": style
-                })
+        # 模型支持原生 n 参数时一次请求拿到全部结果，失败再回退到并发扇出
+        if n > 1 and model in self._native_n_models():
+            items = await self._describe_with_native_n(messages, model, n)
+            if items is not None:
+                mode = "native_n"
+        
+        if items is None:
+            items = await self._describe_with_fan_out(messages, model, n)
+        
+        descriptions = [
+            {"description": item["description"], "style": style}
+            for item in items if item["success"]
+        ]
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        failed = len(items) - len(descriptions)
+        if failed:
+            app_logger.warning(f"图像描述部分生成失败: {failed}/{len(items)}")
         
         # 处理生成结果
         if descriptions:
@@ -862,32 +1065,105 @@ class PureAIService:
                 "success": True,
                 "descriptions": descriptions,
                 "model": model,
-                "count": len(descriptions)
+                "count": len(descriptions),
+                "failed": failed,
+                "items": items,
+                "mode": mode,
+                "elapsed_ms": elapsed_ms
             }
         else:
             return {
                 "success": False,
-                "error": "生成图像描述失败"
+                "error": "生成图像描述失败",
+                "items": items,
+                "mode": mode,
+                "elapsed_ms": elapsed_ms
             }
     
+    @staticmethod
+    def _native_n_models() -> List[str]:
+        """读取配置中支持原生 n 参数的模型列表"""
+        return [name.strip() for name in settings.native_n_models.split(",") if name.strip()]
+    
+    async def _describe_with_native_n(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        n: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        通过上游原生 n 参数一次生成多个图像描述
+        
+        Returns:
+            Optional[List[Dict[str, Any]]]: 每个候选的结果，上游调用失败时返回None以便回退
+        """
+        started = time.perf_counter()
+        result = await self.call_ai(messages, model=model, temperature=0.8, n=n)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        if not result["success"]:
+            app_logger.warning(f"原生 n 参数调用失败，回退到并发生成: {result.get('error')}")
+            return None
+        
+        contents = result.get("contents") or [result.get("content")]
+        items = []
+        for index in range(n):
+            content = contents[index] if index < len(contents) else None
+            if content:
+                items.append({"index": index, "success": True, "description": content, "elapsed_ms": elapsed_ms})
+            else:
+                items.append({"index": index, "success": False, "error": "上游未返回该候选结果", "elapsed_ms": elapsed_ms})
+        return items
+    
+    async def _describe_with_fan_out(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        n: int
+    ) -> List[Dict[str, Any]]:
+        """
+        并发发起 n 次调用生成图像描述，并发数受 image_description_concurrency 限制
+        
+        Returns:
+            List[Dict[str, Any]]: 按 index 排列的每次调用结果（含耗时和错误信息）
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.image_description_concurrency))
+        
+        async def _generate_one(index: int) -> Dict[str, Any]:
+            async with semaphore:
+                started = time.perf_counter()
+                result = await self.call_ai(messages, model=model, temperature=0.8)
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            if result["success"]:
+                return {"index": index, "success": True, "description": result["content"], "elapsed_ms": elapsed_ms}
+            return {"index": index, "success": False, "error": result.get("error", "未知错误"), "elapsed_ms": elapsed_ms}
+        
+        return list(await asyncio.gather(*[_generate_one(i) for i in range(n)]))
+    
     async def edit_image(
         self,
         image_base64: str,
         instruction: str,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        inline_base64: bool = False
     ) -> Dict[str, Any]:
         """
         图片编辑功能 - 使用图像编辑模型
         
+        编辑后的图片在后台下载到本地 Blob 存储，接口只等待生成完成即返回。
+        
         Args:
             image_base64: Base64编码的原始图片数据
             instruction: 编辑指令，描述想要对图片进行的修改
             model: 使用的模型名称
+            inline_base64: 是否等待下载完成并在响应中内联base64图片
             
         Returns:
             Dict[str, Any]: 图片编辑结果
                 - success: 是否成功
-                - edited_image: 编辑后的图片（base64格式）
+                - image_id: 本地 Blob 引用ID，可通过 /api/v1/blobs/{image_id} 获取图片
+                - image_url: 平台返回的原始图片地址
+                - edited_image: 编辑后的图片（base64格式，仅 inline_base64 为True时返回）
                 - model: 实际使用的模型名称
                 - usage: token使用情况
                 - error: 错误信息(如果失败)
@@ -914,16 +1190,55 @@ class PureAIService:
             
             # 发送请求到硅基流动平台（复用客户端）
             endpoint = "/images/generations"
-            # 图片编辑使用更长的超时时间
-            edit_timeout = httpx.Timeout(120.0)
-            response = await self._client.post(endpoint, json=payload, timeout=edit_timeout)
+            body = json_backend.dumps(payload)
+            progress = {"phase": "queued"}
+
+            async def send() -> httpx.Response:
+                # 与其他模型调用一样经过调度器排队
+                async with scheduler.slot():
+                    deadline.ensure_budget("dispatch")
+                    progress["phase"] = "upstream"
+                    # 超时按请求截止时间（图片编辑默认预算 120 秒，见 DEADLINE_BUDGETS）
+                    return await self._client.post(endpoint, content=body, timeout=deadline.upstream_timeout(stream=False))
+
+            try:
+                response = await cancel_on_disconnect(asyncio.wait_for(send(), timeout=deadline.total_timeout()))
+            except ClientDisconnected as exc:
+                record_cancellation(current_endpoint.get() or endpoint, progress["phase"], 0)
+                return {
+                    "success": False,
+                    "error": str(exc),
+                    "cancelled": True,
+                }
+            except asyncio.TimeoutError:
+                deadline.record_timeout(progress["phase"])
+                stage = "排队中" if progress["phase"] == "queued" else "等待上游响应时"
+                app_logger.warning(f"图片编辑超过截止时间（{stage}）: model={model}")
+                return {
+                    "success": False,
+                    "error": f"图片编辑超过截止时间（{stage}）",
+                    "deadline_exceeded": True,
+                }
+            except deadline.DeadlineExceeded as exc:
+                app_logger.warning(f"图片编辑未发起: {exc}")
+                return {
+                    "success": False,
+                    "error": str(exc),
+                    "deadline_exceeded": True,
+                }
+            except SchedulerRejected as exc:
+                app_logger.warning(f"图片编辑未能排队: {exc}")
+                return {
+                    "success": False,
+                    "error": str(exc),
+                }
 
             app_logger.info(f"图片编辑响应状态码: {response.status_code}")
 
             if not response.is_success:
                 return await self._build_error_response(response)
 
-            result = response.json()
+            result = json_backend.loads(response.content)
 
             # 提取编辑后的图片 URL
             images = result.get("images", [])
@@ -945,30 +1260,22 @@ class PureAIService:
 
             app_logger.info(f"图片编辑成功，URL: {image_url}")
 
-            # 尝试下载图片并转换为 base64
-            # 如果下载失败（403），前端可以直接使用 URL
-            edited_image_base64 = None
-            try:
-                app_logger.info(f"尝试下载编辑后的图片: {image_url}")
-                # 添加必要的 headers 模拟浏览器请求
-                download_headers = {
-                    **self.headers,
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                    "Referer": "https://cloud.siliconflow.cn/"
-                }
-                image_response = await self._client.get(image_url, headers=download_headers, follow_redirects=True)
+            # 后台下载到本地 Blob 存储，不阻塞本次响应
+            image_id = blob_store.fetch_in_background(image_url, self._download_client)
 
-                if image_response.is_success:
-                    # 将图片转换为 base64
-                    edited_image_base64 = base64.b64encode(image_response.content).decode('utf-8')
-                    app_logger.info("图片下载并转换为 base64 成功")
+            # 仅在调用方需要时等待下载完成并内联 base64
+            edited_image_base64 = None
+            if inline_base64:
+                meta = await blob_store.resolve(image_id)
+                if meta:
+                    image_bytes = await asyncio.to_thread(blob_store.read, meta["digest"])
+                    edited_image_base64 = base64.b64encode(image_bytes).decode('utf-8')
                 else:
-                    app_logger.warning(f"下载图片失败 ({image_response.status_code})，将返回 URL 供前端使用")
-            except Exception as download_error:
-                app_logger.warning(f"下载图片异常: {download_error}，将返回 URL 供前端使用")
+                    app_logger.warning("图片下载失败，将返回 URL 供前端使用")
 
             return {
                 "success": True,
+                "image_id": image_id,
                 "edited_image": edited_image_base64,  # 可能为 None
                 "image_url": image_url,  # 始终返回 URL
                 "model": model,
@@ -982,3 +1289,28 @@ class PureAIService:
                 "success": False,
                 "error": f"图片编辑失败: {str(e)}"
             }
+
+
+# 全局实例（首次使用时创建，避免导入模块时就建立 HTTP 客户端）
+_ai_service: Optional[PureAIService] = None
+
+
+def get_ai_service() -> PureAIService:
+    """
+    获取全局 AI 服务实例（可直接用作 FastAPI 依赖）
+
+    Returns:
+        PureAIService: 进程内共享的服务实例
+    """
+    global _ai_service
+    if _ai_service is None:
+        _ai_service = PureAIService()
+    return _ai_service
+
+
+async def close_ai_service():
+    """关闭已创建的全局 AI 服务实例（应用关闭时调用）"""
+    global _ai_service
+    if _ai_service is not None:
+        await _ai_service.close()
+        _ai_service = None
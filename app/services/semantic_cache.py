@@ -0,0 +1,437 @@
+"""
+语义响应缓存
+很多 /ai/quick、/ai/text/analyze 请求只在空白、标点或措辞上略有差异，精确匹配的缓存无法命中。
+开启 SEMANTIC_CACHE_ENABLED 后：
+- 提示词先做归一化（Unicode NFKC、合并空白、去掉句末标点），归一化后完全相同的直接命中，不需要向量化
+- 否则调用向量模型（SEMANTIC_CACHE_EMBEDDING_MODEL，经向量化微批处理）得到提示词向量，在内存向量索引中
+  按余弦相似度查找最相近的已缓存提示词，相似度达到接口阈值即直接返回缓存的响应，不调用上游
+- 缓存按条数、内存占用和 TTL 淘汰（最久未使用的先淘汰）
+
+安装 numpy 时索引为 float32 矩阵，一次矩阵乘法完成查找；未安装时回退到纯 Python 逐条计算，只适合小规模缓存。
+缓存保存在各 worker 进程内；SEMANTIC_CACHE_SCOPE=user（默认）时只在同一用户的请求之间复用。
+"""
+
+import re
+import time
+import operator
+import itertools
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core import json_backend
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.metrics import metrics
+from app.core.request_context import current_username
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 numpy 时回退到纯 Python 索引
+    np = None
+
+metrics.describe("semantic_cache_lookups_total", "语义缓存查找次数（result: exact / hit / miss / bypass）")
+metrics.describe("semantic_cache_lookup_seconds", "语义缓存查找耗时（含提示词向量化）")
+metrics.describe("semantic_cache_entries", "语义缓存条数")
+metrics.describe("semantic_cache_bytes", "语义缓存估算内存占用（字节）")
+
+# 纯 Python 索引的条数上限（约 5ms/百条 × 1024 维，查找在事件循环中同步执行，不能过大）
+PYTHON_INDEX_MAX_ENTRIES = 100
+
+# 查找耗时直方图分桶（秒）
+LOOKUP_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+# 句末可忽略的标点（NFKC 后全角问号、叹号等已转为半角）
+_SENTENCE_END = frozenset(".?!,;:~…。、")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    提示词归一化：NFKC（全角转半角等）、合并空白、去掉句末标点
+
+    归一化结果用作精确命中的键（命中时不再比较相似度），因此只去掉不影响语义的差异：
+    大小写以及文中的标点与符号（2+3 / 2*3、a<b / a>b、x == 1 / x != 1）都保留，
+    紧跟数字的句末标点（如阶乘 5!）同样保留。
+
+    Args:
+        text: 原始提示词
+
+    Returns:
+        str: 归一化后的文本
+    """
+    text = _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    end = len(text)
+    while end > 0 and text[end - 1] in _SENTENCE_END:
+        end -= 1
+    if end < len(text) and end > 0 and text[end - 1].isdigit():
+        return text
+    return text[:end].rstrip()
+
+
+class _NumpyIndex:
+    """float32 矩阵索引：每行一个单位向量，查找为一次矩阵-向量乘法"""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self._matrix = np.empty((16, dimensions), dtype=np.float32)
+        self._ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._rows
+
+    @staticmethod
+    def prepare(vector: List[float]):
+        """转换为单位向量，零向量返回 None"""
+        prepared = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(prepared))
+        return prepared / norm if norm else None
+
+    def add(self, entry_id: int, vector):
+        count = len(self._ids)
+        if count == len(self._matrix):
+            grown = np.empty((count * 2, self.dimensions), dtype=np.float32)
+            grown[:count] = self._matrix[:count]
+            self._matrix = grown
+        self._matrix[count] = vector
+        self._ids.append(entry_id)
+        self._rows[entry_id] = count
+
+    def remove(self, entry_id: int):
+        """删除一行：用最后一行填补空位，保持矩阵连续"""
+        row = self._rows.pop(entry_id)
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+
+    def search(self, vector) -> Tuple[Optional[int], float]:
+        """返回余弦相似度最高的 (entry_id, 相似度)"""
+        if not self._ids:
+            return None, -1.0
+        scores = self._matrix[:len(self._ids)] @ vector
+        best = int(scores.argmax())
+        return self._ids[best], float(scores[best])
+
+
+class _PythonIndex:
+    """纯 Python 索引（未安装 numpy 时使用），查找耗时与条数成正比"""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self._vectors: List[array] = []
+        self._ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._rows
+
+    @staticmethod
+    def prepare(vector: List[float]) -> Optional[array]:
+        norm = sum(value * value for value in vector) ** 0.5
+        return array("f", (value / norm for value in vector)) if norm else None
+
+    def add(self, entry_id: int, vector: array):
+        self._rows[entry_id] = len(self._ids)
+        self._ids.append(entry_id)
+        self._vectors.append(vector)
+
+    def remove(self, entry_id: int):
+        row = self._rows.pop(entry_id)
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        self._vectors.pop()
+
+    def search(self, vector: array) -> Tuple[Optional[int], float]:
+        best_id, best_score = None, -1.0
+        for entry_id, row in zip(self._ids, self._vectors):
+            score = sum(map(operator.mul, row, vector))
+            if score > best_score:
+                best_id, best_score = entry_id, score
+        return best_id, best_score
+
+
+def _select_index(name: str):
+    """根据配置和已安装的依赖确定索引实现"""
+    name = (name or "auto").strip().lower()
+    if name == "python":
+        return _PythonIndex
+    if np is None:
+        if name == "numpy":
+            app_logger.warning("SEMANTIC_CACHE_INDEX=numpy 但未安装 numpy，回退到纯 Python 索引")
+        return _PythonIndex
+    return _NumpyIndex
+
+
+class _Entry:
+    """缓存条目"""
+
+    __slots__ = ("id", "namespace", "normalized", "response", "size", "expires_at")
+
+    def __init__(self, entry_id: int, namespace: str, normalized: str, response: Dict[str, Any], size: int, expires_at: float):
+        self.id = entry_id
+        self.namespace = namespace
+        self.normalized = normalized
+        self.response = response
+        self.size = size
+        self.expires_at = expires_at
+
+
+class CacheProbe:
+    """一次查找的结果；未命中时由调用方在拿到上游响应后交回 store 写入缓存"""
+
+    __slots__ = ("endpoint", "namespace", "normalized", "vector", "response", "similarity", "writable")
+
+    def __init__(self, endpoint: str, namespace: str, normalized: str, writable: bool = True):
+        self.endpoint = endpoint
+        self.namespace = namespace
+        self.normalized = normalized
+        self.vector = None
+        self.response: Optional[Dict[str, Any]] = None
+        self.similarity = 0.0
+        self.writable = writable
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+
+def parse_thresholds(raw: str) -> Dict[str, float]:
+    """
+    解析 SEMANTIC_CACHE_THRESHOLDS 配置
+
+    Args:
+        raw: JSON 字符串，形如 {"/ai/quick": 0.95, "/ai/text/analyze": 0.98}
+
+    Raises:
+        ValueError: 配置格式错误
+    """
+    data = json_backend.loads(raw) if raw.strip() else {}
+    if not isinstance(data, dict):
+        raise ValueError("SEMANTIC_CACHE_THRESHOLDS 必须是 JSON 对象")
+    return {path: float(value) for path, value in data.items()}
+
+
+class SemanticCache:
+    """按命名空间（接口 + 影响结果的参数）划分的语义响应缓存（单个事件循环内使用）"""
+
+    def __init__(self):
+        self.enabled = settings.semantic_cache_enabled and bool(settings.semantic_cache_embedding_model)
+        if settings.semantic_cache_enabled and not self.enabled:
+            app_logger.warning("SEMANTIC_CACHE_EMBEDDING_MODEL 未配置，语义缓存未开启")
+        self.embedding_model = settings.semantic_cache_embedding_model
+        self.max_entries = settings.semantic_cache_max_entries
+        self.max_bytes = int(settings.semantic_cache_max_mb * 1024 * 1024)
+        self.ttl = settings.semantic_cache_ttl
+        self.per_user = settings.semantic_cache_scope.lower() != "global"
+        try:
+            self.thresholds = parse_thresholds(settings.semantic_cache_thresholds)
+        except (ValueError, TypeError) as e:
+            app_logger.error(f"SEMANTIC_CACHE_THRESHOLDS 配置无效，使用默认阈值: {e}")
+            self.thresholds = {}
+        self._index_class = _select_index(settings.semantic_cache_index)
+        if self.enabled and self._index_class is _PythonIndex and self.max_entries > PYTHON_INDEX_MAX_ENTRIES:
+            app_logger.warning(
+                f"语义缓存使用纯 Python 索引，条数上限降为 {PYTHON_INDEX_MAX_ENTRIES}；安装 numpy 可支持更大的缓存"
+            )
+            self.max_entries = PYTHON_INDEX_MAX_ENTRIES
+        self._indexes: Dict[str, Any] = {}
+        self._entries: Dict[int, _Entry] = {}
+        # 最久未使用的条目在前
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._ids = itertools.count()
+        self._bytes = 0
+        self._last_sweep = time.monotonic()
+
+    @property
+    def index_backend(self) -> str:
+        return "numpy" if self._index_class is _NumpyIndex else "python"
+
+    def threshold_for(self, endpoint: str) -> float:
+        """接口的相似度阈值"""
+        for suffix, threshold in self.thresholds.items():
+            if endpoint.endswith(suffix):
+                return threshold
+        return settings.semantic_cache_threshold
+
+    def _namespace(self, endpoint: str, params: Dict[str, Any]) -> str:
+        parts = [endpoint] + [f"{key}={params[key]}" for key in sorted(params)]
+        if self.per_user:
+            parts.append(f"user={current_username.get() or '-'}")
+        return "|".join(parts)
+
+    async def lookup(self, endpoint: str, params: Dict[str, Any], prompt: str, cache_control: str = "") -> CacheProbe:
+        """
+        查找缓存
+
+        Args:
+            endpoint: 接口路径
+            params: 除提示词外影响响应的参数（模型、任务等），不同参数的请求互不复用
+            prompt: 提示词
+            cache_control: 请求的 Cache-Control 头：no-cache 跳过查找（仍写入），no-store 不查找也不写入
+
+        Returns:
+            CacheProbe: 命中时 response 为缓存的响应
+        """
+        if not self.enabled:
+            return CacheProbe(endpoint, "", "", writable=False)
+        probe = CacheProbe(endpoint, self._namespace(endpoint, params), normalize_prompt(prompt))
+        if "no-store" in cache_control or "no-cache" in cache_control:
+            probe.writable = "no-store" not in cache_control
+            metrics.inc("semantic_cache_lookups_total", endpoint=endpoint, result="bypass")
+            return probe
+
+        started = time.perf_counter()
+        entry_id = self._exact.get((probe.namespace, probe.normalized))
+        if entry_id is not None and self._use(entry_id, probe, 1.0):
+            self._observe(endpoint, "exact", started)
+            return probe
+
+        probe.vector = await self._embed(probe.normalized)
+        index = self._indexes.get(probe.namespace)
+        if probe.vector is not None and index is not None and len(probe.vector) == index.dimensions:
+            entry_id, similarity = index.search(probe.vector)
+            if entry_id is not None and similarity >= self.threshold_for(endpoint) and self._use(entry_id, probe, similarity):
+                self._observe(endpoint, "hit", started)
+                return probe
+        self._observe(endpoint, "miss", started)
+        return probe
+
+    def _use(self, entry_id: int, probe: CacheProbe, similarity: float) -> bool:
+        """命中条目：未过期时填入 probe 并标记为最近使用"""
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return False
+        if entry.expires_at <= time.monotonic():
+            self._evict(entry_id)
+            return False
+        self._lru.move_to_end(entry_id)
+        probe.response = entry.response
+        probe.similarity = similarity
+        return True
+
+    def _observe(self, endpoint: str, result: str, started: float):
+        metrics.inc("semantic_cache_lookups_total", endpoint=endpoint, result=result)
+        metrics.observe("semantic_cache_lookup_seconds", time.perf_counter() - started, buckets=LOOKUP_BUCKETS, endpoint=endpoint)
+
+    async def _embed(self, text: str):
+        """提示词向量化（失败时返回 None，只影响缓存命中，不影响请求本身）"""
+        from app.services.pure_ai_service import get_ai_service
+
+        result = await get_ai_service().create_embeddings([text], model=self.embedding_model)
+        if not result.get("success"):
+            app_logger.warning(f"语义缓存向量化失败: {result.get('error')}")
+            return None
+        return self._index_class.prepare(result["embeddings"][0])
+
+    def store(self, probe: CacheProbe, response: Dict[str, Any]):
+        """
+        写入上游响应（仅缓存成功且完整生成的响应）
+
+        Args:
+            probe: lookup 返回的未命中结果
+            response: 服务层返回的结果字典
+        """
+        if not probe.writable or probe.hit or not response.get("success"):
+            return
+        if response.get("finish_reason") not in (None, "stop"):
+            return
+
+        now = time.monotonic()
+        if now - self._last_sweep > min(self.ttl, 60):
+            self._sweep(now)
+
+        key = (probe.namespace, probe.normalized)
+        if key in self._exact:
+            self._evict(self._exact[key])
+
+        entry_id = next(self._ids)
+        size = len(json_backend.dumps(response)) + len(probe.normalized.encode("utf-8"))
+        if probe.vector is not None:
+            index = self._indexes.get(probe.namespace)
+            if index is None:
+                index = self._indexes[probe.namespace] = self._index_class(len(probe.vector))
+            if len(probe.vector) == index.dimensions:
+                index.add(entry_id, probe.vector)
+                size += index.dimensions * 4
+        self._entries[entry_id] = _Entry(entry_id, probe.namespace, probe.normalized, response, size, now + self.ttl)
+        self._lru[entry_id] = None
+        self._exact[key] = entry_id
+        self._bytes += size
+
+        while self._lru and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._evict(next(iter(self._lru)))
+        self._update_gauges()
+
+    def _evict(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._lru.pop(entry_id, None)
+        if self._exact.get((entry.namespace, entry.normalized)) == entry_id:
+            del self._exact[(entry.namespace, entry.normalized)]
+        index = self._indexes.get(entry.namespace)
+        if index is not None and entry_id in index:
+            index.remove(entry_id)
+            if not len(index):
+                del self._indexes[entry.namespace]
+        self._bytes -= entry.size
+
+    def _sweep(self, now: float):
+        """清理全部过期条目"""
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry.expires_at <= now]:
+            self._evict(entry_id)
+        self._last_sweep = now
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.set("semantic_cache_entries", len(self._entries))
+        metrics.set("semantic_cache_bytes", self._bytes)
+
+    def clear(self) -> int:
+        """清空缓存，返回清除的条数"""
+        count = len(self._entries)
+        self._indexes.clear()
+        self._entries.clear()
+        self._lru.clear()
+        self._exact.clear()
+        self._bytes = 0
+        self._update_gauges()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "index": self.index_backend,
+            "embedding_model": self.embedding_model,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "namespaces": len(self._indexes),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "scope": "user" if self.per_user else "global",
+        }
+
+
+# 全局实例
+semantic_cache = SemanticCache()
@@ -0,0 +1,117 @@
+"""
+响应压缩基准测试
+在典型响应（平台模型列表、批量结果、长篇代码审查、base64 图片、逐 token 的 SSE 流）上，
+比较各编码与级别的单次 CPU 时间、压缩率，以及每毫秒 CPU 节省的字节数，用于选择
+COMPRESSION_GZIP_LEVEL / COMPRESSION_BROTLI_QUALITY / COMPRESSION_ZSTD_LEVEL。
+SSE 按数据块增量压缩（每块 flush），与中间件的流式模式一致。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_compression
+    python -m benchmarks.bench_compression --filter sse   # 只运行部分数据
+"""
+
+import os
+import base64
+import argparse
+from typing import Callable, Dict, List, Tuple
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from benchmarks.bench_json import cpu_time_per_op  # noqa: E402
+from benchmarks.payloads import build_sse_body  # noqa: E402
+from app.core import json_backend  # noqa: E402
+from app.core.compression import Compressor, available_encodings, compress  # noqa: E402
+
+# 各编码参与比较的级别
+LEVELS: Dict[str, Tuple[int, ...]] = {
+    "gzip": (1, 6, 9),
+    "br": (1, 4, 6, 11),
+    "zstd": (1, 3, 9, 19),
+}
+
+
+def build_payloads() -> Dict[str, object]:
+    """构造各接口的典型响应体；SSE 为数据块列表"""
+    platform_models = {
+        "success": True,
+        "data": {"object": "list", "data": [
+            {"id": f"org-{index}/model-{index}", "object": "model", "created": 1700000000, "owned_by": f"org-{index}"}
+            for index in range(1000)
+        ]},
+    }
+    batch_results = {"results": [
+        {"task_id": f"task-{index}", "result": {
+            "success": True,
+            "content": f"第{index}个任务的分析结果：" + "该文本整体情感偏正面，主要关注产品质量与售后服务。" * 40,
+            "model": "zai-org/GLM-4.5",
+            "usage": {"prompt_tokens": 320, "completion_tokens": 960, "total_tokens": 1280},
+        }}
+        for index in range(50)
+    ]}
+    code_review = {
+        "success": True,
+        "content": "\n".join(
+            f"{index}. `app/services/module_{index}.py` 第 {index * 7} 行：建议把重复的异常处理提取为公共函数，"
+            f"并为 `process_{index}` 增加类型注解。\n```python\ndef process_{index}(data: dict) -> dict:\n    return data\n```"
+            for index in range(300)
+        ),
+        "model": "Qwen/Qwen2.5-Coder-32B-Instruct",
+    }
+    edited_image = {
+        "success": True,
+        "image_url": "https://cdn.example.com/edited.png",
+        "base64": base64.b64encode(os.urandom(512 * 1024)).decode("ascii"),
+    }
+    sse_body = build_sse_body(2000)
+    sse_chunks = [event + b"\n\n" for event in sse_body.split(b"\n\n") if event]
+    return {
+        "platform_models": json_backend.dumps(platform_models),
+        "batch_50": json_backend.dumps(batch_results),
+        "code_review": json_backend.dumps(code_review),
+        "edited_image_base64": json_backend.dumps(edited_image),
+        "sse_2000_chunks": sse_chunks,
+    }
+
+
+def make_op(payload: object, encoding: str, level: int) -> Callable[[], bytes]:
+    """返回一次完整压缩的操作：普通响应一次压缩，SSE 逐块压缩并 flush"""
+    if isinstance(payload, bytes):
+        return lambda: compress(payload, encoding, level)
+
+    def stream() -> bytes:
+        compressor = Compressor(encoding, level)
+        parts: List[bytes] = []
+        for chunk in payload:
+            parts.append(compressor.compress(chunk))
+            parts.append(compressor.flush())
+        parts.append(compressor.finish())
+        return b"".join(parts)
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应压缩 CPU 开销与节省字节数基准")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的数据")
+    args = parser.parse_args()
+
+    encodings = available_encodings()
+    print(f"可用编码: {', '.join(encodings)}（br / zstd 需要安装 brotli / zstandard）")
+    print(f"{'payload':<22} {'encoding':<9} {'size KB':>9} {'out KB':>9} {'ratio':>7} {'cpu ms':>9} {'saved KB/cpu ms':>16}")
+    for name, payload in build_payloads().items():
+        if args.filter and args.filter not in name:
+            continue
+        size = len(payload) if isinstance(payload, bytes) else sum(len(chunk) for chunk in payload)
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                op = make_op(payload, encoding, level)
+                out = len(op())
+                cpu_ms = cpu_time_per_op(op, min_time=0.2, repeats=2) / 1000
+                saved = (size - out) / 1024
+                print(
+                    f"{name:<22} {encoding + '-' + str(level):<9} {size / 1024:>9,.1f} {out / 1024:>9,.1f} "
+                    f"{out / size:>7.1%} {cpu_ms:>9.2f} {saved / cpu_ms if cpu_ms else 0:>16,.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
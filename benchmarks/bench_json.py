@@ -0,0 +1,153 @@
+"""
+JSON 序列化基准测试
+对比标准库 json 与当前 JSON 后端（JSON_BACKEND，默认有 orjson 则用 orjson）在真实规模数据上的
+单次 CPU 时间：API 响应渲染（经过 FastAPI 的 jsonable_encoder，或直接返回响应对象跳过该步骤）、
+上游请求体编码、上游响应与 SSE 数据块解码。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_json
+    JSON_BACKEND=stdlib python -m benchmarks.bench_json   # 确认回退路径
+"""
+
+import os
+import json
+import time
+import base64
+from typing import Any, Callable, Dict
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.core import json_backend  # noqa: E402
+from app.core.json_backend import FastJSONResponse  # noqa: E402
+
+
+def build_cases() -> Dict[str, Dict[str, Any]]:
+    """构造各接口的典型数据"""
+    image_base64 = base64.b64encode(os.urandom(1024 * 1024)).decode("ascii")
+    platform_models = {
+        "success": True,
+        "data": {
+            "object": "list",
+            "data": [
+                {"id": f"org-{index}/model-{index}", "object": "model", "created": 1700000000, "owned_by": f"org-{index}"}
+                for index in range(1000)
+            ],
+        },
+    }
+    batch_results = {
+        "results": [
+            {
+                "task_id": f"task-{index}",
+                "result": {
+                    "success": True,
+                    "content": "这是批量任务的分析结果。" * 80,
+                    "model": "zai-org/GLM-4.5",
+                    "usage": {"prompt_tokens": 320, "completion_tokens": 960, "total_tokens": 1280},
+                    "finish_reason": "stop",
+                },
+            }
+            for index in range(50)
+        ]
+    }
+    edit_image = {
+        "success": True,
+        "image_url": "https://cdn.example.com/edited.png",
+        "image_id": "0" * 32,
+        "base64": image_base64,
+        "local_url": "/api/v1/blobs/" + "0" * 32,
+    }
+    ocr_payload = {
+        "model": "zai-org/GLM-4.5V",
+        "messages": [
+            {"role": "system", "content": "你是一个专业的OCR文字识别助手。"},
+            {"role": "user", "content": [
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64 * 10}"}},
+            ]},
+        ],
+        "temperature": 0.1,
+        "max_tokens": 2000,
+        "stream": True,
+    }
+    completion = json.dumps({
+        "id": "chatcmpl-bench",
+        "model": "zai-org/GLM-4.5",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "回答内容" * 4000}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 4000, "total_tokens": 4100},
+    }, ensure_ascii=False).encode("utf-8")
+    sse_chunk = json.dumps({
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "model": "zai-org/GLM-4.5",
+        "choices": [{"index": 0, "delta": {"content": "词"}, "finish_reason": None}],
+    }, ensure_ascii=False)
+
+    cases: Dict[str, Dict[str, Callable[[], Any]]] = {}
+    for name, content in (
+        ("platform_models", platform_models),
+        ("batch_50", batch_results),
+        ("edit_image_base64", edit_image),
+    ):
+        baseline = (lambda content: lambda: JSONResponse(jsonable_encoder(content)).body)(content)
+        cases[f"response.{name}"] = {
+            "stdlib": baseline,
+            "backend": (lambda content: lambda: FastJSONResponse(jsonable_encoder(content)).body)(content),
+        }
+        # 接口直接返回 FastJSONResponse 时跳过 jsonable_encoder
+        cases[f"response.{name}.direct"] = {
+            "stdlib": baseline,
+            "backend": (lambda content: lambda: FastJSONResponse(content).body)(content),
+        }
+
+    return {
+        **cases,
+        "upstream.encode_ocr_payload": {
+            # 与 httpx json= 参数的编码方式一致
+            "stdlib": lambda: json.dumps(ocr_payload).encode("utf-8"),
+            "backend": lambda: json_backend.dumps(ocr_payload),
+        },
+        "upstream.decode_completion": {
+            "stdlib": lambda: json.loads(completion.decode("utf-8")),
+            "backend": lambda: json_backend.loads(completion),
+        },
+        "sse.decode_chunk": {
+            "stdlib": lambda: json.loads(sse_chunk),
+            "backend": lambda: json_backend.loads(sse_chunk),
+        },
+    }
+
+
+def cpu_time_per_op(op: Callable[[], Any], min_time: float = 0.3, repeats: int = 3) -> float:
+    """返回单次操作的 CPU 时间（微秒），多轮取最好"""
+    op()
+    iterations = 1
+    while True:
+        started = time.process_time()
+        for _ in range(iterations):
+            op()
+        elapsed = time.process_time() - started
+        if elapsed >= min_time:
+            break
+        iterations *= 2
+    best = elapsed / iterations
+    for _ in range(repeats - 1):
+        started = time.process_time()
+        for _ in range(iterations):
+            op()
+        best = min(best, (time.process_time() - started) / iterations)
+    return best * 1e6
+
+
+def main():
+    print(f"JSON 后端: {json_backend.BACKEND}")
+    print(f"{'case':<32} {'stdlib us':>14} {'backend us':>14} {'speedup':>10}")
+    for name, variants in build_cases().items():
+        stdlib = cpu_time_per_op(variants["stdlib"])
+        backend = cpu_time_per_op(variants["backend"])
+        print(f"{name:<32} {stdlib:>14,.1f} {backend:>14,.1f} {stdlib / backend:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
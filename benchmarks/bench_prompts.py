@@ -0,0 +1,119 @@
+"""
+提示词构建基准测试
+对比旧实现（每次调用重建模板字典 + f-string 拼接）与模板注册表的构建耗时，
+并统计两次不同请求序列化后的公共前缀长度，用于评估上游前缀缓存的可命中部分。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_prompts
+"""
+
+import os
+import json
+import timeit
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.prompt_registry import prompt_registry  # noqa: E402
+
+
+def legacy_analyze_messages(text: str, task: str):
+    """旧实现：每次调用重建提示词字典，指令与文本混在同一条消息中"""
+    task_prompts = {
+        "analyze": "请详细分析以下文本的内容，提取关键信息，分析主题和要点。",
+        "summarize": "请简明扼要地总结以下文本的主要内容，保留核心信息。",
+        "extract": "请从以下文本中提取所有重要的实体、数字、日期和关键信息。",
+        "translate": "请将以下文本翻译成中文（如果是中文则翻译成英文）。",
+        "sentiment": "请分析以下文本的情感倾向（正面/负面/中性）和情感强度。",
+        "classify": "请对以下文本进行分类，并说明分类依据。",
+        "keywords": "请提取以下文本的关键词和主题词，按重要性排序。",
+        "qa": "请基于以下文本回答用户的问题。"
+    }
+    prompt = task_prompts.get(task, task_prompts["analyze"])
+    return [
+        {"role": "system", "content": "你是一个专业的文本分析助手，能够准确理解和分析各种类型的文本内容。请用中文回答。"},
+        {"role": "user", "content": f"{prompt}\n\n文本内容：\n{text}"}
+    ]
+
+
+def legacy_code_messages(code: str, task: str, language: str, requirements: str):
+    """旧实现：代码任务的指令、需求与代码拼接在同一条消息中"""
+    task_prompts = {
+        "review": "请对以下代码进行代码审查，指出潜在问题和改进建议。",
+        "optimize": "请优化以下代码，提高性能和可读性。",
+        "explain": "请详细解释以下代码的功能和实现逻辑。",
+        "debug": "请帮助调试以下代码，找出并修复错误。",
+        "generate": "请根据需求生成代码。",
+        "convert": f"请将以下代码转换为{language or 'Python'}。",
+        "test": "请为以下代码编写单元测试。",
+        "document": "请为以下代码生成详细的文档注释。"
+    }
+    prompt = task_prompts.get(task, task_prompts["review"])
+    if requirements:
+        prompt = f"{prompt}\n具体要求：{requirements}"
+    content = f"{prompt}\n\n代码：\n```{language or ''}\n{code}\n```"
+    return [
+        {"role": "system", "content": "你是一个专业的编程助手，精通各种编程语言和最佳实践。"},
+        {"role": "user", "content": content}
+    ]
+
+
+def registry_code_messages(code: str, task: str, language: str, requirements: str):
+    """新实现：与 PureAIService.code_assist 相同的可变内容拼接"""
+    content_parts = []
+    if task == "convert":
+        content_parts.append(f"目标语言：{language or 'Python'}")
+    if requirements:
+        content_parts.append(f"具体要求：{requirements}")
+    content_parts.append(f"代码：\n```{language or ''}\n{code}\n```")
+    return prompt_registry.build_messages("code_assist", task, "\n\n".join(content_parts))
+
+
+def common_prefix_length(first: str, second: str) -> int:
+    """两个字符串的公共前缀长度"""
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+def bench(label: str, func, number: int = 200_000) -> float:
+    """执行基准测试并打印每次调用耗时（纳秒）"""
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    ns_per_op = seconds / number * 1e9
+    print(f"{label:<40} {ns_per_op:>10.1f} ns/op")
+    return ns_per_op
+
+
+def main():
+    text = "今天天气很好，我们去公园散步。" * 20
+    code = "def add(a, b):\n    return a + b\n" * 10
+
+    print("== 构建耗时 ==")
+    legacy = bench("legacy analyze_text", lambda: legacy_analyze_messages(text, "summarize"))
+    registry = bench("registry analyze_text", lambda: prompt_registry.build_messages("text_analysis", "summarize", f"文本内容：\n{text}"))
+    print(f"{'speedup':<40} {legacy / registry:>10.2f}x")
+    legacy = bench("legacy code_assist", lambda: legacy_code_messages(code, "convert", "Go", "保持接口不变"))
+    registry = bench("registry code_assist", lambda: registry_code_messages(code, "convert", "Go", "保持接口不变"))
+    print(f"{'speedup':<40} {legacy / registry:>10.2f}x")
+
+    print("\n== 可缓存前缀（两条不同请求的序列化公共前缀，字符数）==")
+    cases = [
+        ("analyze_text", legacy_analyze_messages, lambda t, k: prompt_registry.build_messages("text_analysis", k, f"文本内容：\n{t}"), ("文本甲", "文本乙"), "summarize"),
+        ("code_assist", lambda c, k: legacy_code_messages(c, k, "Go", "需求甲"), lambda c, k: registry_code_messages(c, k, "Go", "需求甲"), ("code_a", "code_b"), "convert"),
+    ]
+    for name, legacy_builder, registry_builder, (first, second), key in cases:
+        legacy_prefix = common_prefix_length(
+            json.dumps(legacy_builder(first, key), ensure_ascii=False),
+            json.dumps(legacy_builder(second, key), ensure_ascii=False),
+        )
+        registry_prefix = common_prefix_length(
+            json.dumps(registry_builder(first, key), ensure_ascii=False),
+            json.dumps(registry_builder(second, key), ensure_ascii=False),
+        )
+        print(f"{name:<20} legacy={legacy_prefix:>5}  registry={registry_prefix:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+语义缓存查找基准测试
+测量不同索引规模下单次相似度查找的耗时（不含提示词向量化的上游调用），
+对比 numpy 矩阵索引与纯 Python 回退索引，并给出提示词归一化的耗时。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_semantic_cache
+    python -m benchmarks.bench_semantic_cache --dimensions 1024 --sizes 1000,10000,50000
+"""
+
+import os
+import time
+import random
+import argparse
+from typing import List
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.semantic_cache import _NumpyIndex, _PythonIndex, normalize_prompt, np  # noqa: E402
+
+# 纯 Python 索引查找耗时与规模成正比，超过此规模不再测量
+PYTHON_INDEX_MAX_SIZE = 10_000
+
+
+def random_vector(rng: random.Random, dimensions: int) -> List[float]:
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+def bench_index(index_class, size: int, dimensions: int, queries: int = 50) -> float:
+    """构建指定规模的索引并返回单次查找的中位耗时（毫秒）"""
+    rng = random.Random(size)
+    index = index_class(dimensions)
+    for entry_id in range(size):
+        index.add(entry_id, index_class.prepare(random_vector(rng, dimensions)))
+    probes = [index_class.prepare(random_vector(rng, dimensions)) for _ in range(queries)]
+    timings = []
+    for probe in probes:
+        started = time.perf_counter()
+        index.search(probe)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语义缓存查找基准")
+    parser.add_argument("--dimensions", type=int, default=1024, help="向量维度（bge-m3 为 1024）")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="索引规模，逗号分隔")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    print(f"== 单次查找耗时（毫秒，中位数，{args.dimensions} 维）==")
+    print(f"{'entries':>10} {'numpy':>12} {'python':>12}")
+    for size in sizes:
+        numpy_ms = f"{bench_index(_NumpyIndex, size, args.dimensions):.3f}" if np is not None else "未安装"
+        python_ms = (
+            f"{bench_index(_PythonIndex, size, args.dimensions, queries=5):.3f}"
+            if size <= PYTHON_INDEX_MAX_SIZE else "-"
+        )
+        print(f"{size:>10} {numpy_ms:>12} {python_ms:>12}")
+
+    prompt = "  请帮我 总结一下：今天的会议纪要！！ " * 10
+    rounds = 20_000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        normalize_prompt(prompt)
+    print(f"\n提示词归一化（{len(prompt)} 字符）: {(time.perf_counter() - started) / rounds * 1e6:.1f} µs/op")
+
+
+if __name__ == "__main__":
+    main()
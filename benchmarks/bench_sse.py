@@ -0,0 +1,118 @@
+"""
+SSE 解析基准测试
+对比旧实现（aiter_lines 解码分行 + startswith/strip + json.loads + 逐层字典查找）
+与字节级增量解析器 + 快速 JSON 提取，在 4k token 逐条输出的流上的耗时。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_sse
+"""
+
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import httpx  # noqa: E402
+
+from benchmarks.payloads import build_sse_body  # noqa: E402
+from app.core.sse import aiter_sse, parse_chat_chunk  # noqa: E402
+
+
+class ChunkedStream(httpx.AsyncByteStream):
+    """按固定大小切分响应体，模拟网络分块到达"""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+async def legacy_consume(response: httpx.Response) -> Dict[str, Any]:
+    """旧实现的解析循环"""
+    content_parts: List[str] = []
+    model_name: Optional[str] = None
+    usage_info: Dict[str, Any] = {}
+    finish_reason: Optional[str] = None
+    async for line in response.aiter_lines():
+        if not line:
+            continue
+        if not line.startswith("data:"):
+            continue
+        data_str = line[5:].strip()
+        if not data_str:
+            continue
+        if data_str == "[DONE]":
+            break
+        try:
+            data = json.loads(data_str)
+        except json.JSONDecodeError:
+            continue
+        if "choices" in data and data["choices"]:
+            delta = data["choices"][0].get("delta", {})
+            if "content" in delta:
+                content = delta["content"]
+                if content is not None:
+                    content_parts.append(content)
+            finish_reason = data["choices"][0].get("finish_reason") or finish_reason
+        if "model" in data:
+            model_name = data["model"]
+        if "usage" in data:
+            usage_info = data["usage"]
+    return {"content": "".join(content_parts), "model": model_name, "usage": usage_info, "finish_reason": finish_reason}
+
+
+async def new_consume(response: httpx.Response) -> Dict[str, Any]:
+    """新实现的解析循环（与 PureAIService._consume_stream_response 一致）"""
+    content_parts: List[str] = []
+    model_name: Optional[str] = None
+    usage_info: Dict[str, Any] = {}
+    finish_reason: Optional[str] = None
+    async for event in aiter_sse(response.aiter_bytes()):
+        if event.data == "[DONE]":
+            break
+        chunk = parse_chat_chunk(event.data)
+        if chunk is None:
+            continue
+        if chunk.content is not None:
+            content_parts.append(chunk.content)
+        finish_reason = chunk.finish_reason or finish_reason
+        if chunk.model:
+            model_name = chunk.model
+        if chunk.usage is not None:
+            usage_info = chunk.usage
+    return {"content": "".join(content_parts), "model": model_name, "usage": usage_info, "finish_reason": finish_reason}
+
+
+async def bench(consume, body: bytes, chunk_size: int, rounds: int) -> float:
+    """返回单次解析的最好耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(rounds):
+        response = httpx.Response(200, stream=ChunkedStream(body, chunk_size))
+        started = time.perf_counter()
+        await consume(response)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+async def main():
+    body = build_sse_body(4000)
+    reference = await legacy_consume(httpx.Response(200, stream=ChunkedStream(body, 1024)))
+    candidate = await new_consume(httpx.Response(200, stream=ChunkedStream(body, 7)))
+    assert reference == candidate, "新旧实现解析结果不一致"
+
+    print(f"SSE 响应体 {len(body) / 1024:.0f} KB，4000 个事件")
+    print(f"{'chunk size':>12} {'legacy ms':>12} {'new ms':>12} {'speedup':>10}")
+    for chunk_size in (64, 1024, 16384):
+        legacy = await bench(legacy_consume, body, chunk_size, rounds=10)
+        new = await bench(new_consume, body, chunk_size, rounds=10)
+        print(f"{chunk_size:>12} {legacy:>12.2f} {new:>12.2f} {legacy / new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+"""
+启动耗时基准测试
+在全新进程中测量：
+- import：导入 main 模块（构建应用）的耗时
+- ready：从启动 uvicorn 进程到健康检查返回 200 的耗时
+  - cold：全新的空数据目录（首次启动，需要创建默认管理员）
+  - warm：已有数据目录（常见的扩容副本场景）
+- first_request：就绪后第一个需要 AI 服务的请求（登录 + 模型列表）的耗时
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --output startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import statistics
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = "admin"
+PASSWORD = "startup-bench"
+
+
+def service_env() -> Dict[str, str]:
+    """被测服务进程的环境变量"""
+    return {
+        **os.environ,
+        "PYTHONPATH": PROJECT_ROOT,
+        "OPENAI_API_KEY": "startup-bench",
+        "DEFAULT_ADMIN_USERNAME": USERNAME,
+        "DEFAULT_ADMIN_PASSWORD": PASSWORD,
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(workdir: str) -> float:
+    """在新进程中导入 main，返回耗时（毫秒）"""
+    code = "import time; started = time.perf_counter(); import main; print((time.perf_counter() - started) * 1000)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=workdir, env=service_env(), text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_ready(workdir: str, timeout: float = 60.0) -> Dict[str, Optional[float]]:
+    """
+    启动 uvicorn 并轮询健康检查
+
+    Returns:
+        Dict: ready_ms（启动到就绪）与 first_request_ms（就绪后首个 AI 请求）
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", PROJECT_ROOT,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=service_env(),
+    )
+    try:
+        ready_ms = None
+        with httpx.Client(base_url=base_url, timeout=5.0) as client:
+            deadline = started + timeout
+            while time.perf_counter() < deadline:
+                try:
+                    if client.get("/api/v1/ai/health").status_code == 200:
+                        ready_ms = (time.perf_counter() - started) * 1000
+                        break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.005)
+            if ready_ms is None:
+                raise RuntimeError("等待服务就绪超时")
+
+            request_started = time.perf_counter()
+            token = client.post("/api/v1/auth/login", json={"username": USERNAME, "password": PASSWORD}).json()["access_token"]
+            client.get("/api/v1/ai/models", headers={"Authorization": f"Bearer {token}"}).raise_for_status()
+            first_request_ms = (time.perf_counter() - request_started) * 1000
+        return {"ready_ms": ready_ms, "first_request_ms": first_request_ms}
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """中位数与最小/最大值"""
+    return {
+        "median": round(statistics.median(values), 1),
+        "min": round(min(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的次数")
+    parser.add_argument("--output", default=None, help="保存结果的 JSON 文件")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"import_ms": [], "cold_ready_ms": [], "warm_ready_ms": [], "first_request_ms": []}
+    warm_dir = tempfile.mkdtemp(prefix="pure-ai-startup-warm-")
+    try:
+        # 预热数据目录：完成一次启动，生成用户与模型配置文件
+        measure_ready(warm_dir)
+        for _ in range(args.runs):
+            cold_dir = tempfile.mkdtemp(prefix="pure-ai-startup-cold-")
+            try:
+                results["import_ms"].append(measure_import(cold_dir))
+                shutil.rmtree(cold_dir)
+                os.makedirs(cold_dir)
+                results["cold_ready_ms"].append(measure_ready(cold_dir)["ready_ms"])
+            finally:
+                shutil.rmtree(cold_dir, ignore_errors=True)
+            warm = measure_ready(warm_dir)
+            results["warm_ready_ms"].append(warm["ready_ms"])
+            results["first_request_ms"].append(warm["first_request_ms"])
+    finally:
+        shutil.rmtree(warm_dir, ignore_errors=True)
+
+    summary = {name: summarize(values) for name, values in results.items()}
+    print(f"{'metric':<20} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for name, stats in summary.items():
+        print(f"{name:<20} {stats['median']:>10.1f} {stats['min']:>10.1f} {stats['max']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "summary": summary, "samples": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+本地模拟上游服务（OpenAI / 硅基流动兼容）
+用于压测时替代真实平台，避免产生调用费用
+
+支持的接口：
+    POST /v1/chat/completions    JSON 与 SSE 流式两种响应，支持 n 参数
+    GET  /v1/models              模型列表
+    GET  /v1/user/info           账户信息
+    POST /v1/images/generations  返回指向本服务的图片地址
+    POST /v1/embeddings          按输入文本生成确定性的伪向量
+    GET  /files/{name}           模拟 CDN 图片下载
+
+运行方式（在项目根目录）：
+    python -m benchmarks.fake_upstream --port 9100 --latency-ms 200 --token-rate 50 --error-rate 0.01
+
+然后以 OPENAI_BASE_URL=http://127.0.0.1:9100/v1 启动本服务即可。
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+
+
+class FakeUpstreamConfig:
+    """模拟上游的行为参数"""
+
+    def __init__(
+        self,
+        latency_ms: float = 100.0,
+        jitter_ms: float = 0.0,
+        token_rate: float = 100.0,
+        completion_tokens: int = 200,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        image_bytes: int = 512 * 1024,
+        embedding_dimensions: int = 1024,
+    ):
+        """
+        Args:
+            latency_ms: 首字节前的固定延迟（毫秒）
+            jitter_ms: 延迟的随机抖动上限（毫秒）
+            token_rate: 生成速率（token/秒），流式响应按此速率逐个输出
+            completion_tokens: 每次回复的 token 数
+            error_rate: 注入错误的概率（0-1）
+            error_status: 注入错误时返回的状态码
+            image_bytes: 模拟图片的大小（字节）
+            embedding_dimensions: 向量维度
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.image_bytes = image_bytes
+        self.embedding_dimensions = embedding_dimensions
+
+
+def create_app(config: FakeUpstreamConfig) -> FastAPI:
+    """根据配置创建模拟上游应用"""
+    app = FastAPI(title="Fake SiliconFlow Upstream")
+    image_payload = (b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * (config.image_bytes // 256 + 1))[:config.image_bytes]
+
+    async def _delay():
+        """模拟首字节延迟"""
+        latency = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def _maybe_error() -> Optional[Response]:
+        """按概率注入错误"""
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "injected upstream error", "type": "fake_error"}},
+            )
+        return None
+
+    def _prompt_tokens(messages: Any) -> int:
+        """粗略估算提示词 token 数"""
+        return max(1, len(json.dumps(messages, ensure_ascii=False)) // 4)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body: Dict[str, Any] = await request.json()
+        await _delay()
+        error = _maybe_error()
+        if error is not None:
+            return error
+
+        model = body.get("model", "fake-model")
+        n = int(body.get("n", 1) or 1)
+        tokens = min(config.completion_tokens, int(body.get("max_tokens") or config.completion_tokens))
+        prompt_tokens = _prompt_tokens(body.get("messages"))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": tokens * n,
+            "total_tokens": prompt_tokens + tokens * n,
+        }
+        interval = 1.0 / config.token_rate if config.token_rate > 0 else 0.0
+
+        if body.get("stream"):
+            async def event_stream():
+                created = int(time.time())
+                for index in range(tokens):
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": f"t{index} "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    if interval:
+                        await asyncio.sleep(interval)
+                final = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        # 非流式：整段生成完成后一次返回
+        if interval:
+            await asyncio.sleep(tokens * interval)
+        content = " ".join(f"t{index}" for index in range(tokens))
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": index, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for index in range(n)
+            ],
+            "usage": usage,
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        await _delay()
+        error = _maybe_error()
+        if error is not None:
+            return error
+        return {
+            "object": "list",
+            "data": [
+                {"id": f"fake-org/fake-model-{index}", "object": "model", "created": 0, "owned_by": "fake"}
+                for index in range(200)
+            ],
+        }
+
+    @app.get("/v1/user/info")
+    async def user_info():
+        await _delay()
+        error = _maybe_error()
+        if error is not None:
+            return error
+        return {
+            "code": 20000,
+            "status": True,
+            "message": "Ok",
+            "data": {
+                "id": "fake-user",
+                "name": "benchmark",
+                "email": "bench@example.com",
+                "balance": "100.00",
+                "chargeBalance": "0.00",
+                "totalBalance": "100.00",
+                "status": "normal",
+            },
+        }
+
+    @app.post("/v1/images/generations")
+    async def images_generations(request: Request):
+        await request.body()
+        await _delay()
+        error = _maybe_error()
+        if error is not None:
+            return error
+        base = str(request.base_url).rstrip("/")
+        return {
+            "images": [{"url": f"{base}/files/{random.getrandbits(64):016x}.png"}],
+            "timings": {"inference": config.latency_ms / 1000},
+            "seed": random.randint(0, 2 ** 31),
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body: Dict[str, Any] = await request.json()
+        await _delay()
+        error = _maybe_error()
+        if error is not None:
+            return error
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        data = []
+        for index, text in enumerate(texts):
+            rng = random.Random(text)
+            data.append({
+                "object": "embedding",
+                "index": index,
+                "embedding": [rng.uniform(-1, 1) for _ in range(config.embedding_dimensions)],
+            })
+        prompt_tokens = sum(max(1, len(text) // 4) for text in texts)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.get("/files/{name}")
+    async def download_file(name: str):
+        await _delay()
+        return Response(content=image_payload, media_type="image/png")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟硅基流动上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="首字节延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="延迟随机抖动（毫秒）")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="生成速率（token/秒），0 表示不限速")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="每次回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误注入概率（0-1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的状态码")
+    parser.add_argument("--image-bytes", type=int, default=512 * 1024, help="模拟图片大小（字节）")
+    parser.add_argument("--embedding-dimensions", type=int, default=1024, help="模拟向量维度")
+    args = parser.parse_args()
+
+    config = FakeUpstreamConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        image_bytes=args.image_bytes,
+        embedding_dimensions=args.embedding_dimensions,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+压测驱动
+按设定的并发级别依次压测 /api/v1/ai 下的全部接口，统计吞吐、延迟分位数、首字节时间和服务进程峰值内存，
+结果保存为 JSON，便于在不同提交之间对比。
+
+运行方式（在项目根目录）：
+    # 自动启动模拟上游和本服务（临时工作目录，不影响 data/ 下的真实数据）
+    python -m benchmarks.load_driver --spawn --concurrency 1,8,32 --requests 100
+
+    # 压测已运行的服务（需提供服务进程 PID 才能统计内存）
+    python -m benchmarks.load_driver --base-url http://127.0.0.1:8000 --service-pid 12345
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+# 1x1 PNG，用于 OCR 和图片编辑接口
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+FAKE_MODEL = "fake-org/fake-model-0"
+
+
+def build_scenarios() -> Dict[str, Dict[str, Any]]:
+    """
+    构建每个接口的请求参数
+
+    Returns:
+        Dict: 场景名 -> {method, path, json/files/data}
+    """
+    return {
+        "health": {"method": "GET", "path": "/api/v1/ai/health"},
+        "models": {"method": "GET", "path": "/api/v1/ai/models"},
+        "models_config": {"method": "GET", "path": "/api/v1/ai/models-config"},
+        "platform_models": {"method": "GET", "path": "/api/v1/ai/platform/models"},
+        "platform_user_info": {"method": "GET", "path": "/api/v1/ai/platform/user-info"},
+        "text_analyze": {
+            "method": "POST",
+            "path": "/api/v1/ai/text/analyze",
+            "json": {"text": "今天天气很好，我们去公园散步。" * 20, "task": "summarize", "model": FAKE_MODEL},
+        },
+        "chat": {
+            "method": "POST",
+            "path": "/api/v1/ai/chat",
+            "json": {"messages": [{"role": "user", "content": "你好，介绍一下你自己"}], "model": FAKE_MODEL},
+        },
+        "code": {
+            "method": "POST",
+            "path": "/api/v1/ai/code",
+            "json": {"code": "def add(a, b):\n    return a + b\n", "task": "review", "language": "python", "model": FAKE_MODEL},
+        },
+        "ocr": {
+            "method": "POST",
+            "path": "/api/v1/ai/ocr",
+            "files": {"file": ("tiny.png", TINY_PNG, "image/png")},
+            "data": {"language": "auto", "detail_level": "medium", "model": FAKE_MODEL},
+        },
+        "image_describe": {
+            "method": "POST",
+            "path": "/api/v1/ai/image/describe",
+            "json": {"prompt": "一只猫", "model": FAKE_MODEL, "n": 2},
+        },
+        "quick": {
+            "method": "POST",
+            "path": "/api/v1/ai/quick",
+            "json": {"prompt": "用一句话介绍杭州", "model": FAKE_MODEL},
+        },
+        "embeddings": {
+            "method": "POST",
+            "path": "/api/v1/ai/embeddings",
+            "json": {"input": "向量化压测文本，模拟 RAG 单条查询", "model": FAKE_MODEL},
+        },
+        "batch": {
+            "method": "POST",
+            "path": "/api/v1/ai/batch",
+            "json": [
+                {"id": index, "type": "text", "text": "批量任务文本", "task": "summarize", "model": FAKE_MODEL}
+                for index in range(5)
+            ],
+        },
+        "image_edit": {
+            "method": "POST",
+            "path": "/api/v1/ai/image/edit",
+            "files": {"file": ("tiny.png", TINY_PNG, "image/png")},
+            "data": {"instruction": "把背景换成蓝色", "model": FAKE_MODEL},
+        },
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def read_peak_rss_kb(pid: Optional[int]) -> Optional[int]:
+    """读取进程的峰值常驻内存（KB），仅支持 Linux /proc"""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def run_request(client: httpx.AsyncClient, scenario: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    """
+    执行一次请求，流式读取响应以记录首字节时间
+
+    Returns:
+        Dict: latency、ttfb（秒）、status、ok
+    """
+    started = time.perf_counter()
+    ttfb = None
+    status = 0
+    try:
+        async with client.stream(
+            scenario["method"],
+            scenario["path"],
+            headers=headers,
+            json=scenario.get("json"),
+            files=scenario.get("files"),
+            data=scenario.get("data"),
+        ) as response:
+            status = response.status_code
+            async for chunk in response.aiter_raw():
+                if ttfb is None and chunk:
+                    ttfb = time.perf_counter() - started
+    except httpx.HTTPError:
+        status = 0
+    latency = time.perf_counter() - started
+    return {"latency": latency, "ttfb": ttfb if ttfb is not None else latency, "status": status, "ok": 200 <= status < 300}
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    scenario: Dict[str, Any],
+    headers: Dict[str, str],
+    concurrency: int,
+    total_requests: int
+) -> Dict[str, Any]:
+    """在指定并发下执行固定数量的请求并汇总统计"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(total_requests):
+        queue.put_nowait(None)
+    samples: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            samples.append(await run_request(client, scenario, headers))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(sample["latency"] for sample in samples)
+    ttfbs = sorted(sample["ttfb"] for sample in samples)
+    errors = sum(1 for sample in samples if not sample["ok"])
+    status_counts: Dict[str, int] = {}
+    for sample in samples:
+        status_counts[str(sample["status"])] = status_counts.get(str(sample["status"]), 0) + 1
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": errors,
+        "status_counts": status_counts,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "ttfb_ms": {
+            "p50": ms(percentile(ttfbs, 0.50)),
+            "p95": ms(percentile(ttfbs, 0.95)),
+            "p99": ms(percentile(ttfbs, 0.99)),
+        },
+    }
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    """登录获取认证头"""
+    response = await client.post("/api/v1/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def ensure_fake_models(client: httpx.AsyncClient, headers: Dict[str, str]):
+    """确保模型配置中包含模拟模型（仅用于 --spawn 的临时目录）"""
+    await client.post(
+        "/api/v1/ai/models-config",
+        headers=headers,
+        json=[{"id": FAKE_MODEL, "object": "model", "created": 0, "owned_by": "fake"}],
+    )
+
+
+async def drive(args: argparse.Namespace, service_pid: Optional[int]) -> Dict[str, Any]:
+    """依次压测全部场景和并发级别"""
+    scenarios = build_scenarios()
+    selected = args.endpoints.split(",") if args.endpoints else list(scenarios)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        headers = await login(client, args.username, args.password)
+        if args.spawn:
+            await ensure_fake_models(client, headers)
+        for name in selected:
+            scenario = scenarios[name]
+            results[name] = []
+            for level in levels:
+                stats = await run_level(client, scenario, headers, level, args.requests)
+                stats["peak_rss_kb"] = read_peak_rss_kb(service_pid)
+                results[name].append(stats)
+                print(
+                    f"{name:<20} c={level:<4} rps={stats['rps']:<9} "
+                    f"p50={stats['latency_ms']['p50']}ms p99={stats['latency_ms']['p99']}ms "
+                    f"ttfb_p50={stats['ttfb_ms']['p50']}ms errors={stats['errors']}"
+                )
+    return results
+
+
+def git_revision() -> Optional[str]:
+    """当前提交，用于区分结果"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_for_port(url: str, timeout: float = 30.0):
+    """等待服务可访问"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def service_settings(args: argparse.Namespace) -> Dict[str, str]:
+    """
+    --spawn 时覆盖的服务端保护配置
+
+    限流与准入控制默认开启，压测单个用户的高并发请求几乎全部会返回 429 / 503，
+    测到的是保护机制而不是服务本身，因此默认关闭，需要时用 --rate-limit / --admission 保留。
+    """
+    return {
+        "RATE_LIMIT_ENABLED": "true" if args.rate_limit else "false",
+        "ADMISSION_ENABLED": "true" if args.admission else "false",
+    }
+
+
+def spawn_stack(args: argparse.Namespace, workdir: str) -> List[subprocess.Popen]:
+    """在临时工作目录中启动模拟上游和本服务"""
+    env = {
+        **os.environ,
+        "PYTHONPATH": PROJECT_ROOT,
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.upstream_port}/v1",
+        "DEFAULT_ADMIN_USERNAME": args.username,
+        "DEFAULT_ADMIN_PASSWORD": args.password,
+        "LOG_LEVEL": args.service_log_level,
+        **service_settings(args),
+    }
+    upstream = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_upstream",
+            "--port", str(args.upstream_port),
+            "--latency-ms", str(args.latency_ms),
+            "--token-rate", str(args.token_rate),
+            "--completion-tokens", str(args.completion_tokens),
+            "--error-rate", str(args.error_rate),
+        ],
+        cwd=PROJECT_ROOT,
+        env=env,
+    )
+    service = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", PROJECT_ROOT,
+            "--host", "127.0.0.1",
+            "--port", str(args.service_port),
+            "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env=env,
+    )
+    wait_for_port(f"http://127.0.0.1:{args.upstream_port}/v1/models")
+    wait_for_port(f"http://127.0.0.1:{args.service_port}/api/v1/ai/health")
+    return [upstream, service]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pure AI Service 压测驱动")
+    parser.add_argument("--base-url", default=None, help="被测服务地址（--spawn 时自动设置）")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--concurrency", default="1,8,32", help="并发级别，逗号分隔")
+    parser.add_argument("--requests", type=int, default=100, help="每个并发级别的请求数")
+    parser.add_argument("--endpoints", default="", help="只压测指定场景，逗号分隔")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--service-pid", type=int, default=None, help="被测服务进程 PID，用于统计峰值内存")
+    parser.add_argument("--output", default=None, help="结果文件路径，默认保存到 benchmarks/results/")
+    parser.add_argument("--spawn", action="store_true", help="自动启动模拟上游和本服务")
+    parser.add_argument("--service-port", type=int, default=18000)
+    parser.add_argument("--upstream-port", type=int, default=19100)
+    parser.add_argument("--service-log-level", default="WARNING")
+    parser.add_argument("--rate-limit", action="store_true", help="保留服务的按用户限流（--spawn，默认关闭）")
+    parser.add_argument("--admission", action="store_true", help="保留服务的准入控制（--spawn，默认关闭）")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="模拟上游首字节延迟（--spawn）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="模拟上游生成速率（--spawn）")
+    parser.add_argument("--completion-tokens", type=int, default=100, help="模拟上游回复长度（--spawn）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟上游错误率（--spawn）")
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    workdir = None
+    service_pid = args.service_pid
+    try:
+        if args.spawn:
+            workdir = tempfile.mkdtemp(prefix="pure-ai-bench-")
+            args.base_url = f"http://127.0.0.1:{args.service_port}"
+            processes = spawn_stack(args, workdir)
+            service_pid = processes[1].pid
+        elif not args.base_url:
+            parser.error("需要指定 --base-url 或使用 --spawn")
+
+        results = asyncio.run(drive(args, service_pid))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    revision = git_revision()
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": revision,
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key != "password"},
+        # 外部服务（--base-url）的配置无法得知，记为 null
+        "service_settings": service_settings(args) if args.spawn else None,
+        "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"load-{stamp}-{revision or 'unknown'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
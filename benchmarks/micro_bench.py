@@ -0,0 +1,325 @@
+"""
+进程内热点函数微基准
+在真实规模的数据上单独测量各热点函数：长 SSE 流解析、请求日志中间件、JWT 校验、
+万级用户文件的认证查找、OCR 路径的 base64 编码与请求体序列化。
+输出每秒操作数和单次操作的内存分配峰值，并与保存的基线对比标记性能回退。
+
+运行方式（在项目根目录）：
+    python -m benchmarks.micro_bench                     # 运行全部并与基线对比
+    python -m benchmarks.micro_bench --filter stream     # 只运行名称包含 stream 的用例
+    python -m benchmarks.micro_bench --save-baseline     # 将本次结果保存为基线
+    python -m benchmarks.micro_bench --fail-on-regression
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(PROJECT_ROOT, "benchmarks", "baseline_micro.json")
+
+# 在临时目录中运行，避免用户管理器等模块在项目 data/ 下写文件
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "pure-ai-micro-bench.log"))
+_ORIGINAL_CWD = os.getcwd()
+_WORKDIR = tempfile.mkdtemp(prefix="pure-ai-micro-")
+os.chdir(_WORKDIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+import httpx  # noqa: E402
+from loguru import logger  # noqa: E402
+import app.core.logger  # noqa: E402,F401
+from benchmarks.payloads import build_sse_body, build_chat_body  # noqa: E402
+
+# 替换应用日志输出：日志照常格式化但不输出，衡量真实的日志开销
+logger.remove()
+logger.add(lambda _: None, level="INFO")
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    """注册基准用例：被装饰函数负责准备数据并返回单次操作的可调用对象"""
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+_loop = asyncio.new_event_loop()
+
+
+def run_async(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """把协程工厂包装成同步调用"""
+    return lambda: _loop.run_until_complete(factory())
+
+
+# ---------------------------------------------------------------------------
+# 数据构造
+# ---------------------------------------------------------------------------
+
+def make_request(body: bytes, path: str = "/api/v1/ai/chat"):
+    """构造带请求体的 Starlette 请求"""
+    from starlette.requests import Request
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+        "scheme": "http",
+        "root_path": "",
+    }
+    return Request(scope, receive)
+
+
+# ---------------------------------------------------------------------------
+# 用例
+# ---------------------------------------------------------------------------
+
+@benchmark("stream.consume_4k_events")
+def bench_consume_stream():
+    from app.services.pure_ai_service import PureAIService
+
+    service = PureAIService()
+    body = build_sse_body()
+
+    async def op():
+        response = httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+        result = await service._consume_stream_response(response)
+        assert result["success"]
+
+    return run_async(op)
+
+
+@benchmark("middleware.log_request_large_chat")
+def bench_log_request():
+    from app.core.request_logging_middleware import RequestLoggingMiddleware
+
+    middleware = RequestLoggingMiddleware(app=None)
+    body = build_chat_body()
+
+    async def op():
+        await middleware._log_request(make_request(body), "bench")
+
+    return run_async(op)
+
+
+@benchmark("middleware.log_response_json")
+def bench_log_response():
+    from starlette.responses import StreamingResponse
+    from app.core.request_logging_middleware import RequestLoggingMiddleware
+
+    middleware = RequestLoggingMiddleware(app=None)
+    payload = json.dumps({"success": True, "content": "回答内容" * 2000}, ensure_ascii=False).encode("utf-8")
+
+    async def op():
+        # BaseHTTPMiddleware 的 call_next 返回的是流式响应包装
+        response = StreamingResponse(iter([payload]), media_type="application/json")
+        await middleware._log_response(response, "bench", 0.1)
+
+    return run_async(op)
+
+
+@benchmark("auth.verify_token")
+def bench_verify_token():
+    from app.core.auth import create_access_token, verify_token
+
+    token = create_access_token({"sub": "admin"})
+    return lambda: verify_token(token)
+
+
+@benchmark("auth.get_current_user")
+def bench_get_current_user():
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.core.auth import create_access_token, get_current_user
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": "admin"}))
+    return run_async(lambda: get_current_user(credentials))
+
+
+def _prepare_users_10k():
+    """向存储后端导入一万个用户（共用同一个密码哈希以节省准备时间）并返回用户管理器"""
+    from app.core import user_manager as user_manager_module
+
+    manager = user_manager_module.user_manager
+    password_hash = manager.get_password_hash("bench-password")
+    manager.storage.import_users(
+        {
+            "username": f"user{index:05d}",
+            "nickname": f"用户{index}",
+            "password_hash": password_hash,
+            "created_at": "2025-01-01T00:00:00",
+        }
+        for index in range(10000)
+    )
+    return manager
+
+
+@benchmark("users.authenticate_10k")
+def bench_authenticate_user():
+    manager = _prepare_users_10k()
+    return lambda: manager.authenticate_user("user09999", "bench-password")
+
+
+@benchmark("users.get_user_10k")
+def bench_get_user():
+    manager = _prepare_users_10k()
+    return lambda: manager.get_user("user09999")
+
+
+@benchmark("ocr.b64encode_10mb")
+def bench_ocr_b64encode():
+    image = os.urandom(10 * 1024 * 1024)
+    return lambda: base64.b64encode(image).decode("utf-8")
+
+
+@benchmark("ocr.payload_encode_10mb")
+def bench_ocr_payload():
+    from app.services.prompt_registry import prompt_registry
+
+    image_base64 = base64.b64encode(os.urandom(10 * 1024 * 1024)).decode("utf-8")
+
+    def op():
+        messages = prompt_registry.build_messages(
+            "ocr",
+            "auto:medium",
+            [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}],
+        )
+        payload = {"model": "zai-org/GLM-4.5V", "messages": messages, "temperature": 0.1, "max_tokens": 2000, "stream": True}
+        # 与 httpx json= 的编码方式一致
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+    return op
+
+
+# ---------------------------------------------------------------------------
+# 执行与对比
+# ---------------------------------------------------------------------------
+
+def measure(op: Callable[[], Any], min_time: float, repeats: int) -> Dict[str, Any]:
+    """
+    测量单个用例
+
+    Returns:
+        Dict: ops_per_sec（多轮取最好）、mean_us、alloc_peak_kb、alloc_blocks
+    """
+    op()  # 预热
+
+    # 校准每轮迭代次数，使单轮耗时约为 min_time
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            op()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or iterations >= 1_000_000:
+            break
+        iterations *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / iterations
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            op()
+        best = min(best, (time.perf_counter() - started) / iterations)
+
+    # 单次操作的内存分配
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(1 / best, 2) if best else None,
+        "mean_us": round(best * 1e6, 2),
+        "iterations": iterations,
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "alloc_blocks": blocks_after - blocks_before,
+    }
+
+
+def load_baseline() -> Dict[str, Any]:
+    """读取基线结果"""
+    try:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("results", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--min-time", type=float, default=0.3, help="每轮最短耗时（秒）")
+    parser.add_argument("--repeats", type=int, default=3, help="重复轮数，取最好成绩")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定回退的性能下降比例")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在回退时以非零状态退出")
+    parser.add_argument("--output", default=None, help="额外保存本次结果的 JSON 文件")
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    results: Dict[str, Any] = {}
+    regressions: List[str] = []
+
+    print(f"{'benchmark':<36} {'ops/sec':>12} {'mean':>12} {'alloc peak':>12} {'vs baseline':>12}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        stats = measure(setup(), args.min_time, args.repeats)
+        results[name] = stats
+
+        change = ""
+        base_ops = baseline.get(name, {}).get("ops_per_sec")
+        if base_ops and stats["ops_per_sec"]:
+            ratio = stats["ops_per_sec"] / base_ops
+            change = f"{(ratio - 1) * 100:+.1f}%"
+            if ratio < 1 - args.threshold:
+                change += " REGRESSION"
+                regressions.append(name)
+        print(
+            f"{name:<36} {stats['ops_per_sec']:>12,.1f} {stats['mean_us']:>10,.1f}us "
+            f"{stats['alloc_peak_kb']:>10,.1f}KB {change:>12}"
+        )
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.output:
+        with open(os.path.join(_ORIGINAL_CWD, args.output), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({**report, "results": merged}, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {BASELINE_FILE}")
+
+    if regressions:
+        print(f"性能回退: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+基准测试共用的数据构造
+"""
+
+import json
+
+
+def build_sse_body(events: int = 4000) -> bytes:
+    """构造逐 token 输出的 SSE 响应体"""
+    lines = []
+    for index in range(events):
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "zai-org/GLM-4.5",
+            "choices": [{"index": 0, "delta": {"content": f"词{index}"}, "finish_reason": None}],
+        }
+        lines.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    final = {
+        "id": "chatcmpl-bench",
+        "model": "zai-org/GLM-4.5",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": events, "total_tokens": 100 + events},
+    }
+    lines.append(f"data: {json.dumps(final)}\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def build_chat_body(turns: int = 200) -> bytes:
+    """构造多轮对话请求体（约数百 KB）"""
+    messages = []
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"第{index}轮问题：" + "请详细解释一下。" * 40})
+        messages.append({"role": "assistant", "content": f"第{index}轮回答：" + "这是一个很长的回答。" * 60})
+    return json.dumps({"messages": messages, "model": "zai-org/GLM-4.5"}, ensure_ascii=False).encode("utf-8")
@@ -1,26 +1,72 @@
-import uvicorn
+# 最先导入启动耗时分析，PROFILE_IMPORTS=true 时统计后续所有模块的导入耗时
+from app.core import startup_profile
+startup_profile.install_if_enabled()
+
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from app.core.config import settings
+from app.core.config import settings, validate_settings
 from app.core.logger import app_logger
+from app.core.json_backend import FastJSONResponse
 from app.api.ai_endpoints import router as ai_router
+from app.api.ws_endpoints import router as ws_router
 from app.api.auth_endpoints import router as auth_router
+from app.api.blob_endpoints import router as blob_router
+from app.api.usage_endpoints import router as usage_router
+from app.api.rate_limit_endpoints import router as rate_limit_router
 from app.core.request_logging_middleware import RequestLoggingMiddleware
+from app.core.static_files import PrecompressedStaticFiles
+from app.core.compression import CompressionMiddleware
+from app.core.models_config_manager import models_config_manager
+from app.core.usage import usage_tracker
+from app.core.admission import admission_controller
+from app.core.blob_store import blob_store
+from app.services.pure_ai_service import close_ai_service
+from app.services.chat_sessions import chat_sessions
+
+startup_profile.mark("导入模块")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    # 检查必要的配置，缺失时中止启动
+    errors = validate_settings()
+    if errors:
+        for error in errors:
+            app_logger.error(f"错误: {error}")
+        raise RuntimeError("必要配置缺失，服务无法启动")
+
+    # 在后台线程中准备用户数据和默认管理员（首次创建需要 bcrypt 哈希），不阻塞服务就绪；
+    # 初始化完成前到达的认证请求会等待其完成
+    from app.core.user_manager import user_manager
+    app.state.user_init = asyncio.get_running_loop().run_in_executor(None, user_manager.initialize)
+    models_config_manager.initialize()
+    # 定期把内存中的 token 用量计数批量写入存储
+    usage_tracker.start()
+    # 定期清理过期的对话会话，开启持久化时批量写入变更
+    chat_sessions.start()
+    # 定期清理过期或超出容量的 Blob（编辑后的图片）
+    blob_store.start()
+    # 预先计算静态资源的 ETag 与压缩版本（压缩较慢，放到线程中）
+    if frontend_files is not None:
+        await asyncio.to_thread(frontend_files.prepare)
+
+    startup_profile.mark("启动初始化")
     app_logger.info(f"{settings.app_name} v{settings.app_version} 启动成功")
     app_logger.info(f"服务运行在: http://{settings.host}:{settings.port}")
+    startup_profile.log_report(app_logger)
     yield
-    # 关闭 httpx 客户端连接池
-    from app.api.ai_endpoints import ai_service
-    await ai_service.close()
+    # 写入剩余的 token 用量计数
+    await usage_tracker.stop()
+    # 写入尚未持久化的对话会话
+    await chat_sessions.stop()
+    await blob_store.stop()
+    # 关闭 httpx 客户端连接池（AI 服务在首次请求时才创建）
+    await close_ai_service()
     app_logger.info(f"{settings.app_name} 服务关闭")
 
 
@@ -30,6 +76,7 @@ app = FastAPI(
     description="纯AI服务API - 所有功能通过大模型API实现",
     debug=settings.debug,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # 添加请求日志中间件（第一个添加，最后执行）
@@ -43,8 +90,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 挂载静态文件服务（前端构建后的文件）
+# 响应压缩（最后添加，最先执行）：在最外层压缩，日志中间件看到的仍是原始响应体
+if settings.compression_enabled:
+    app.add_middleware(CompressionMiddleware)
+
+# 挂载静态文件服务（前端构建后的文件），/static 与 / 共用同一份预处理索引
 static_dir = "static"
+frontend_files = PrecompressedStaticFiles(directory=static_dir, html=True) if os.path.exists(static_dir) else None
 
 # 健康检查端点（必须在其他路由之前注册，避免被认证拦截）
 @app.get("/api/v1/ai/health")
@@ -58,12 +110,33 @@ async def health_check():
         "version": settings.app_version
     }
 
+# 就绪检查（不需要认证）：准入控制判定过载时返回 503，负载均衡器据此把流量转移到其他实例
+@app.get("/api/v1/ai/ready")
+async def readiness_check():
+    """
+    公开的就绪检查接口，返回当前 worker 的饱和度
+    """
+    status = admission_controller.status()
+    return FastJSONResponse(status, status_code=200 if status["ready"] else 503)
+
 # 注册认证路由（无需权限）
 app.include_router(auth_router, prefix="/api/v1")
 
+# 注册本地 Blob 路由（引用ID即访问凭证，无需权限）
+app.include_router(blob_router, prefix="/api/v1")
+
 # 注册AI路由（需要权限）
 app.include_router(ai_router, prefix="/api/v1")
 
+# 注册 WebSocket 对话路由（连接建立时认证）
+app.include_router(ws_router, prefix="/api/v1")
+
+# 注册用量查询路由（需要权限）
+app.include_router(usage_router, prefix="/api/v1")
+
+# 注册限流档位路由（需要权限）
+app.include_router(rate_limit_router, prefix="/api/v1")
+
 @app.get("/")
 async def root():
     return {
@@ -74,11 +147,15 @@ async def root():
     }
 
 # 静态文件挂载放在所有路由之后，避免拦截 /api 路径
-if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
-    app.mount("/", StaticFiles(directory=static_dir, html=True), name="frontend")
+if frontend_files is not None:
+    app.mount("/static", frontend_files, name="static")
+    app.mount("/", frontend_files, name="frontend")
+
+startup_profile.mark("构建应用")
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "main:app",
         host=settings.host,
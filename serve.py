@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+纯AI服务生产启动脚本
+主进程先绑定监听端口，再按可用 CPU 数或配置启动多个 uvicorn worker 进程并负责监管：
+worker 退出（如处理满 WEB_MAX_REQUESTS 个请求后平滑回收）时自动重新拉起，
+收到 SIGTERM / SIGINT 时通知全部 worker 平滑关闭。
+
+运行方式：
+    python serve.py                          # 使用 .env / 环境变量中的 WEB_* 配置
+    python serve.py --workers 4 --preload    # 命令行参数覆盖配置
+
+开发环境请继续使用 start.py（单进程、热重载）。
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import signal
+import socket
+import argparse
+import importlib.util
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+
+from app.core.config import settings, validate_settings
+from app.core.logger import app_logger
+
+APP_PATH = "main:app"
+
+
+def available_cpus() -> int:
+    """
+    计算本进程实际可用的 CPU 数
+
+    依次考虑 CPU 亲和性（taskset）和 cgroup 配额（容器的 cpus 限制），取最小值。
+    """
+    count = os.cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+
+    quota: Optional[float] = None
+    try:
+        # cgroup v2: "<quota> <period>" 或 "max <period>"
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            value, period = f.read().split()
+            if value != "max":
+                quota = int(value) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+                value = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+                period = int(f.read())
+            if value > 0 and period > 0:
+                quota = value / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        count = min(count, math.ceil(quota))
+    return max(1, count)
+
+
+def resolve_loop(name: str) -> str:
+    """确定事件循环实现，auto 时优先 uvloop"""
+    name = name.lower()
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    if name == "auto":
+        return "uvloop" if has_uvloop else "asyncio"
+    if name == "uvloop" and not has_uvloop:
+        app_logger.warning("未安装 uvloop，回退到 asyncio 事件循环")
+        return "asyncio"
+    return name
+
+
+def resolve_http(name: str) -> str:
+    """确定 HTTP 协议解析器，auto 时优先 httptools"""
+    name = name.lower()
+    has_httptools = importlib.util.find_spec("httptools") is not None
+    if name == "auto":
+        return "httptools" if has_httptools else "h11"
+    if name == "httptools" and not has_httptools:
+        app_logger.warning("未安装 httptools，回退到 h11 解析器")
+        return "h11"
+    return name
+
+
+def build_config(options: argparse.Namespace, app: Any, max_requests: Optional[int] = None) -> uvicorn.Config:
+    """
+    构造单个 worker 的 uvicorn 配置
+
+    Args:
+        options: 命令行参数（已合并配置默认值）
+        app: 应用对象（预加载时）或导入路径
+        max_requests: 该 worker 的最大请求数，None 表示不回收
+    """
+    return uvicorn.Config(
+        app,
+        host=options.host,
+        port=options.port,
+        loop=options.loop,
+        http=options.http,
+        backlog=options.backlog,
+        timeout_keep_alive=options.keepalive,
+        limit_concurrency=options.limit_concurrency or None,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=options.graceful_timeout,
+        log_level=settings.log_level.lower(),
+    )
+
+
+def run_worker(config: uvicorn.Config, sockets: List[socket.socket]):
+    """worker 进程入口：在共享的监听套接字上运行 uvicorn"""
+    server = uvicorn.Server(config)
+    server.run(sockets=sockets)
+
+
+class Supervisor:
+    """worker 进程监管器"""
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        # worker 继承该环境变量，据此判断需要跨 worker 共享的状态（如对话会话）
+        os.environ["WEB_WORKER_COUNT"] = str(options.workers)
+        self.should_exit = False
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self._started_at: Dict[int, float] = {}
+
+        # 预加载需要 fork 才能让子进程共享已导入的应用；否则用 spawn 在子进程中重新导入
+        if options.preload and "fork" not in multiprocessing.get_all_start_methods():
+            app_logger.warning("当前平台不支持 fork，忽略预加载")
+            options.preload = False
+        self.context = multiprocessing.get_context("fork" if options.preload else "spawn")
+
+        if options.preload:
+            from main import app
+            self.app: Any = app
+        else:
+            self.app = APP_PATH
+
+        self.socket = build_config(options, APP_PATH).bind_socket()
+
+    def _max_requests(self) -> Optional[int]:
+        """每个 worker 的最大请求数加上随机抖动，避免所有 worker 同时回收"""
+        if self.options.max_requests <= 0:
+            return None
+        return self.options.max_requests + random.randint(0, max(0, self.options.max_requests_jitter))
+
+    def spawn(self, slot: int):
+        """在指定槽位启动 worker"""
+        config = build_config(self.options, self.app, self._max_requests())
+        process = self.context.Process(
+            target=run_worker,
+            args=(config, [self.socket]),
+            name=f"pure-ai-worker-{slot}",
+        )
+        process.start()
+        self.workers[slot] = process
+        self._started_at[slot] = time.monotonic()
+        app_logger.info(f"启动 worker {slot} (pid={process.pid}, max_requests={config.limit_max_requests})")
+
+    def handle_signal(self, signum, frame):
+        """收到退出信号后停止监管并关闭 worker"""
+        self.should_exit = True
+
+    def run(self):
+        """启动全部 worker 并在退出时重新拉起，直到收到退出信号"""
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        app_logger.info(
+            f"生产模式启动: http://{self.options.host}:{self.options.port}, workers={self.options.workers}, "
+            f"loop={self.options.loop}, http={self.options.http}, preload={self.options.preload}"
+        )
+        for slot in range(self.options.workers):
+            self.spawn(slot)
+
+        while not self.should_exit:
+            sentinels = {process.sentinel: slot for slot, process in self.workers.items()}
+            for sentinel in wait(list(sentinels), timeout=1.0):
+                if self.should_exit:
+                    break
+                slot = sentinels[sentinel]
+                process = self.workers[slot]
+                process.join()
+                app_logger.info(f"worker {slot} (pid={process.pid}) 已退出, exitcode={process.exitcode}")
+                # 启动后立即退出通常是配置或代码错误，稍作等待避免疯狂重启
+                if time.monotonic() - self._started_at[slot] < 1.0:
+                    time.sleep(1.0)
+                self.spawn(slot)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """通知所有 worker 平滑关闭，超时后强制结束"""
+        app_logger.info("正在关闭全部 worker...")
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.options.graceful_timeout + 5
+        for process in self.workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                app_logger.warning(f"worker pid={process.pid} 未在超时内退出，强制结束")
+                process.kill()
+                process.join()
+
+        self.socket.close()
+        app_logger.info(f"{settings.app_name} 服务关闭")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数，默认值取自配置"""
+    parser = argparse.ArgumentParser(description="纯AI服务生产启动器")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.web_workers, help="worker 数，0 表示按可用 CPU 数")
+    parser.add_argument("--loop", default=settings.web_loop, choices=["auto", "uvloop", "asyncio"])
+    parser.add_argument("--http", default=settings.web_http, choices=["auto", "httptools", "h11"])
+    parser.add_argument("--backlog", type=int, default=settings.web_backlog)
+    parser.add_argument("--keepalive", type=int, default=settings.web_keepalive, help="keep-alive 空闲超时（秒）")
+    parser.add_argument("--limit-concurrency", type=int, default=settings.web_limit_concurrency)
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=settings.web_preload)
+    parser.add_argument("--max-requests", type=int, default=settings.web_max_requests)
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.web_max_requests_jitter)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.web_graceful_timeout)
+    options = parser.parse_args(argv)
+
+    options.workers = options.workers if options.workers > 0 else available_cpus()
+    options.loop = resolve_loop(options.loop)
+    options.http = resolve_http(options.http)
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    options = parse_args(argv)
+    # 配置缺失时每个 worker 都会启动失败，直接在主进程中退出，避免反复重启
+    errors = validate_settings()
+    if errors:
+        for error in errors:
+            app_logger.error(f"错误: {error}")
+        return 1
+    Supervisor(options).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
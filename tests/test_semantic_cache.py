@@ -0,0 +1,79 @@
+"""语义缓存提示词归一化与精确命中"""
+
+import os
+import asyncio
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.services.semantic_cache import SemanticCache, normalize_prompt  # noqa: E402
+
+# 只在运算符 / 比较符上不同的提示词，语义不同，不能归一化为同一个键
+OPERATOR_PAIRS = [
+    ("2+3等于几", "2*3等于几"),
+    ("2*3等于几", "2/3等于几"),
+    ("5-3等于几", "5*3等于几"),
+    ("is a<b true", "is a>b true"),
+    ("x == 1 ?", "x != 1 ?"),
+    ("-5的绝对值", "5的绝对值"),
+    ("计算 5!", "计算 5"),
+]
+
+# 只在空白、全半角或句末标点上不同的提示词，应当命中同一个键
+EQUIVALENT_PAIRS = [
+    ("  你好！", "你好"),
+    ("Hello   world?", "Hello world"),
+    ("今天天气怎么样？？", "今天天气怎么样"),
+    ("ＡＢＣ 测试", "ABC 测试"),
+]
+
+
+@pytest.mark.parametrize("first, second", OPERATOR_PAIRS)
+def test_operators_are_preserved(first, second):
+    assert normalize_prompt(first) != normalize_prompt(second)
+
+
+@pytest.mark.parametrize("first, second", EQUIVALENT_PAIRS)
+def test_insignificant_differences_are_ignored(first, second):
+    assert normalize_prompt(first) == normalize_prompt(second)
+
+
+def test_case_is_preserved():
+    assert normalize_prompt("Use the ID field") != normalize_prompt("use the id field")
+
+
+@pytest.mark.parametrize("first, second", OPERATOR_PAIRS)
+def test_operator_difference_is_not_an_exact_hit(first, second):
+    cache = SemanticCache()
+    cache.enabled = True
+
+    async def no_embedding(text):
+        return None
+
+    cache._embed = no_embedding
+
+    async def scenario():
+        probe = await cache.lookup("/ai/quick", {"model": "m"}, first)
+        cache.store(probe, {"success": True, "content": "cached", "finish_reason": "stop"})
+        return await cache.lookup("/ai/quick", {"model": "m"}, second)
+
+    assert not asyncio.run(scenario()).hit
+
+
+def test_equivalent_prompt_is_an_exact_hit():
+    cache = SemanticCache()
+    cache.enabled = True
+
+    async def no_embedding(text):
+        return None
+
+    cache._embed = no_embedding
+
+    async def scenario():
+        probe = await cache.lookup("/ai/quick", {"model": "m"}, "今天天气怎么样？")
+        cache.store(probe, {"success": True, "content": "晴", "finish_reason": "stop"})
+        return await cache.lookup("/ai/quick", {"model": "m"}, "  今天天气怎么样 ")
+
+    probe = asyncio.run(scenario())
+    assert probe.hit and probe.similarity == 1.0